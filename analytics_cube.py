@@ -0,0 +1,278 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from locations import DISTRICT_NAMES, split_location
+
+# Next to the other derived data:
+#   facts.parquet  one row per listing: its Id and Date Posted, its cube coordinates and the measured values
+#   cells.parquet  the statistics of every cell of every grouping set
+CUBE_DIR = 'data/cube'
+FACTS_FILE = 'facts.parquet'
+CELLS_FILE = 'cells.parquet'
+
+DIMENSIONS = ("District", "Ward", "Bedrooms", "Month")
+ALL = '*'       # a dimension that is rolled up
+UNKNOWN = ''    # a listing without a ward, a bedroom count or a date
+# Source column -> prefix of its statistics
+MEASURES = {"Price": "price", "Price per m²": "price_m2", "Area": "area"}
+QUANTILES = (0.25, 0.75)
+# Every combination of kept and rolled-up dimensions, from the finest to the grand total
+GROUPING_SETS = [tuple(d for d, keep in zip(DIMENSIONS, mask) if keep)
+                 for mask in itertools.product((True, False), repeat=len(DIMENSIONS))]
+
+
+def listing_facts(df):
+    """
+    The cube coordinates and measured values of merged listings.
+
+    "District" is the canonical district name (see locations.py), "Ward"
+    the part of "Location" before the district, "Month" the posting month
+    as "YYYY-MM", and "Bedrooms" the count as a string.
+    Negotiable prices (-1) and non-positive values are left out of the
+    statistics, but the listings still count.
+
+    Args:
+        df (pd.DataFrame): Listings as written to the merged CSV.
+    Returns:
+        pd.DataFrame: Indexed by ("Id", "Date Posted"), the key the merge
+            dedupes on, so a reposted listing counts once per posting (the
+            last row wins for a repeated key).
+    """
+    # Parse each distinct location and date once: there are far fewer of them than listings
+    ward_names, district_ids = split_location(df["Location"])
+    districts = np.array(DISTRICT_NAMES + [UNKNOWN], dtype=object)[district_ids]  # -1 picks UNKNOWN
+    wards = pd.Series(ward_names, dtype=object).fillna(UNKNOWN).to_numpy()
+    date_codes, dates = pd.factorize(df["Date Posted"].astype(str))
+    posted = pd.to_datetime(pd.Series(dates), format="%d/%m/%Y", errors="coerce")
+    months = posted.dt.strftime("%Y-%m").where(posted.notna(), UNKNOWN).to_numpy()
+    bedrooms = pd.to_numeric(df["Bedrooms"], errors="coerce").astype("Int64")
+    facts = pd.DataFrame({
+        "District": districts,
+        "Ward": wards,
+        "Bedrooms": bedrooms.astype(str).where(bedrooms.notna(), UNKNOWN).to_numpy(),
+        "Month": months[date_codes],
+    }, index=df.index)
+    for column in MEASURES:
+        values = pd.to_numeric(df[column], errors="coerce").astype(float)
+        facts[column] = values.where(values > 0)
+    ids = pd.to_numeric(df["Id"], errors="coerce")
+    known = ids.notna().to_numpy()
+    facts = facts[known]
+    facts.index = pd.MultiIndex.from_arrays([ids[known].astype("int64").to_numpy(),
+                                             df["Date Posted"].astype(str).to_numpy()[known]],
+                                            names=["Id", "Date Posted"])
+    return facts[~facts.index.duplicated(keep="last")]
+
+
+def _aggregate_columns():
+    columns = ["count", "priced_count"]
+    for name in MEASURES.values():
+        columns += [f"{name}_mean", f"{name}_median"] + [f"{name}_p{round(q * 100)}" for q in QUANTILES]
+    return columns
+
+
+def _aggregate(facts, dims):
+    # Statistics of every cell of one grouping set, as {cube key: {statistic: value}}
+    if facts.empty:
+        return {}
+    keys = [facts[d] for d in dims] or [pd.Series(ALL, index=facts.index, name="_all")]
+    grouped = facts.groupby(keys, sort=False)
+    stats = pd.DataFrame({"count": grouped.size(), "priced_count": grouped["Price"].count()})
+    for column, name in MEASURES.items():
+        values = grouped[column]
+        stats[f"{name}_mean"] = values.mean()
+        stats[f"{name}_median"] = values.median()
+        quantiles = values.quantile(list(QUANTILES)).unstack()
+        for q in QUANTILES:
+            stats[f"{name}_p{round(q * 100)}"] = quantiles[q]
+    stats = stats.astype(object).where(stats.notna(), None)
+    records = stats.to_dict("index")
+    positions = [DIMENSIONS.index(d) for d in dims]
+    cells = {}
+    for group, record in records.items():
+        group = group if isinstance(group, tuple) else (group,)
+        key = [ALL] * len(DIMENSIONS)
+        for position, value in zip(positions, group if dims else ()):
+            key[position] = value
+        cells[tuple(key)] = record
+    return cells
+
+
+class AnalyticsCube:
+    """
+    Count, mean, median and quartiles of price, price per m² and area, by
+    district, ward, bedroom count and posting month, and by every roll-up of
+    those (for example district alone, or district and month).
+
+    Every cell is materialized in a dict keyed by its coordinates, so a query
+    is one lookup. When listings are added, changed or removed, only the
+    cells they fall in are computed again, from the listings of those cells.
+    """
+
+    def __init__(self, cube_dir=CUBE_DIR):
+        """
+        Load the cube saved in cube_dir, or start an empty one.
+
+        Args:
+            cube_dir (str): Directory of the cube files.
+        Returns:
+            None
+        """
+        self.cube_dir = cube_dir
+        self.facts = listing_facts(pd.DataFrame(columns=["Id", "Location", "Bedrooms", "Date Posted", *MEASURES]))
+        self.cells = {}
+        facts_path = os.path.join(cube_dir, FACTS_FILE)
+        cells_path = os.path.join(cube_dir, CELLS_FILE)
+        if os.path.exists(facts_path) and os.path.exists(cells_path):
+            facts = pd.read_parquet(facts_path)
+            # A cube saved when the facts were keyed by Id alone is rebuilt by the next sync
+            if facts.index.nlevels == 2:
+                self.facts = facts
+                cells = pd.read_parquet(cells_path)
+                stats = cells.drop(columns=list(DIMENSIONS))
+                stats = stats.astype(object).where(stats.notna(), None)
+                self.cells = dict(zip(cells[list(DIMENSIONS)].itertuples(index=False, name=None),
+                                      stats.to_dict("records")))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def _recompute(self, touched):
+        # Recompute the cells that the touched facts (old and new versions) fall in
+        if touched.empty:
+            return 0
+        # Integer codes of every dimension value, shared by the facts and the touched rows,
+        # so the rows of a set of cells are found with one integer isin
+        n = len(self.facts)
+        codes = {}
+        for d in DIMENSIONS:
+            values, uniques = pd.factorize(pd.concat([self.facts[d], touched[d]], ignore_index=True))
+            codes[d] = (values.astype(np.int64), max(len(uniques), 1))
+        changed = 0
+        for dims in GROUPING_SETS:
+            if dims:
+                key = np.zeros(n + len(touched), dtype=np.int64)
+                for d in dims:
+                    values, radix = codes[d]
+                    key = key * radix + values
+                touched_keys, first = np.unique(key[n:], return_index=True)
+                rows = self.facts[np.isin(key[:n], touched_keys)]
+                stale = [tuple(touched[d].iat[i] if d in dims else ALL for d in DIMENSIONS) for i in first]
+            else:
+                rows = self.facts
+                stale = [(ALL,) * len(DIMENSIONS)]
+            for key in stale:
+                self.cells.pop(key, None)
+            self.cells.update(_aggregate(rows, dims))
+            changed += len(stale)
+        return changed
+
+    def add(self, df):
+        """
+        Add new listings, or new versions of listings already in the cube.
+
+        Args:
+            df (pd.DataFrame): Listings as written to the merged CSV.
+        Returns:
+            int: The number of cells computed again.
+        """
+        new = listing_facts(df)
+        replaced = self.facts.loc[self.facts.index.intersection(new.index)]
+        self.facts = pd.concat([self.facts.drop(replaced.index), new])
+        return self._recompute(pd.concat([replaced, new]))
+
+    def sync(self, df):
+        """
+        Make the cube describe exactly these listings: add the new ones,
+        update the changed ones and drop the ones that are gone. Listings that
+        did not change do not cost anything beyond the comparison.
+
+        Args:
+            df (pd.DataFrame): All the listings, as written to the merged CSV.
+        Returns:
+            int: The number of cells computed again.
+        """
+        new = listing_facts(df)
+        old = self.facts
+        common = new.index.intersection(old.index)
+        a, b = new.loc[common, old.columns], old.loc[common]
+        same = ((a == b) | (a.isna() & b.isna())).all(axis=1)
+        changed = common[~same.to_numpy()]
+        touched = pd.concat([old.loc[old.index.difference(common).union(changed)],
+                             new.loc[new.index.difference(common).union(changed)]])
+        self.facts = new
+        return self._recompute(touched)
+
+    def get(self, district=ALL, ward=ALL, bedrooms=ALL, month=ALL):
+        """
+        The statistics of one cell. Leave a dimension out (or pass ALL) to roll it up.
+
+        Args:
+            district (str): District, e.g. "Cầu Giấy".
+            ward (str): Ward, the part of "Location" before the district.
+            bedrooms (int or str): Bedroom count.
+            month (str): Posting month, "YYYY-MM".
+        Returns:
+            dict: count, priced_count, and <measure>_mean/_median/_p25/_p75 for
+                price, price_m2 and area (None where nothing was measured),
+                or None if no listing falls in the cell.
+        """
+        if bedrooms not in (ALL, UNKNOWN):
+            bedrooms = str(int(bedrooms))
+        return self.cells.get((district, ward, bedrooms, month))
+
+    def table(self, *dims):
+        """
+        One grouping set as a DataFrame, e.g. table("District") for the per-district statistics.
+
+        Args:
+            *dims (str): The dimensions kept, from DIMENSIONS.
+        Returns:
+            pd.DataFrame: One row per cell, with the kept dimensions as columns.
+        """
+        unknown = set(dims) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown cube dimensions: {sorted(unknown)}")
+        positions = [DIMENSIONS.index(d) for d in dims]
+        rolled = [i for i in range(len(DIMENSIONS)) if i not in positions]
+        rows = [dict(zip(dims, (key[i] for i in positions)), **stats)
+                for key, stats in self.cells.items()
+                if all(key[i] == ALL for i in rolled) and all(key[i] != ALL for i in positions)]
+        table = pd.DataFrame(rows, columns=list(dims) + list(_aggregate_columns()))
+        return table.sort_values(list(dims)).reset_index(drop=True) if dims else table
+
+    def save(self):
+        """
+        Write the facts and the cells to cube_dir.
+
+        Returns:
+            None
+        """
+        os.makedirs(self.cube_dir, exist_ok=True)
+        cells = pd.DataFrame([dict(zip(DIMENSIONS, key), **stats) for key, stats in self.cells.items()],
+                             columns=list(DIMENSIONS) + list(_aggregate_columns()))
+        for name, frame in ((FACTS_FILE, self.facts), (CELLS_FILE, cells)):
+            path = os.path.join(self.cube_dir, name)
+            tmp_path = f"{path}.tmp"
+            frame.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+
+
+def refresh_cube(df, cube_dir=CUBE_DIR):
+    """
+    Bring the saved cube in line with the merged listings, recomputing only the cells that changed.
+
+    Args:
+        df (pd.DataFrame): The merged listings.
+        cube_dir (str): Directory of the cube files.
+    Returns:
+        AnalyticsCube: The updated cube.
+    """
+    cube = AnalyticsCube(cube_dir)
+    changed = cube.sync(df)
+    cube.save()
+    print(f"✔ Analytics cube: {changed} of {len(cube)} cells recomputed, saved to '{cube_dir}'.")
+    return cube
@@ -0,0 +1,84 @@
+"""
+Build the analytics cube for the merged listings tiled `scale` times (see
+synthetic.tiled_merged_listings), then time:
+
+- adding a batch of new listings from one district (as a scrape of a few
+  new pages would bring) incrementally, against rebuilding the cube;
+- a cube lookup, against the groupby the notebook would run for the same number.
+
+The incrementally updated cube is checked against the rebuilt one.
+
+    python benchmarks/bench_analytics_cube.py --scale 20
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from analytics_cube import AnalyticsCube, listing_facts  # noqa: E402
+from synthetic import tiled_merged_listings  # noqa: E402
+
+
+def timed(function, *args, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return (time.perf_counter() - started) / repeat, result
+
+
+def same_cells(a, b):
+    if a.keys() != b.keys():
+        return False
+    for key, stats in a.items():
+        for name, value in stats.items():
+            other = b[key][name]
+            if (value is None) != (other is None):
+                return False
+            if value is not None and not math.isclose(value, other, rel_tol=1e-9, abs_tol=1e-9):
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="copies of the merged listings")
+    parser.add_argument("--new", type=int, default=500, help="listings in the incremental batch")
+    parser.add_argument("--district", default="Cầu Giấy", help="district of the incremental batch")
+    args = parser.parse_args()
+
+    df = tiled_merged_listings(args.scale)
+    in_district = df["Location"].astype(str).str.endswith(args.district).to_numpy()
+    batch = df[in_district].tail(args.new)
+    existing = df.drop(index=batch.index)
+    print(f"{len(df):,} listings, {len(batch)} of them in {args.district} added incrementally")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        incremental = AnalyticsCube(os.path.join(tmp, "incremental"))
+        build, _ = timed(incremental.sync, existing)
+        add, recomputed = timed(incremental.add, batch)
+        rebuilt = AnalyticsCube(os.path.join(tmp, "rebuilt"))
+        rebuild, _ = timed(rebuilt.sync, df)
+        save, _ = timed(rebuilt.save)
+        load, _ = timed(AnalyticsCube, rebuilt.cube_dir)
+
+    print(f"{'build':36s} {build:9.3f}s  ({len(incremental):,} cells)")
+    print(f"{'add the batch incrementally':36s} {add:9.3f}s  ({recomputed:,} cells recomputed)")
+    print(f"{'rebuild with the batch':36s} {rebuild:9.3f}s")
+    print(f"{'save / load':36s} {save:9.3f}s / {load:.3f}s")
+    print(f"incremental cube equals the rebuilt one: {same_cells(incremental.cells, rebuilt.cells)}")
+
+    facts = listing_facts(df)
+    lookup, _ = timed(rebuilt.get, "Cầu Giấy", "*", 2, "2025-02", repeat=10000)
+    groupby, _ = timed(lambda: facts.groupby(["District", "Bedrooms", "Month"])["Price"].median()
+                       .loc[("Cầu Giấy", "2", "2025-02")], repeat=5)
+    print(f"{'median price, cube lookup':36s} {lookup * 1e6:9.2f}us")
+    print(f"{'median price, groupby':36s} {groupby * 1e6:9.2f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Compare loading the merged listings from the CSV, the way analysis.ipynb
+does it (read_csv, then split "Coordinates" and parse the dates), with the
+columnar copies: the Parquet dataset, with and without column projection,
+and the memory-mapped Arrow file. Each case runs in its own process and
+reports wall time and how far peak RSS rose above the RSS of the
+interpreter with pandas and pyarrow already imported.
+
+    python benchmarks/bench_columnar_load.py --scale 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd  # noqa: E402
+
+import columnar  # noqa: E402
+from fetch_parse import process_real_estate_data  # noqa: E402
+
+PROJECTED = ["Price", "Area", "Latitude", "Longitude"]
+
+
+def load_csv(data_dir):
+    df = pd.read_csv(os.path.join(data_dir, "merged.csv"))
+    df[["Latitude", "Longitude"]] = df["Coordinates"].str.split(",", expand=True).astype(float)
+    df["Date Posted"] = pd.to_datetime(df["Date Posted"], format="%d/%m/%Y")
+    return df
+
+
+def load_csv_projected(data_dir):
+    df = pd.read_csv(os.path.join(data_dir, "merged.csv"), usecols=["Price", "Area", "Coordinates"])
+    df[["Latitude", "Longitude"]] = df["Coordinates"].str.split(",", expand=True).astype(float)
+    return df
+
+
+def load_parquet(data_dir):
+    return columnar.read_listings(out_dir=os.path.join(data_dir, "parquet"))
+
+
+def load_parquet_projected(data_dir):
+    return columnar.read_listings(columns=PROJECTED, out_dir=os.path.join(data_dir, "parquet"))
+
+
+def load_arrow_mapped(data_dir):
+    df = columnar.map_listings_df(out_dir=os.path.join(data_dir, "parquet"))
+    df["Price"].mean()  # touch a column so its pages are actually read
+    return df
+
+
+def load_arrow_mapped_projected(data_dir):
+    df = columnar.map_listings_df(columns=PROJECTED, out_dir=os.path.join(data_dir, "parquet"))
+    df["Price"].mean()
+    return df
+
+
+CASES = {
+    "csv (notebook)": load_csv,
+    "csv, 3 columns": load_csv_projected,
+    "parquet": load_parquet,
+    "parquet, 4 columns": load_parquet_projected,
+    "arrow mmap": load_arrow_mapped,
+    "arrow mmap, 4 columns": load_arrow_mapped_projected,
+}
+
+
+def memory_kb(field):
+    # VmRSS / VmHWM from /proc: unlike ru_maxrss, the high-water mark is not
+    # inherited from the parent across fork and exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(name, data_dir):
+    baseline = memory_kb("VmRSS")
+    started = time.perf_counter()
+    df = CASES[name](data_dir)
+    elapsed = time.perf_counter() - started
+    peak = memory_kb("VmHWM")
+    print(json.dumps({"seconds": elapsed, "rss_mb": (peak - baseline) / 1024, "rows": len(df)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="copies of each district file")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(args.case, args.data_dir)
+        return 0
+
+    from synthetic import make_synthetic_district_files
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_synthetic_district_files(args.scale, os.path.join(tmp, "districts"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_real_estate_data(files, os.path.join(tmp, "merged.csv"), columnar=True, cube=False)
+        sizes = {
+            "csv": os.path.getsize(os.path.join(tmp, "merged.csv")),
+            "parquet": sum(os.path.getsize(os.path.join(d, f))
+                           for d, _, fs in os.walk(os.path.join(tmp, "parquet", columnar.LISTINGS_DATASET)) for f in fs),
+            "arrow": os.path.getsize(os.path.join(tmp, "parquet", columnar.LISTINGS_ARROW)),
+        }
+        print("On disk: " + ", ".join(f"{k} {v / 2**20:.1f} MB" for k, v in sizes.items()))
+        print(f"{'case':24s} {'rows':>9s} {'time':>9s} {'peak RSS':>10s}")
+        for name in CASES:
+            out = subprocess.run([sys.executable, __file__, "--case", name, "--data-dir", tmp],
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{name:24s} {result['rows']:9,d} {result['seconds']:8.3f}s {result['rss_mb']:8.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Time the distance and spatial queries of the analysis on the merged listings
+tiled `scale` times (coordinates jittered by up to ~500 m): the notebook's
+row-wise haversine against geo.haversine, and radius / nearest-neighbour
+queries as a full scan against geo.ListingIndex, checking both give the
+same answers.
+
+    python benchmarks/bench_geo.py --scale 30
+"""
+import argparse
+import os
+import sys
+import time
+from math import atan2, cos, radians, sin, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+
+import geo  # noqa: E402
+from synthetic import tiled_merged_listings  # noqa: E402
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    # The function analysis.ipynb used to apply row by row
+    R = 6371
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    return R * c
+
+
+def timed(function, *args, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=30, help="copies of the merged listings")
+    parser.add_argument("--queries", type=int, default=200, help="radius and nearest queries to time")
+    parser.add_argument("--radius", type=float, default=1.0, help="radius of the radius queries, in km")
+    args = parser.parse_args()
+
+    df = tiled_merged_listings(args.scale)
+    lat, lon = df["Latitude"].to_numpy(), df["Longitude"].to_numpy()
+    print(f"{len(df):,} listings with coordinates")
+    print(f"{'case':40s} {'time':>12s}")
+
+    row_wise, expected = timed(lambda: df.apply(
+        lambda row: scalar_haversine(row["Latitude"], row["Longitude"], geo.CENTER_LAT, geo.CENTER_LON), axis=1))
+    vectorized, distances = timed(geo.haversine, df["Latitude"], df["Longitude"], geo.CENTER_LAT, geo.CENTER_LON,
+                                  repeat=5)
+    assert np.allclose(expected, distances, rtol=0, atol=1e-9)
+    print(f"{'distance to centre, row-wise apply':40s} {row_wise * 1000:10.1f}ms")
+    print(f"{'distance to centre, geo.haversine':40s} {vectorized * 1000:10.1f}ms")
+
+    build, index = timed(geo.ListingIndex, df)
+    print(f"{'build ListingIndex':40s} {build * 1000:10.1f}ms")
+
+    picks = np.random.default_rng(1).choice(len(df), args.queries, replace=False)
+
+    def scan_radius():
+        return [np.flatnonzero(geo.haversine(lat[i], lon[i], lat, lon) <= args.radius) for i in picks]
+
+    def index_radius():
+        return [index.within(lat[i], lon[i], args.radius)[0] for i in picks]
+
+    def scan_nearest():
+        return [np.argsort(geo.haversine(lat[i], lon[i], lat, lon), kind="stable")[:10] for i in picks]
+
+    def index_nearest():
+        return index.nearest(lat[picks], lon[picks], k=10)[0]
+
+    scan_time, scanned = timed(scan_radius)
+    index_time, indexed = timed(index_radius)
+    assert all(set(a) == set(b) for a, b in zip(scanned, indexed))
+    per_query = 1000 / args.queries
+    print(f"{f'{args.radius:g} km radius, full scan':40s} {scan_time * per_query:10.3f}ms/query")
+    print(f"{f'{args.radius:g} km radius, ListingIndex':40s} {index_time * per_query:10.3f}ms/query")
+
+    scan_time, _ = timed(scan_nearest)
+    index_time, _ = timed(index_nearest)
+    print(f"{'10 nearest, full scan':40s} {scan_time * per_query:10.3f}ms/query")
+    print(f"{'10 nearest, ListingIndex (batched)':40s} {index_time * per_query:10.3f}ms/query")
+
+    comparables_time, _ = timed(lambda: [index.comparables(df.iloc[i], radius_km=args.radius) for i in picks])
+    print(f"{'comparables, ListingIndex':40s} {comparables_time * per_query:10.3f}ms/query")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Record `days` daily snapshots of the merged listings tiled `scale` times in
+history.ListingHistory, each day with a share of the prices changed, some
+listings taken down and as many new ones posted, and compare with keeping
+every snapshot whole (one row per listing per day, as keeping a copy of
+the merged CSV of every scrape would): rows and bytes stored, time to
+record a snapshot, and time to get the state as of a day and the price
+trajectory of a listing. The state as of every day is checked against the
+snapshot of that day.
+
+    python benchmarks/bench_history.py --scale 10 --days 30
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from history import SNAPSHOT_COLUMNS, ListingHistory  # noqa: E402
+from synthetic import tiled_merged_listings  # noqa: E402
+
+
+def snapshots(scale, days, changed, turnover, seed=0):
+    # Yields (day, listings on the site that day)
+    df = tiled_merged_listings(scale, seed=seed).drop(columns=["Latitude", "Longitude"])
+    rng = np.random.default_rng(seed)
+    next_id = 10**13
+    start = pd.Timestamp("2025-03-01")
+    for day in range(days):
+        if day:
+            repriced = rng.random(len(df)) < changed
+            df.loc[repriced & (df["Price"] > 0), "Price"] = (df["Price"] * rng.uniform(0.9, 1.05, len(df))).round(2)
+            taken_down = rng.random(len(df)) < turnover
+            posted = df[taken_down].copy()
+            posted["Id"] = next_id + np.arange(len(posted))
+            posted["Date Posted"] = (start + pd.Timedelta(days=day)).strftime("%d/%m/%Y")
+            next_id += len(posted)
+            df = pd.concat([df[~taken_down], posted], ignore_index=True)
+        yield (start + pd.Timedelta(days=day)).date(), df
+
+
+class FullSnapshots:
+    """
+    Every listing of every snapshot, keyed by (day, Id).
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        columns = "".join(f" {name}," for _, name in SNAPSHOT_COLUMNS)
+        self.conn.execute(f"CREATE TABLE snapshots (scraped_on TEXT, id INTEGER,{columns}"
+                          " PRIMARY KEY (scraped_on, id)) WITHOUT ROWID")
+
+    def record(self, df, scraped_on):
+        values = df[[column for column, _ in SNAPSHOT_COLUMNS]].astype(object)
+        values = values.where(values.notna(), None)
+        rows = [(scraped_on.isoformat(), listing_id, *row)
+                for listing_id, row in zip(df["Id"].tolist(), values.itertuples(index=False, name=None))]
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO snapshots VALUES ({', '.join('?' * (2 + len(SNAPSHOT_COLUMNS)))})",
+                                  rows)
+
+    def as_of(self, day):
+        columns = ", ".join(name for _, name in SNAPSHOT_COLUMNS)
+        rows = self.conn.execute(
+            f"SELECT id, {columns} FROM snapshots WHERE scraped_on = (SELECT MAX(scraped_on) FROM snapshots"
+            " WHERE scraped_on <= ?)", (day.isoformat(),)).fetchall()
+        return pd.DataFrame(rows, columns=["Id", *(column for column, _ in SNAPSHOT_COLUMNS)])
+
+    def trajectory(self, listing_id):
+        return self.conn.execute("SELECT scraped_on, price FROM snapshots WHERE id = ? ORDER BY scraped_on",
+                                 (listing_id,)).fetchall()
+
+
+def file_size(path):
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10, help="copies of the merged listings")
+    parser.add_argument("--days", type=int, default=30, help="daily snapshots")
+    parser.add_argument("--changed", type=float, default=0.02, help="share of the prices changed every day")
+    parser.add_argument("--turnover", type=float, default=0.01, help="share of the listings replaced every day")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = ListingHistory(os.path.join(tmp, "history.sqlite"))
+        full = FullSnapshots(os.path.join(tmp, "full.sqlite"))
+        record_times = {"history": 0.0, "full": 0.0}
+        days, ids, listings = [], None, 0
+        for day, df in snapshots(args.scale, args.days, args.changed, args.turnover):
+            started = time.perf_counter()
+            history.record(df, day)
+            record_times["history"] += time.perf_counter() - started
+            started = time.perf_counter()
+            full.record(df, day)
+            record_times["full"] += time.perf_counter() - started
+            days.append(day)
+            listings += len(df)
+            if ids is None:
+                ids = df["Id"].sample(200, random_state=0).tolist()
+        history.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        full.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        print(f"{args.days} snapshots of ~{listings // args.days} listings: {listings} listing-days")
+        print(f"{'':>16} {'rows':>10} {'MB':>8} {'record/day':>11} {'as of':>9} {'trajectory':>11}")
+        sampled_days = days[::max(1, len(days) // 5)]
+        stores = (
+            ("history (delta)", history, history.conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0],
+             history.path, record_times["history"]),
+            ("full snapshots", full, listings, os.path.join(tmp, "full.sqlite"), record_times["full"]),
+        )
+        for name, store, rows, path, record_time in stores:
+            started = time.perf_counter()
+            for day in sampled_days:
+                store.as_of(day)
+            as_of = (time.perf_counter() - started) / len(sampled_days)
+            started = time.perf_counter()
+            for listing_id in ids:
+                store.trajectory(listing_id)
+            trajectory = (time.perf_counter() - started) / len(ids)
+            print(f"{name:>16} {rows:>10} {file_size(path) / 2**20:>8.1f} {record_time / args.days:>10.2f}s "
+                  f"{as_of * 1000:>7.0f}ms {trajectory * 1000:>9.2f}ms")
+
+        # The state as of each day is that day's snapshot
+        for day, df in snapshots(args.scale, args.days, args.changed, args.turnover):
+            state = history.as_of(day)
+            assert state["Id"].tolist() == sorted(df["Id"].tolist()), day
+            expected = df.set_index("Id")["Price"].sort_index().to_numpy()
+            assert np.allclose(state["Price"].astype(float).to_numpy(), expected), day
+        print("✔ The state as of every day matches its snapshot.")
+        history.close()
+        full.conn.close()
+
+
+if __name__ == "__main__":
+    main()
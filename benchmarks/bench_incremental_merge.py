@@ -0,0 +1,69 @@
+"""
+Time an incremental merge after one district file got new rows, against a
+full merge of the same files, on synthetic data scaled up from data/, and
+check both write the same merged CSV.
+
+    python benchmarks/bench_incremental_merge.py --scale 20
+"""
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd  # noqa: E402
+
+from fetch_parse import process_real_estate_data  # noqa: E402
+from synthetic import make_synthetic_district_files  # noqa: E402
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def append_new_page(path, rows=20):
+    # A scrape of one more page: some rows with Ids not seen before
+    df = pd.read_csv(path, dtype=str, keep_default_na=False).tail(rows)
+    df["Id"] = [str(10**12 + i) for i in range(len(df))]
+    df.to_csv(path, mode="a", header=False, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="copies of each district file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_synthetic_district_files(args.scale, os.path.join(tmp, "districts"))
+        cache_dir = os.path.join(tmp, "merge_cache")
+        incremental_out = os.path.join(tmp, "incremental.csv")
+        full_out = os.path.join(tmp, "full.csv")
+
+        first = timed(process_real_estate_data, files, incremental_out, incremental=True, cache_dir=cache_dir,
+                    columnar=False, cube=False)
+        nothing_new = timed(process_real_estate_data, files, incremental_out, incremental=True, cache_dir=cache_dir,
+                    columnar=False, cube=False)
+        append_new_page(files[-1])
+        one_changed = timed(process_real_estate_data, files, incremental_out, incremental=True, cache_dir=cache_dir,
+                    columnar=False, cube=False)
+        full = timed(process_real_estate_data, files, full_out, columnar=False, cube=False)
+
+        identical = filecmp.cmp(incremental_out, full_out, shallow=False)
+        print(f"full merge:                          {full:8.2f} s")
+        print(f"incremental, first run:              {first:8.2f} s")
+        print(f"incremental, nothing changed:        {nothing_new:8.2f} s")
+        print(f"incremental, one district changed:   {one_changed:8.2f} s")
+        print(f"identical output: {identical}")
+        return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
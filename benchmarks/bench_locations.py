@@ -0,0 +1,69 @@
+"""
+Compare the string handling the notebook does on "Location" with the integer
+location dimension of locations.py, on the merged listings tiled `scale`
+times: deriving the district, grouping by it, joining the population table,
+and the memory the district column takes.
+
+    python benchmarks/bench_locations.py --scale 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd  # noqa: E402
+
+from locations import district_table, encode_locations  # noqa: E402
+from synthetic import REPO_ROOT, tiled_merged_listings  # noqa: E402
+
+
+def timed(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="copies of the merged listings")
+    args = parser.parse_args()
+
+    df = tiled_merged_listings(args.scale)
+    data_dir = os.path.join(REPO_ROOT, "data")
+    print(f"{len(df):,} listings")
+
+    split, names = timed(lambda: df["Location"].str.split(',').str[-1].str.strip())
+    encode, codes = timed(lambda: encode_locations(df["Location"]))
+    ids = codes["District Id"]
+
+    population = pd.read_csv(os.path.join(data_dir, "population_by_district.csv"))
+    population["District"] = population["District"].str.replace(' district', '').str.replace(' District', '').str.strip()
+    table = district_table(data_dir)
+
+    group_names, _ = timed(lambda: df["Price"].groupby(names).median())
+    group_ids, _ = timed(lambda: df["Price"].groupby(ids).median())
+    join_names, joined = timed(lambda: pd.DataFrame({"District": names}).merge(population, on="District", how="left"))
+    join_ids, joined_ids = timed(lambda: table["Population (people)"].reindex(ids.to_numpy()))
+    assert (joined["Population (people)"].fillna(-1).to_numpy() == joined_ids.fillna(-1).to_numpy()).all()
+
+    rows = [
+        ("district from Location", split, encode),
+        ("median price by district", group_names, group_ids),
+        ("join district population", join_names, join_ids),
+    ]
+    print(f"{'':28s} {'strings':>10s} {'int IDs':>10s}")
+    for name, strings, ints in rows:
+        print(f"{name:28s} {strings * 1000:8.1f}ms {ints * 1000:8.1f}ms")
+    print(f"{'district column memory':28s} {names.memory_usage(deep=True) / 2**20:8.1f}MB "
+          f"{ids.memory_usage(deep=True) / 2**20:8.1f}MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Export the aggregated map layers for the merged listings tiled `scale`
+times (see synthetic.tiled_merged_listings) and report the time and the
+size of every file. The number of listings grows with the scale; the size
+of the layers and of map.html only grows with the number of occupied cells.
+
+For comparison, the size of a page with one folium marker per listing, as
+the notebook draws them, is estimated from the average size of a circle
+with its popup in hanoi_additional_analyses.html.
+
+    python benchmarks/bench_map_export.py --scales 1,10,100
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from map_export import export_map  # noqa: E402
+from synthetic import REPO_ROOT, tiled_merged_listings  # noqa: E402
+
+
+def bytes_per_marker():
+    # Average size of a folium circle (with its popup) in the notebook's saved map
+    path = os.path.join(REPO_ROOT, "hanoi_additional_analyses.html")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    markers = len(re.findall(r"var circle(?:_marker)?_\w+ = L\.circle(?:Marker)?\(", html))
+    return os.path.getsize(path) / markers if markers else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated copies of the merged listings")
+    args = parser.parse_args()
+
+    per_marker = bytes_per_marker()
+    print(f"{'listings':>10s} {'export':>9s} {'map.html':>10s} {'all layers':>11s} {'per-listing markers':>20s}")
+    for scale in (int(s) for s in args.scales.split(",")):
+        df = tiled_merged_listings(scale)
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                written = export_map(df, out_dir=tmp)
+            elapsed = time.perf_counter() - started
+            sizes = {name: os.path.getsize(path) for name, path in written.items()}
+        markers = f"~{len(df) * per_marker / 2**20:.1f} MB" if per_marker else "n/a"
+        print(f"{len(df):10,d} {elapsed:8.2f}s {sizes['html'] / 1024:8.1f} KB "
+              f"{sum(sizes.values()) / 1024:9.1f} KB {markers:>20s}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
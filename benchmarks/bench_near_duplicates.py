@@ -0,0 +1,112 @@
+"""
+Time near_duplicates.find_near_duplicates on the merged listings tiled
+`scale` times, with reposts injected: a share of the listings is posted
+again under new Ids with reworded titles, the area and price nudged and
+the map pin moved by ~20 m, as brokers do.
+
+Every tiled copy gets its areas scaled so that the copies are different
+apartments, not near duplicates of each other (and its listings are moved
+one by one, which parts the near duplicates the merged listings already
+have). A listing is expected to be dropped if it is an injected repost, or
+one of the first copy that is dropped when the original merged listings
+are deduplicated on their own; precision and recall are counted against
+that. (Moved copies that still land within reach of each other are real
+near duplicates the count does not expect, so precision reads a little low
+beyond scale 1.) The number of candidate pairs the LSH blocking lets
+through is compared with the n(n-1)/2 pairs an all-pairs comparison would
+check.
+
+    python benchmarks/bench_near_duplicates.py --scales 1 5 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import near_duplicates  # noqa: E402
+from synthetic import tiled_merged_listings  # noqa: E402
+
+SUFFIXES = [" LH 0912 345 ***", " - chính chủ", " giá tốt", " full nội thất", " sổ đỏ lâu dài"]
+
+
+def reword(title, rng):
+    # What a second broker does to a title: drop a word, add a pitch, change the case
+    words = title.split()
+    if len(words) > 6:
+        del words[rng.integers(len(words))]
+    title = " ".join(words) + SUFFIXES[rng.integers(len(SUFFIXES))]
+    return title.upper() if rng.random() < 0.2 else title
+
+
+def with_reposts(scale, share, seed=0):
+    """
+    Returns:
+        tuple: (the listings, the position of each one's source in the
+            original merged listings, whether each is in the first copy,
+            whether each is an injected repost).
+    """
+    df = tiled_merged_listings(scale, seed=seed)
+    base_size = len(df) // scale
+    source = np.tile(np.arange(base_size), scale)
+    copy = np.repeat(np.arange(scale), base_size)
+    # Copies are other apartments: 1.25x, 1.5625x... the area (and the price with it)
+    df["Area"] = df["Area"] * 1.25 ** copy
+    df["Price"] = np.where(df["Price"] > 0, df["Price"] * 1.25 ** copy, df["Price"])
+
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(df), int(share * len(df)), replace=False)
+    reposts = df.iloc[picked].copy()
+    reposts["Id"] = 10**13 + np.arange(len(reposts))
+    reposts["Product Title"] = [reword(title, rng) for title in reposts["Product Title"]]
+    reposts["Area"] = (reposts["Area"] * rng.uniform(0.99, 1.01, len(reposts))).round(1)
+    reposts["Price"] = np.where(reposts["Price"] > 0,
+                                (reposts["Price"] * rng.uniform(0.97, 1.03, len(reposts))).round(2),
+                                reposts["Price"])
+    reposts["Latitude"] += rng.uniform(-0.0002, 0.0002, len(reposts))
+    reposts["Longitude"] += rng.uniform(-0.0002, 0.0002, len(reposts))
+    # The reposts come after every original, as they do in the merged order of a later run
+    listings = pd.concat([df, reposts], ignore_index=True)
+    repost = np.r_[np.zeros(len(df), dtype=bool), np.ones(len(reposts), dtype=bool)]
+    return listings, np.r_[source, source[picked]], np.r_[copy == 0, np.zeros(len(reposts), dtype=bool)], repost
+
+
+def run(scale, share, baseline_dropped):
+    df, source, first_copy, repost = with_reposts(scale, share)
+    started = time.perf_counter()
+    canonical = near_duplicates.find_near_duplicates(df)
+    elapsed = time.perf_counter() - started
+
+    title_codes, titles = pd.factorize(near_duplicates.normalize_titles(df["Product Title"]))
+    signatures = near_duplicates.minhash_signatures(list(titles))
+    pairs = near_duplicates.candidate_pairs(df, signatures, title_codes)
+
+    dropped = canonical != np.arange(len(df))
+    expected = repost | (first_copy & baseline_dropped[source])
+    hits = (dropped & expected).sum()
+    n = len(df)
+    print(f"{n:>9} rows {elapsed:7.2f}s {n / elapsed:>9.0f} rows/s   "
+          f"{len(pairs):>9} candidate pairs ({len(pairs) / (n * (n - 1) / 2):.2e} of all pairs)   "
+          f"dropped {dropped.sum():>7}   precision {hits / max(dropped.sum(), 1):.3f}   "
+          f"recall {hits / max(expected.sum(), 1):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 5, 20], help="copies of the merged listings")
+    parser.add_argument("--share", type=float, default=0.1, help="share of the listings posted again")
+    args = parser.parse_args()
+
+    base = tiled_merged_listings(1)
+    baseline_dropped = near_duplicates.find_near_duplicates(base) != np.arange(len(base))
+    print(f"{baseline_dropped.sum()} of {len(base)} merged listings are near duplicates on their own.")
+    for scale in args.scales:
+        run(scale, args.share, baseline_dropped)
+
+
+if __name__ == "__main__":
+    main()
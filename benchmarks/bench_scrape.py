@@ -0,0 +1,306 @@
+"""
+Time the scraper and the merge offline, and save the numbers as JSON that a
+later run can be compared against.
+
+Search and detail pages come from a fixture directory (see scrape_fixtures.py):
+recorded once from the live site with --record, or otherwise synthesized
+from the district CSVs. The benchmark
+
+  * parses every saved search page (ms per card) and detail page (ms per page),
+    checking the rows against the BeautifulSoup parser in legacy_scraping.py,
+  * scrapes them end to end with scrape_page, over HTTP from a local stub
+    server and through SeleniumFetcher with a fake driver (pages/s, listings/s),
+  * scrapes them over HTTP again from a stub server that is slow, injects
+    errors and block pages and answers 429 above a few requests at once,
+    through AdaptiveFetcher with its concurrency fixed, then adjusted by
+    AIMD (share of the rows recovered, pages/s, 429 answers),
+  * times each stage of process_real_estate_data on synthetic district files
+    scaled 1x, 10x and 100x from data/.
+
+    python benchmarks/bench_scrape.py --record --fixtures benchmarks/fixtures --pages 3
+    python benchmarks/bench_scrape.py --fixtures benchmarks/fixtures --output base.json
+    python benchmarks/bench_scrape.py --fixtures benchmarks/fixtures --compare base.json
+
+With --compare, the exit status is 1 if any metric got worse by more than
+--tolerance.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from checkpoint import atomic_to_csv  # noqa: E402
+from dedup_index import DedupIndex  # noqa: E402
+from fetch_parse import load_district_files, merge_prepared_frames, prepare_district_frame  # noqa: E402
+from fetcher import make_fetcher  # noqa: E402
+from pipeline import CoordinateStage  # noqa: E402
+from throttle import AdaptiveFetcher, AimdController, RetryPolicy  # noqa: E402
+from legacy_scraping import legacy_parse_coordinates, legacy_parse_search_page  # noqa: E402
+from scraping import (FINAL_PAGE_MARKERS, extract_listing_cards, find_srp_list, is_end_of_results,  # noqa: E402
+                      parse_coordinates, parse_html, parse_listing_card, parse_page_count, scrape_page)
+from scrape_fixtures import (FakeDriver, FixtureServer, FixtureStore, MANIFEST, expected_rows,  # noqa: E402
+                             record_fixtures, synthesize_fixtures)
+from synthetic import make_synthetic_district_files  # noqa: E402
+
+FORMAT_VERSION = 1
+
+
+def quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def metric(value, unit, better):
+    return {"value": round(value, 4), "unit": unit, "better": better}
+
+
+def parse_search_page(page_source, title=""):
+    # What scrape_page reads from a search page: (end of results, card rows, page count)
+    document = parse_html(page_source)
+    srp_list = find_srp_list(document)
+    if is_end_of_results(document, title) or srp_list is None:
+        return True, [], None
+    rows = [parse_listing_card(card) for card in extract_listing_cards(srp_list)]
+    return False, [row for row in rows if row is not None], parse_page_count(document)
+
+
+def timed_pages(parse, pages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        results = quiet(lambda: [parse(page_source) for page_source in pages])
+    return time.perf_counter() - started, results
+
+
+def bench_parse(store, repeat):
+    # Card and coordinate extraction on the saved pages, without any fetching, checked
+    # against the BeautifulSoup version the scraper used before
+    search = [store.get(path)[1].decode("utf-8") for _, _, path in store.search_pages()]
+    details = [body.decode("utf-8") for path, (status, body) in store.pages.items()
+               if status == 200 and "/pr" in path]
+    search_seconds, parsed = timed_pages(parse_search_page, search, repeat)
+    detail_seconds, coordinates = timed_pages(parse_coordinates, details, repeat)
+    legacy_search_seconds, legacy_parsed = timed_pages(legacy_parse_search_page, search, 1)
+    legacy_detail_seconds, legacy_coordinates = timed_pages(legacy_parse_coordinates, details, 1)
+    if parsed != legacy_parsed or coordinates != legacy_coordinates:
+        raise AssertionError("the page parsers disagree with the BeautifulSoup reference")
+    cards = sum(len(rows) for _, rows, _ in parsed)
+    print(f"Search pages: {legacy_search_seconds / (search_seconds / repeat):.1f}x faster than BeautifulSoup, "
+          f"detail pages: {legacy_detail_seconds / (detail_seconds / repeat):.1f}x")
+    return {
+        "parse.search_ms_per_page": metric(search_seconds * 1000 / max(len(search) * repeat, 1), "ms", "lower"),
+        "parse.ms_per_card": metric(search_seconds * 1000 / max(cards * repeat, 1), "ms", "lower"),
+        "parse.detail_ms_per_page": metric(detail_seconds * 1000 / max(len(details) * repeat, 1), "ms", "lower"),
+    }
+
+
+def replay(store, backend, base_url, work_dir, detail_workers, fetcher=None):
+    # scrape_page over every saved search page, as scrape_district runs it but without writing CSVs
+    if fetcher is None:
+        fetcher = make_fetcher(backend, lambda: FakeDriver(store), concurrency=detail_workers, rate_per_host=0,
+                               timeout=2, final_page_markers=FINAL_PAGE_MARKERS)
+    stage = CoordinateStage(fetcher, parse_coordinates, base_url, workers=detail_workers)
+    indexes = {}
+    rows = {}
+    started = time.perf_counter()
+    try:
+        for district, page, _ in store.search_pages():
+            if district not in indexes:
+                indexes[district] = DedupIndex(os.path.join(work_dir, f"{backend}_{id(fetcher)}_{district}.csv"))
+            result = quiet(scrape_page, fetcher, stage, indexes[district], district, page, base_url)
+            rows.setdefault(district, []).extend(result.rows)
+    finally:
+        elapsed = time.perf_counter() - started
+        fetcher.close()
+        for index in indexes.values():
+            index.close()
+    return elapsed, rows, stage.metrics
+
+
+def bench_replay(store, work_dir, detail_workers, backends):
+    results = {}
+    expected = expected_rows(store.fixture_dir)
+    pages = len(store.search_pages())
+    for backend in backends:
+        if backend == "http":
+            with FixtureServer(store) as server:
+                elapsed, rows, stage_metrics = replay(store, backend, server.base_url, work_dir, detail_workers)
+        else:
+            elapsed, rows, stage_metrics = replay(store, backend, "https://batdongsan.com.vn", work_dir,
+                                                  detail_workers)
+        if expected is not None and rows != expected:
+            raise AssertionError(f"{backend} replay did not give back the rows the fixtures were built from")
+        listings = sum(len(r) for r in rows.values())
+        results[f"replay.{backend}.pages_per_second"] = metric(pages / elapsed, "pages/s", "higher")
+        results[f"replay.{backend}.listings_per_second"] = metric(listings / elapsed, "listings/s", "higher")
+        results[f"replay.{backend}.detail_pages_per_second"] = metric(stage_metrics.resolved / elapsed,
+                                                                      "pages/s", "higher")
+    return results
+
+
+def recovered(rows, expected):
+    # Share of the expected rows scraped exactly, coordinates included
+    total = sum(len(r) for r in expected.values())
+    matching = sum(a == b for district, r in expected.items() for a, b in zip(rows.get(district, []), r))
+    return matching / total if total else 1.0
+
+
+def bench_faults(store, work_dir, detail_workers, fault_rate, capacity):
+    # The http replay against a server that fails fault_rate of the paths twice (503, 429, 403 block
+    # page or a stall past the timeout) and answers 429 above capacity requests in flight, with
+    # retries at a fixed concurrency and then with AIMD
+    results = {}
+    expected = expected_rows(store.fixture_dir)
+    pages = len(store.search_pages())
+    for name in ["fixed", "adaptive"]:
+        fetcher = make_fetcher("http", lambda: FakeDriver(store), concurrency=detail_workers, rate_per_host=0,
+                               timeout=0.5, final_page_markers=FINAL_PAGE_MARKERS, adaptive=False)
+        # Delays scaled down from the defaults to the stub server's milliseconds
+        minimum = detail_workers if name == "fixed" else 1
+        controller = AimdController(maximum=detail_workers, minimum=minimum, cooldown=0.2)
+        fetcher = AdaptiveFetcher(fetcher, controller, RetryPolicy(attempts=4, base=0.05, cap=1.0, seed=0),
+                                  final_page_markers=FINAL_PAGE_MARKERS)
+        with FixtureServer(store, latency=0.002, fault_rate=fault_rate, capacity=capacity, stall=0.7) as server:
+            elapsed, rows, _ = replay(store, "http", server.base_url, work_dir, detail_workers, fetcher)
+        share = recovered(rows, expected) if expected is not None else None
+        print(f"Faulty server, {name} concurrency: answers {server.served}, final limit {controller.limit:.1f}"
+              + (f", {share:.1%} of the rows recovered" if share is not None else ""))
+        if name == "adaptive" and share is not None and share < 1:
+            raise AssertionError("the adaptive fetcher did not recover every row from the faulty server")
+        results[f"faults.{name}.pages_per_second"] = metric(pages / elapsed, "pages/s", "higher")
+        if share is not None:
+            results[f"faults.{name}.rows_recovered"] = metric(share, "share", "higher")
+        results[f"faults.{name}.overload_responses"] = metric(server.served.get("429", 0), "responses", "lower")
+    return results
+
+
+def bench_merge(scales, work_dir, repeat):
+    # The stages of process_real_estate_data, timed one by one (best of repeat runs)
+    results = {}
+    for scale in scales:
+        files = make_synthetic_district_files(scale, os.path.join(work_dir, f"districts_{scale}x"))
+        timings = {}
+        for _ in range(repeat):
+            run = {}
+            started = time.perf_counter()
+            frames = quiet(load_district_files, files)
+            run["load"] = time.perf_counter() - started
+            started = time.perf_counter()
+            frames = [prepare_district_frame(df) for df in frames]
+            run["prepare"] = time.perf_counter() - started
+            started = time.perf_counter()
+            merged = merge_prepared_frames(frames)
+            run["merge"] = time.perf_counter() - started
+            started = time.perf_counter()
+            atomic_to_csv(merged, os.path.join(work_dir, f"merged_{scale}x.csv"), index=False)
+            run["write"] = time.perf_counter() - started
+            run["total"] = sum(run.values())
+            timings = {stage: min(seconds, timings.get(stage, seconds)) for stage, seconds in run.items()}
+        rows = sum(len(frame) for frame in frames)
+        for stage, seconds in timings.items():
+            results[f"merge.{scale}x.{stage}_seconds"] = metric(seconds, "s", "lower")
+        results[f"merge.{scale}x.rows_per_second"] = metric(rows / timings["total"], "rows/s", "higher")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each metric next to its baseline value.
+
+    Returns:
+        list: The names of the metrics that got worse by more than tolerance.
+    """
+    regressions = []
+    print(f"{'metric':48s} {'baseline':>12s} {'now':>12s} {'change':>8s}")
+    for name, now in results["metrics"].items():
+        before = baseline["metrics"].get(name)
+        if before is None or not before["value"]:
+            print(f"{name:48s} {'-':>12s} {now['value']:12.4g}")
+            continue
+        change = now["value"] / before["value"] - 1
+        worse = change > tolerance if now["better"] == "lower" else change < -tolerance
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:48s} {before['value']:12.4g} {now['value']:12.4g} {change:+8.1%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="fixture directory (default: synthesize into a temporary one)")
+    parser.add_argument("--record", action="store_true", help="record --fixtures from the live site first")
+    parser.add_argument("--districts", nargs="*", help="district slugs (default: all)")
+    parser.add_argument("--pages", type=int, default=5, help="search pages per district to record or synthesize")
+    parser.add_argument("--backends", nargs="*", default=["http", "selenium"], choices=["http", "selenium"])
+    parser.add_argument("--detail-workers", type=int, default=8, help="detail pages fetched at once")
+    parser.add_argument("--fault-rate", type=float, default=0.05,
+                        help="share of the paths the faulty stub server fails at first (0 skips that run)")
+    parser.add_argument("--capacity", type=int, default=4,
+                        help="requests in flight above which the faulty stub server answers 429")
+    parser.add_argument("--scales", type=int, nargs="*", default=[1, 10, 100], help="merge dataset scales")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the pages when timing the parsers, and merge runs per scale")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a results JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown per metric")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_dir = args.fixtures or os.path.join(tmp, "fixtures")
+        if args.record:
+            from locations import DISTRICT_SLUGS
+            record_fixtures(fixture_dir, args.districts or DISTRICT_SLUGS, args.pages)
+        elif not os.path.exists(os.path.join(fixture_dir, MANIFEST)):
+            print(f"Synthesizing fixtures into {fixture_dir}...")
+            synthesize_fixtures(fixture_dir, args.districts, args.pages)
+        store = FixtureStore(fixture_dir)
+        print(f"{len(store.search_pages())} search pages, {len(store.pages)} pages in all "
+              f"({store.manifest['source']})")
+
+        metrics = bench_parse(store, args.repeat)
+        metrics.update(bench_replay(store, tmp, args.detail_workers, args.backends))
+        if args.fault_rate:
+            metrics.update(bench_faults(store, tmp, args.detail_workers, args.fault_rate, args.capacity))
+        metrics.update(bench_merge(args.scales, tmp, args.repeat))
+
+    results = {
+        "format": FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "config": {"fixtures": store.manifest["source"], "search_pages": len(store.search_pages()),
+                   "backends": args.backends, "detail_workers": args.detail_workers,
+                   "fault_rate": args.fault_rate, "capacity": args.capacity, "scales": args.scales,
+                   "repeat": args.repeat},
+        "metrics": metrics,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+            f.write("\n")
+        print(f"✔ Results have been saved to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print(f"Warning: the baseline was run with {baseline.get('config')}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}.")
+            return 1
+    else:
+        for name, value in metrics.items():
+            print(f"{name:48s} {value['value']:12.4g} {value['unit']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Peak memory and time of the in-memory merge (process_real_estate_data)
+against the streaming merge (stream_real_estate_data) at a few memory
+limits, on synthetic data scaled up from data/. Each case runs in its own
+process. The streaming output is checked to hold the same rows, in the
+same "Location" order, as the in-memory one.
+
+    python benchmarks/bench_streaming_merge.py --scale 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd  # noqa: E402
+
+from fetch_parse import process_real_estate_data  # noqa: E402
+from streaming_merge import peak_rss_mb, stream_real_estate_data  # noqa: E402
+
+
+def run_case(limit, files, output_path):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if limit == "full":
+            process_real_estate_data(files, output_path, columnar=False, cube=False)
+        else:
+            stream_real_estate_data(files, output_path, memory_limit_mb=float(limit))
+    print(json.dumps({"seconds": time.perf_counter() - started, "peak_rss_mb": peak_rss_mb()}))
+
+
+def same_rows(expected_path, actual_path):
+    expected = pd.read_csv(expected_path, dtype=str, keep_default_na=False)
+    actual = pd.read_csv(actual_path, dtype=str, keep_default_na=False)
+    if expected["Location"].tolist() != actual["Location"].tolist():
+        return False
+    columns = list(expected.columns)
+    return expected.sort_values(columns, ignore_index=True).equals(actual.sort_values(columns, ignore_index=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=50, help="copies of each district file")
+    parser.add_argument("--limits", default="16,64,256", help="memory limits to try, in MB")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--files", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(args.case, args.files.split(os.pathsep), args.output)
+        return 0
+
+    from synthetic import make_synthetic_district_files
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_synthetic_district_files(args.scale, os.path.join(tmp, "districts"))
+        size = sum(os.path.getsize(f) for f in files) / 2**20
+        print(f"Synthetic dataset: {args.scale}x, {size:.0f} MB of district CSVs")
+        print(f"{'merge':22s} {'time':>9s} {'peak RSS':>10s}  same rows")
+        ok = True
+        for case in ["full"] + args.limits.split(","):
+            output = os.path.join(tmp, f"merged-{case}.csv")
+            out = subprocess.run([sys.executable, __file__, "--case", case, "--files", os.pathsep.join(files),
+                                  "--output", output], check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            name = "in memory" if case == "full" else f"streaming, {case} MB"
+            same = "" if case == "full" else same_rows(os.path.join(tmp, "merged-full.csv"), output)
+            ok = ok and same is not False
+            print(f"{name:22s} {result['seconds']:8.2f}s {result['peak_rss_mb']:8.0f} MB  {same}")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
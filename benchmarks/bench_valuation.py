@@ -0,0 +1,116 @@
+"""
+Time valuation.Valuer on the merged listings tiled `scale` times (coordinates
+jittered by up to ~500 m): building the feature matrix against loading it
+from the cache, the latency and throughput of batch estimates, and the
+row-by-row way the analysis works (geo.ListingIndex.comparables and a
+median per apartment) for comparison. The accuracy of leave-one-out
+estimates on the merged listings is compared with the district median
+price per m².
+
+    python benchmarks/bench_valuation.py --scale 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from geo import ListingIndex  # noqa: E402
+from locations import location_districts  # noqa: E402
+from synthetic import REPO_ROOT, tiled_merged_listings  # noqa: E402
+from valuation import Valuer  # noqa: E402
+
+DATA_DIR = os.path.join(REPO_ROOT, "data")
+
+
+def candidates(listings, n, seed=0):
+    # Apartments to price: listings moved by up to ~100 m, without their Ids and prices
+    rng = np.random.default_rng(seed)
+    df = listings.sample(n, replace=n > len(listings), random_state=seed).reset_index(drop=True)
+    df["Latitude"] += rng.uniform(-0.001, 0.001, n)
+    df["Longitude"] += rng.uniform(-0.001, 0.001, n)
+    return df[["Latitude", "Longitude", "Area", "Bedrooms", "Toilets", "Location", "Date Posted"]]
+
+
+def row_by_row(index, df, k):
+    # The analysis' way: the comparables of one apartment at a time, then their median
+    estimates = []
+    for _, row in df.iterrows():
+        comparables = index.comparables(row, radius_km=1.0, exclude_self=False)
+        prices = comparables["Price per m²"]
+        estimates.append(prices[prices > 0].head(k).median())
+    return np.array(estimates)
+
+
+def median_error(estimate, actual):
+    known = (actual > 0) & np.isfinite(estimate)
+    return float(np.median(np.abs(estimate[known] - actual[known]) / actual[known])), known.mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="copies of the merged listings")
+    parser.add_argument("--k", type=int, default=10, help="comparables per apartment")
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 100, 1000, 10000, 100000],
+                        help="batch sizes to time")
+    parser.add_argument("--row-by-row", type=int, default=200, help="apartments priced the row-by-row way")
+    args = parser.parse_args()
+
+    listings = tiled_merged_listings(args.scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        merged_path = os.path.join(tmp, "merged_real_estate_listings.csv")
+        listings.to_csv(merged_path, index=False)
+
+        started = time.perf_counter()
+        valuer = Valuer(merged_path, data_dir=DATA_DIR)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        valuer = Valuer(merged_path, data_dir=DATA_DIR)
+        warm = time.perf_counter() - started
+        print(f"{len(valuer)} comparables of {len(listings)} listings: feature matrix built in {cold:.2f}s, "
+              f"loaded from the cache in {warm:.2f}s")
+
+        print(f"{'batch':>8} {'latency':>10} {'apartments/s':>13}")
+        for size in args.batches:
+            batch = candidates(listings, size)
+            repeat = max(1, 1000 // size)
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                valuer.estimate(batch, k=args.k)
+                latencies.append(time.perf_counter() - started)
+            latency = float(np.median(latencies))
+            print(f"{size:>8} {latency * 1000:>8.2f}ms {size / latency:>13.0f}")
+
+        batch = candidates(listings, args.row_by_row)
+        index = ListingIndex(listings)
+        started = time.perf_counter()
+        slow = row_by_row(index, batch, args.k)
+        elapsed = time.perf_counter() - started
+        print(f"row by row: {args.row_by_row} apartments in {elapsed:.2f}s "
+              f"({args.row_by_row / elapsed:.0f} apartments/s)")
+        fast = valuer.estimate(batch, k=args.k)["Estimated price per m²"].to_numpy()
+        both = np.isfinite(slow) & np.isfinite(fast)
+        print(f"  median gap to the batch estimates: {np.median(np.abs(fast[both] - slow[both]) / slow[both]):.1%}")
+
+    # Accuracy on the listings themselves, each priced without itself
+    merged = pd.read_csv(os.path.join(DATA_DIR, "merged_real_estate_listings.csv"))
+    actual = merged["Price per m²"].to_numpy(dtype=float)
+    with tempfile.TemporaryDirectory() as tmp:
+        estimate = Valuer(os.path.join(DATA_DIR, "merged_real_estate_listings.csv"), data_dir=DATA_DIR,
+                          cache_dir=tmp).estimate(merged, k=args.k)["Estimated price per m²"].to_numpy()
+    districts = location_districts(merged["Location"])
+    priced = pd.Series(np.where(actual > 0, actual, np.nan))
+    district_median = priced.groupby(districts, observed=True).transform("median").to_numpy()
+    for name, values in (("k nearest comparables", estimate), ("district median", district_median)):
+        error, coverage = median_error(values, actual)
+        print(f"{name:>22}: median error {error:.1%} on {coverage:.0%} of the listings")
+
+
+if __name__ == "__main__":
+    main()
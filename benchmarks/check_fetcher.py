@@ -0,0 +1,229 @@
+"""
+Check the fetchers offline, against the pages saved in benchmarks/saved_pages
+(two search pages of Ba Đình and the detail pages of their listings, built
+by scrape_fixtures.synthesize_fixtures):
+
+  * HttpFetcher from a local FixtureServer: search and detail pages, the 404
+    past the last page, and the browser fallback for a page without the
+    element waited for,
+  * SeleniumFetcher with FakeDriver in place of Chrome, and a driver that
+    only renders a page on its second load: the wait timeout of a search
+    page is retried, that of a page without the element is not,
+  * AdaptiveFetcher against a FixtureServer that fails every page at first
+    (503, 429 and block pages),
+  * scrape_page end to end with both backends, which must give back the
+    rows the pages were built from.
+
+The exit status is 1 if any check fails.
+
+    python benchmarks/check_fetcher.py
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dedup_index import DedupIndex  # noqa: E402
+from fetcher import HttpFetcher, SeleniumFetcher, make_fetcher  # noqa: E402
+from pipeline import CoordinateStage  # noqa: E402
+from scraping import FINAL_PAGE_MARKERS, page_url, parse_coordinates, scrape_page  # noqa: E402
+from scrape_fixtures import FakeDriver, FixtureServer, FixtureStore, expected_rows  # noqa: E402
+from throttle import AdaptiveFetcher, AimdController, RetryPolicy, classify  # noqa: E402
+
+SAVED_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "saved_pages")
+DISTRICT = "ba-dinh"
+# A page rendered by JS: its HTML has none of the elements the scraper waits for
+SHELL_PATH = "/trang-can-js"
+SHELL_PAGE = ("<html><head><title>Batdongsan.com.vn</title></head><body><div id=\"app\"></div>"
+              "<script src=\"/static/app.js\"></script></body></html>")
+
+
+def quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def load_store(fixture_dir):
+    store = FixtureStore(fixture_dir)
+    store.pages[SHELL_PATH] = (200, SHELL_PAGE.encode("utf-8"))
+    return store
+
+
+def outcome(result):
+    return classify(result.status, result.text, result.ok, FINAL_PAGE_MARKERS, timed_out=result.timed_out)
+
+
+class SlowDriver(FakeDriver):
+    """
+    A FakeDriver that shows the JS shell the first time a URL is loaded, as
+    when the site is slow to render, and the saved page after that.
+    """
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.seen = set()
+
+    def get(self, url):
+        super().get(url)
+        if url not in self.seen:
+            self.seen.add(url)
+            self.page_source = SHELL_PAGE
+
+
+def check_http(store, expected):
+    with FixtureServer(store) as server:
+        fetcher = HttpFetcher(rate_per_host=0, final_page_markers=FINAL_PAGE_MARKERS,
+                              fallback=SeleniumFetcher(lambda: FakeDriver(store), timeout=0.1))
+        try:
+            first = fetcher.fetch(page_url(DISTRICT, 1, server.base_url), "re__srp-list")
+            check(first.ok and first.status == 200 and first.backend == "http", "search page 1 over HTTP")
+            check(DISTRICT in first.title, f"title of search page 1: {first.title!r}")
+
+            past_last = fetcher.fetch(page_url(DISTRICT, store.manifest["districts"][DISTRICT] + 1, server.base_url),
+                                      "re__srp-list")
+            check(outcome(past_last) == "not_found" and past_last.backend == "http",
+                  f"the page past the last one is {outcome(past_last)} from {past_last.backend}")
+
+            row = expected[DISTRICT][0]
+            detail = fetcher.fetch(f"{server.base_url}/ban-can-ho-chung-cu-{DISTRICT}/pr{row[0]}", "lazyload")
+            check(detail.ok and quiet(parse_coordinates, detail.text) == row[-1], "coordinates of a detail page")
+
+            shell = quiet(fetcher.fetch, f"{server.base_url}{SHELL_PATH}", "re__srp-list")
+            check(not shell.ok and shell.backend == "selenium", "a page without the element goes to the browser")
+        finally:
+            fetcher.close()
+    print("✔ HttpFetcher: search, detail and 404 pages, and the browser fallback.")
+
+
+def check_selenium(store, expected):
+    driver = FakeDriver(store)
+    fetcher = SeleniumFetcher(lambda: driver, timeout=0.1)
+    try:
+        first = fetcher.fetch(page_url(DISTRICT, 1), "re__srp-list")
+        check(first.ok and first.status is None and first.backend == "selenium", "search page 1 in the browser")
+        past_last = quiet(fetcher.fetch, page_url(DISTRICT, store.manifest["districts"][DISTRICT] + 1),
+                          "re__srp-list")
+        check(outcome(past_last) == "final", f"the page past the last one is {outcome(past_last)}")
+        row = expected[DISTRICT][0]
+        detail = fetcher.fetch(f"https://batdongsan.com.vn/ban-can-ho-chung-cu-{DISTRICT}/pr{row[0]}", "lazyload")
+        check(detail.ok and quiet(parse_coordinates, detail.text) == row[-1], "coordinates of a detail page")
+        check(driver.pages_loaded == 3, f"{driver.pages_loaded} pages loaded for 3 fetches")
+    finally:
+        fetcher.close()
+    print("✔ SeleniumFetcher: search, detail and final pages.")
+
+
+def check_timeouts(store):
+    driver = SlowDriver(store)
+    fetcher = SeleniumFetcher(lambda: driver, timeout=0.1)
+    first = quiet(fetcher.fetch, page_url(DISTRICT, 1), "re__srp-list")
+    check(first.timed_out and outcome(first) == "timeout", f"a wait timeout is {outcome(first)}")
+
+    driver = SlowDriver(store)
+    controller = AimdController(maximum=4)
+    fetcher = AdaptiveFetcher(SeleniumFetcher(lambda: driver, timeout=0.1), controller,
+                              RetryPolicy(attempts=3, base=0.01, cap=0.05, seed=0),
+                              final_page_markers=FINAL_PAGE_MARKERS, retry_wait_timeouts=("re__srp-list",))
+    try:
+        first = quiet(fetcher.fetch, page_url(DISTRICT, 1), "re__srp-list")
+        check(first.ok and driver.pages_loaded == 2, f"a timed-out search page: {driver.pages_loaded} loads")
+        # The 404 page is final: its wait times out on every load, so it is not tried again
+        driver.seen.add(page_url(DISTRICT, 99))
+        past_last = quiet(fetcher.fetch, page_url(DISTRICT, 99), "re__srp-list")
+        check(outcome(past_last) == "final" and driver.pages_loaded == 3, "the page past the last one is retried")
+        # A detail page without the map is complete: one load, and no congestion
+        limit = controller.limit
+        driver.seen.add(SHELL_PATH)
+        no_map = quiet(fetcher.fetch, SHELL_PATH, "lazyload")
+        check(not no_map.ok and driver.pages_loaded == 4,
+              f"a page without the element: {driver.pages_loaded - 3} loads")
+        check(controller.limit >= limit, f"the limit went from {limit} to {controller.limit}")
+    finally:
+        fetcher.close()
+
+    # The same page over HTTP goes to the browser once
+    driver = FakeDriver(store)
+    with FixtureServer(store) as server:
+        fetcher = make_fetcher("http", lambda: driver, rate_per_host=0, timeout=0.1,
+                               final_page_markers=FINAL_PAGE_MARKERS)
+        try:
+            no_map = quiet(fetcher.fetch, f"{server.base_url}{SHELL_PATH}", "lazyload")
+        finally:
+            fetcher.close()
+    check(not no_map.ok and driver.pages_loaded == 1 and server.httpd.attempts[SHELL_PATH] == 1,
+          f"a page without the element over HTTP: {server.httpd.attempts[SHELL_PATH]} requests, "
+          f"{driver.pages_loaded} browser loads")
+    print("✔ SeleniumFetcher: the wait timeout of a search page is retried, a final page and a page "
+          "without the element are fetched once.")
+
+
+def check_retries(store):
+    base = HttpFetcher(rate_per_host=0, timeout=2, final_page_markers=FINAL_PAGE_MARKERS)
+    fetcher = AdaptiveFetcher(base, AimdController(maximum=4, cooldown=0.01),
+                              RetryPolicy(attempts=3, base=0.01, cap=0.05, seed=0),
+                              final_page_markers=FINAL_PAGE_MARKERS)
+    with FixtureServer(store, fault_rate=1.0, fault_kinds=("503", "429", "block"), fault_attempts=1) as server:
+        try:
+            urls = [page_url(DISTRICT, page, server.base_url) for page in (1, 2)]
+            results = quiet(fetcher.fetch_many, urls, "re__srp-list")
+        finally:
+            fetcher.close()
+    check(all(result.ok for result in results), "search pages after a failed first attempt")
+    check(server.served.get("ok") == 2 and sum(server.served.values()) == 4, f"answers: {server.served}")
+    print(f"✔ AdaptiveFetcher: every page recovered after one failure ({server.served}).")
+
+
+def check_scrape(store, expected, work_dir):
+    pages = store.manifest["districts"][DISTRICT]
+    for backend in ("http", "selenium"):
+        with FixtureServer(store) as server:
+            base_url = server.base_url if backend == "http" else "https://batdongsan.com.vn"
+            fetcher = make_fetcher(backend, lambda: FakeDriver(store), rate_per_host=0, timeout=0.1,
+                                   final_page_markers=FINAL_PAGE_MARKERS)
+            stage = CoordinateStage(fetcher, parse_coordinates, base_url)
+            index = DedupIndex(os.path.join(work_dir, f"{backend}_{DISTRICT}.csv"))
+            try:
+                results = [quiet(scrape_page, fetcher, stage, index, DISTRICT, page, base_url)
+                           for page in range(1, pages + 2)]
+            finally:
+                fetcher.close()
+                index.close()
+        check([result.status for result in results] == ["ok"] * pages + ["end"],
+              f"{backend}: page outcomes {[result.status for result in results]}")
+        check(results[0].page_count == pages, f"{backend}: page count {results[0].page_count}")
+        rows = [row for result in results for row in result.rows]
+        check(rows == expected[DISTRICT], f"{backend}: the rows differ from the ones the pages were built from")
+    print(f"✔ scrape_page: {len(rows)} rows of {pages} pages with both backends.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=SAVED_PAGES, help="fixture directory (default: the saved pages)")
+    args = parser.parse_args()
+
+    store = load_store(args.fixtures)
+    expected = expected_rows(args.fixtures)
+    try:
+        check_http(store, expected)
+        check_selenium(store, expected)
+        check_timeouts(store)
+        check_retries(store)
+        with tempfile.TemporaryDirectory() as tmp:
+            check_scrape(store, expected, tmp)
+    except AssertionError as e:
+        print(f"✘ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
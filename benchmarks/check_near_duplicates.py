@@ -0,0 +1,99 @@
+"""
+Check near_duplicates against listings it must keep apart and reposts it
+must still join:
+
+  * pairs of the merged listings that are different flats of one building
+    (another tower or floor, the same broker's text with another view, no
+    price to tell them apart) stay out of each other's cluster,
+  * no cluster of the merged listings keeps a listing without a price when
+    one of its listings has a price,
+  * a listing posted again with a reworded title, with or without a price,
+    is still clustered with the first post, and the priced post is the one
+    kept even when it comes later in the merged order.
+
+The exit status is 1 if any check fails.
+
+    python benchmarks/check_near_duplicates.py
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from fetch_parse import MERGED_FILE  # noqa: E402
+from near_duplicates import CLUSTER_ID, drop_near_duplicates  # noqa: E402
+
+# Different flats that were once clustered as one
+DIFFERENT_FLATS = [
+    (26334525, 26334454),  # N05 toà 29T1, 152 m² and toà 25T1, 157 m², both without a price
+    (29444863, 27697432),  # Metropolis M3 căn 10, tầng 29 and tầng 20, both without a price
+    (31273865, 28513375),  # same broker and pin, view sông Hồng and view times city, both without a price
+    (42190985, 42170772),  # Park Hill and Times City, 4PN, 140 m² and 137 m²
+    (42169512, 42185754),  # the same broker's 152 m² for 8,3 tỷ in tower 17T2 and in tower 17T3
+]
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_different_flats(merged):
+    _, clusters = drop_near_duplicates(merged)
+    cluster_of = dict(zip(clusters["Id"], clusters[CLUSTER_ID]))
+    for a, b in DIFFERENT_FLATS:
+        check(a not in cluster_of or cluster_of.get(a) != cluster_of.get(b), f"{a} and {b} are clustered")
+
+    price = merged.set_index("Id")["Price"]
+    priced = clusters.assign(priced=clusters["Id"].map(price).to_numpy() > 0)
+    by_cluster = priced.groupby(CLUSTER_ID)
+    kept_unpriced = by_cluster["priced"].any() & ~priced[priced["Kept"]].set_index(CLUSTER_ID)["priced"]
+    check(not kept_unpriced.any(), f"clusters keeping an unpriced listing: {list(kept_unpriced[kept_unpriced].index)}")
+    print(f"✔ {len(DIFFERENT_FLATS)} pairs of different flats apart, {by_cluster.ngroups} clusters keep a priced "
+          f"listing when they have one.")
+
+
+def check_reposts():
+    first = {
+        "Id": 1, "Date Posted": "01/03/2024",
+        "Product Title": "Bán căn hộ 3PN tòa A2 Vinhomes Gardenia, 110m2, full nội thất, sổ đỏ chính chủ",
+        "Price": -1.0, "Area": 110.0, "Bedrooms": 3, "Location": "Cầu Diễn, Nam Từ Liêm",
+        "Coordinates": "21.0365, 105.7628",
+    }
+    reposts = pd.DataFrame([
+        first,
+        # The same words and flat from another broker, without a price either
+        {**first, "Id": 2, "Product Title": first["Product Title"].upper() + " - LH 0912 345 ***"},
+        # The price given at last
+        {**first, "Id": 3, "Price": 6.2, "Product Title": first["Product Title"] + " giá 6.2 tỷ"},
+        # Another flat of the same tower
+        {**first, "Id": 4, "Area": 86.0, "Bedrooms": 2,
+         "Product Title": "Bán căn hộ 2PN tòa A1 Vinhomes Gardenia, 86m2, sổ đỏ chính chủ"},
+    ])
+    kept, clusters = drop_near_duplicates(reposts)
+    check(sorted(clusters["Id"]) == [1, 2, 3], f"clustered: {sorted(clusters['Id'])}")
+    check(list(kept["Id"]) == [3, 4], f"kept: {list(kept['Id'])}")
+    check(np.all(clusters[CLUSTER_ID] == 3), f"kept in the cluster: {set(clusters[CLUSTER_ID])}")
+    print("✔ reposts with and without a price clustered, the priced one kept.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--merged", default=MERGED_FILE, help="merged listings CSV (default: fetch_parse.MERGED_FILE)")
+    args = parser.parse_args()
+
+    try:
+        check_different_flats(pd.read_csv(args.merged))
+        check_reposts()
+    except AssertionError as e:
+        print(f"✘ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
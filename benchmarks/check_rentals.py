@@ -0,0 +1,122 @@
+"""
+Check that a rental partition merges to listings, not an empty CSV.
+
+Rental district files are built from a scraped Hanoi district file the way
+the "apartment-rent" category writes them: "Price per m²" is "N/A" and the
+price is a monthly rent ("15 triệu/tháng", "Thỏa thuận", ...). They are
+merged, as main.py does, with process_real_estate_data and with
+stream_real_estate_data into the partition's merged CSV:
+
+  * every rent that parses is kept, in triệu a month, "Thỏa thuận" as -1,
+  * a rent per m² ("200 nghìn/m²/tháng") does not parse and is dropped,
+  * both merges keep the same listings,
+  * the rules for listings for sale would have dropped every one of them.
+
+The exit status is 1 if any check fails.
+
+    python benchmarks/check_rentals.py
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd  # noqa: E402
+
+from fetch_parse import process_real_estate_data  # noqa: E402
+from streaming_merge import stream_real_estate_data  # noqa: E402
+from targets import build_targets, load_config, partitions  # noqa: E402
+
+CATEGORY = "apartment-rent"
+CITY = "ha-noi"
+# Raw rents, and what the merge makes of them (None: dropped)
+RENTS = {
+    "15 triệu/tháng": 15.0,
+    "8,5 triệu/tháng": 8.5,
+    "Thỏa thuận": -1.0,
+    "1,2 tỷ/tháng": 1200.0,
+    "200 nghìn/m²/tháng": None,
+}
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def write_rentals(source, targets, rows_per_district):
+    # The source listings, spread over the districts, with rents in place of the sale prices
+    listings = pd.read_csv(source, dtype=str, keep_default_na=False)
+    rents = list(RENTS)
+    expected = {}
+    for k, target in enumerate(targets):
+        rows = listings.iloc[k * rows_per_district:(k + 1) * rows_per_district].copy()
+        rows["Price"] = [rents[n % len(rents)] for n in range(len(rows))]
+        rows["Price per m²"] = "N/A"
+        os.makedirs(os.path.dirname(target.csv_path), exist_ok=True)
+        rows.to_csv(target.csv_path, index=False)
+        expected.update((int(i), RENTS[price]) for i, price in zip(rows["Id"], rows["Price"]))
+    return expected
+
+
+def merged_rents(path):
+    merged = pd.read_csv(path)
+    return dict(zip(merged["Id"], merged["Price"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="data/filtered_real_estate_listings_ba-dinh.csv",
+                        help="scraped district CSV the rental listings are built from")
+    parser.add_argument("--districts", type=int, default=3, help="rental district files written")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides = os.path.join(tmp, "targets.json")
+        with open(overrides, "w", encoding="utf-8") as f:
+            json.dump({
+                "output": os.path.join(tmp, "{category}", "{city}", "filtered_real_estate_listings_{district}.csv"),
+                "merged": os.path.join(tmp, "{category}", "{city}", "merged_real_estate_listings.csv"),
+            }, f)
+        config = load_config(overrides)
+        targets = build_targets(config, [CATEGORY], [CITY])[:args.districts]
+        files, merged_path = partitions(targets, config)[(CATEGORY, CITY)]
+        expected = write_rentals(args.source, targets, rows_per_district=40)
+        rent = config["categories"][CATEGORY].get("rent", False)
+        kept = {i: price for i, price in expected.items() if price is not None}
+
+        try:
+            check(rent, f"{CATEGORY} is not marked as a rental category")
+            with contextlib.redirect_stdout(io.StringIO()):
+                process_real_estate_data(district_files=files, output_path=merged_path, rent=rent,
+                                         cache_dir=os.path.join(tmp, "merge_cache"))
+            merged = merged_rents(merged_path)
+            check(len(merged) > 0, f"{merged_path} is empty")
+            check(set(merged) <= set(kept), f"rents per m² kept: {sorted(set(merged) - set(kept))}")
+            wrong = {i: (price, kept[i]) for i, price in merged.items() if price != kept[i]}
+            check(not wrong, f"rents (merged, expected): {wrong}")
+            print(f"✔ process_real_estate_data: {len(merged)} of {len(expected)} rental listings merged "
+                  f"from {len(files)} districts.")
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                stream_real_estate_data(district_files=files, output_path=merged_path, rent=rent)
+            check(merged_rents(merged_path) == merged, "the streaming merge keeps other listings")
+            print("✔ stream_real_estate_data: the same listings.")
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                process_real_estate_data(district_files=files, output_path=merged_path)
+            check(not merged_rents(merged_path), "the rules for sale kept rental listings")
+            print("✔ the rules for listings for sale drop every rental listing.")
+        except AssertionError as e:
+            print(f"✘ {e}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+The BeautifulSoup extraction of search and detail pages from scraping.py, as
+it was before the lxml rewrite, kept only as the reference the scrape
+benchmark checks the rows against.
+"""
+import re
+
+from bs4 import BeautifulSoup
+
+NO_RESULTS_TEXT = "Không có kết quả nào phù hợp"
+
+
+def legacy_is_end_of_results(soup, title=""):
+    """
+    Check if a search page is the "no results" / error page shown past the last page.
+
+    Args:
+        soup (BeautifulSoup): The parsed search page.
+        title (str): The document title.
+    Returns:
+        bool: True if the page has no more listings.
+    """
+    return bool(soup.find("div", class_="error-content") or "404" in title or NO_RESULTS_TEXT in soup.text)
+
+
+def legacy_extract_listing_cards(srp_list):
+    """
+    Find the listing cards in the search results container, skipping ads,
+    promoted links and the verified similar listings section.
+
+    Args:
+        srp_list (Tag): The re__srp-list container.
+    Returns:
+        list: The listing card tags.
+    """
+    # Find all cards within the main container
+    all_cards = srp_list.find_all("div", class_="js__card", recursive=True)
+    # Filter out unwanted cards
+    listings = []
+    for card in all_cards:
+        card_classes = " ".join(card.get("class", []))
+        # Skip if it’s an ad or has prid="0"
+        if ("promoted-ads-appearance-position" in card_classes or
+            card.get("prid", "0") == "0"):
+            continue
+        # Skip if it’s inside the verified similar listings section
+        if card.find_parent("div", class_="re__listing-verified-similar-v2"):
+            continue
+        # Skip promotional links
+        product_link = card.find("a", class_="js__product-link-for-product-id")
+        if product_link and "js__product-link-promotion-ads" in " ".join(product_link.get("class", [])):
+            continue
+        listings.append(card)
+    return listings
+
+
+def legacy_parse_listing_card(listing):
+    """
+    Extract the fields of one listing card.
+
+    Args:
+        listing (Tag): The listing card.
+    Returns:
+        dict: The row fields (Coordinates is "N/A") plus the detail page "href",
+            or None if the card has no info section.
+    """
+    # Extract product_id from the <a> tag
+    product_link = listing.find("a", class_="js__product-link-for-product-id")
+    product_id = product_link["data-product-id"] if product_link else "N/A"
+
+    # Extract other details from re__card-info
+    info_div = listing.find("div", class_="re__card-info")
+    if not info_div:
+        return None  # Skip if no info div found
+
+    # Extract Date Listed
+    date_element = listing.find("span", class_="re__card-published-info-published-at")
+    date_element = date_element["aria-label"] if date_element else "N/A"
+    # Extract Product Title
+    product_title = listing.find("span", class_="pr-title js__card-title")
+    product_title = product_title.text.strip() if product_title else "N/A"
+
+    # Extract Price
+    price = listing.find("span", class_="re__card-config-price js__card-config-item")
+    price = price.text.strip() if price else "N/A"
+
+    # Extract Area
+    area = listing.find("span", class_="re__card-config-area js__card-config-item")
+    area = area.text.strip() if area else "N/A"
+
+    # Extract Price per m²
+    price_per_m2 = listing.find("span", class_="re__card-config-price_per_m2 js__card-config-item")
+    price_per_m2 = price_per_m2.text.strip() if price_per_m2 else "N/A"
+
+    # Extract Number of Bedrooms
+    bedroom = listing.find("span", class_="re__card-config-bedroom js__card-config-item")
+    bedroom = bedroom.text.strip() if bedroom else "N/A"
+
+    # Extract Number of Toilets
+    toilet = listing.find("span", class_="re__card-config-toilet js__card-config-item")
+    toilet = toilet.text.strip() if toilet else "N/A"
+
+    # Extract Location
+    location = listing.find("div", class_="re__card-location")
+    location = location.find("span").text.strip() if location else "N/A"
+
+    # Extract the href link of the detail page
+    href = product_link["href"] if product_link else None
+
+    return {
+        "Id": product_id, "Date Posted": date_element, "Product Title": product_title,
+        "Price": price, "Area": area, "Price per m²": price_per_m2,
+        "Bedrooms": bedroom, "Toilets": toilet, "Location": location,
+        "Coordinates": "N/A", "href": href,
+    }
+
+
+def legacy_parse_coordinates(detail_page_source):
+    """
+    Extract "lat, lon" from the map iframe of a listing detail page.
+
+    Args:
+        detail_page_source (str): The detail page HTML.
+    Returns:
+        str: The coordinates, e.g. "21.021807, 105.857699", or "N/A".
+    """
+    detail_soup = BeautifulSoup(detail_page_source, "html.parser")
+    iframe = detail_soup.find("iframe", class_="lazyload")
+    if not (iframe and "data-src" in iframe.attrs):
+        print("No iframe found on detail page")
+        return "N/A"
+    iframe_url = iframe["data-src"]
+    # Extract lat/lon from URL using regex
+    match = re.search(r"q=([-+]?\d+\.\d+),([-+]?\d+\.\d+)", iframe_url)
+    if not match:
+        print(f"No coordinates found in iframe URL: {iframe_url}")
+        return "N/A"
+    lat, lon = match.groups()
+    return f"{lat}, {lon}"
+
+
+def legacy_parse_page_count(soup):
+    """
+    Read the number of result pages from the pagination bar of a search page.
+
+    Args:
+        soup (BeautifulSoup): The parsed search page.
+    Returns:
+        int: The highest page number linked from the pagination, or None if
+            the page has no pagination bar.
+    """
+    pagination = soup.find("div", class_="re__pagination-group")
+    if not pagination:
+        return None
+    pages = [1]
+    for element in pagination.find_all(attrs={"pid": True}):
+        if element["pid"].isdigit():
+            pages.append(int(element["pid"]))
+    for element in pagination.find_all("a", class_="re__pagination-number"):
+        if element.text.strip().isdigit():
+            pages.append(int(element.text.strip()))
+    return max(pages)
+
+
+def legacy_parse_search_page(page_source, title=""):
+    """
+    Everything scrape_page reads from a search page.
+
+    Returns:
+        tuple: (end of results, card rows, page count).
+    """
+    soup = BeautifulSoup(page_source, "html.parser")
+    srp_list = soup.find("div", class_="re__srp-list")
+    if legacy_is_end_of_results(soup, title) or not srp_list:
+        return True, [], None
+    rows = [legacy_parse_listing_card(card) for card in legacy_extract_listing_cards(srp_list)]
+    return False, [row for row in rows if row is not None], legacy_parse_page_count(soup)
@@ -0,0 +1,99 @@
+"""
+Synthetic district CSVs scaled up from the scraped ones in data/.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fetch_parse import DISTRICT_FILES  # noqa: E402
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _format_vn(values, decimals):
+    # "5,8" style numbers, as the site prints them
+    return np.array([f"{x:.{decimals}f}".rstrip("0").rstrip(".").replace(".", ",") for x in np.round(values, decimals)],
+                    dtype=object)
+
+
+def make_synthetic_district_files(scale, out_dir, seed=0):
+    """
+    Write each district CSV `scale` times over into out_dir.
+
+    Copy 0 is the original file. Every further copy gets new Ids and
+    re-drawn "Price", "Area" and "Price per m²" strings in the original
+    units (tỷ, triệu, m², tr/m²), so the cleaning code sees realistic but
+    distinct values. Unparseable and "Giá thỏa thuận" values are kept as is.
+
+    Args:
+        scale (int): How many copies of each district file to write.
+        out_dir (str): The directory for the synthetic files.
+        seed (int): The random seed.
+    Returns:
+        list: The paths of the synthetic district files, in DISTRICT_FILES order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for source in DISTRICT_FILES:
+        source_path = os.path.join(REPO_ROOT, source)
+        target = os.path.join(out_dir, os.path.basename(source))
+        paths.append(target)
+        if not os.path.exists(source_path) or os.path.getsize(source_path) == 0:
+            open(target, "w").close()
+            continue
+        base = pd.read_csv(source_path, dtype=str, keep_default_na=False)
+        copies = [base]
+        for k in range(1, scale):
+            df = base.copy()
+            n = len(df)
+            df["Id"] = (pd.to_numeric(df["Id"], errors="coerce").fillna(0).astype(np.int64) + k * 10**9).astype(str)
+            area = rng.uniform(30, 200, n)
+            per_m2 = rng.uniform(25, 150, n)
+            price = area * per_m2 / 1000 * rng.uniform(0.97, 1.03, n)
+
+            ty = df["Price"].str.endswith(" tỷ")
+            trieu = df["Price"].str.endswith(" triệu")
+            df.loc[ty, "Price"] = _format_vn(price[ty.to_numpy()], 2) + " tỷ"
+            df.loc[trieu, "Price"] = _format_vn(price[trieu.to_numpy()] * 1000, 0) + " triệu"
+            m2 = df["Area"].str.endswith(" m²")
+            df.loc[m2, "Area"] = _format_vn(area[m2.to_numpy()], 1) + " m²"
+            tr = df["Price per m²"].str.endswith(" tr/m²")
+            df.loc[tr, "Price per m²"] = _format_vn(per_m2[tr.to_numpy()], 2) + " tr/m²"
+            copies.append(df)
+        pd.concat(copies, ignore_index=True).to_csv(target, index=False)
+    return paths
+
+
+def tiled_merged_listings(scale, seed=0):
+    """
+    The merged listings in data/ repeated `scale` times, with "Latitude" and
+    "Longitude" columns; every copy after the first gets new Ids and is moved
+    by up to ~500 m.
+
+    Args:
+        scale (int): How many copies of the merged listings.
+        seed (int): The random seed.
+    Returns:
+        pd.DataFrame: The listings that have coordinates.
+    """
+    from geo import coordinates_of
+    from fetch_parse import MERGED_FILE
+
+    base = pd.read_csv(os.path.join(REPO_ROOT, MERGED_FILE))
+    lat, lon = coordinates_of(base)
+    base = base.assign(Latitude=lat, Longitude=lon).dropna(subset=["Latitude", "Longitude"])
+    rng = np.random.default_rng(seed)
+    copies = []
+    for k in range(scale):
+        df = base.copy()
+        if k:
+            df["Id"] += k * 10**9
+            df["Latitude"] += rng.uniform(-0.005, 0.005, len(df))
+            df["Longitude"] += rng.uniform(-0.005, 0.005, len(df))
+        copies.append(df)
+    return pd.concat(copies, ignore_index=True)
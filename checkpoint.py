@@ -0,0 +1,175 @@
+import json
+import os
+import tempfile
+import time
+
+
+def fsync_append(path, text):
+    """
+    Append text to a file and force it to disk before returning.
+
+    Args:
+        path (str): The file to append to.
+        text (str): The text to append.
+    Returns:
+        int: The file size after the append.
+    """
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def atomic_to_csv(df, path, **kwargs):
+    """
+    Write a DataFrame to CSV through a temporary file and an atomic rename,
+    so readers never see a half-written file and a crash keeps the old one.
+
+    Args:
+        df (pd.DataFrame): The data to write.
+        path (str): The destination CSV.
+        **kwargs: Passed on to DataFrame.to_csv.
+    Returns:
+        None
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".csv", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            df.to_csv(f, **kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return None
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of the (target, page) units a scrape has finished.
+
+    Targets are named by their key (see targets.Target), stored in the
+    "district" field of each record. Each line is a JSON record written after
+    the page's rows reached the CSV and fsync'd, so the journal never claims
+    more than is on disk. It stores the listing IDs a page produced, the
+    target's page count once known,
+    and the CSV size after the write, which lets a resumed run cut off rows
+    from a page that was being written when the process died.
+    """
+
+    def __init__(self, path="data/scrape_journal.jsonl", resume=False):
+        """
+        Args:
+            path (str): The journal file.
+            resume (bool): Keep and load an existing journal; otherwise start a new one.
+        Returns:
+            None
+        """
+        self.path = path
+        self.completed = {}     # (target, page) -> list of listing IDs
+        self.done_pages = {}    # target -> set of its completed pages
+        self.page_counts = {}   # target -> page count from the pagination bar
+        self.ended = {}         # target -> first page found past the last one
+        self.csv_sizes = {}     # target -> CSV size after the last journaled write
+        if resume and os.path.exists(path):
+            self._load()
+        else:
+            open(path, "w").close()
+
+    def _load(self):
+        good_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break  # torn last line from a crash
+                if not line.endswith(b"\n"):
+                    break
+                self._apply(record)
+                good_size += len(line)
+        if good_size < os.path.getsize(self.path):
+            # Cut the torn tail so new records start on a clean line
+            with open(self.path, "r+b") as f:
+                f.truncate(good_size)
+
+    def _apply(self, record):
+        district = record["district"]
+        if record.get("page_count") is not None:
+            self.page_counts[district] = record["page_count"]
+        if record.get("csv_size") is not None:
+            self.csv_sizes[district] = record["csv_size"]
+        if record["status"] == "ok":
+            self.completed[(district, record["page"])] = record.get("ids", [])
+            self.done_pages.setdefault(district, set()).add(record["page"])
+        elif record["status"] == "end":
+            self.ended[district] = min(record["page"], self.ended.get(district, record["page"]))
+
+    def record(self, district, page, status, ids=(), page_count=None, csv_size=None):
+        """
+        Durably record the outcome of one page.
+
+        Args:
+            district (str): The target key.
+            page (int): The page number.
+            status (str): "ok", "end" or "error" (a page given up on).
+            ids (iterable): The listing IDs written for that page.
+            page_count (int): The target's page count, if this page revealed it.
+            csv_size (int): The target's CSV size after the write.
+        Returns:
+            None
+        """
+        record = {
+            "district": district, "page": page, "status": status, "ids": [str(i) for i in ids],
+            "page_count": page_count, "csv_size": csv_size, "time": time.time(),
+        }
+        fsync_append(self.path, json.dumps(record, ensure_ascii=False) + "\n")
+        self._apply(record)
+
+    def is_done(self, district, page):
+        return (district, page) in self.completed
+
+    def pages_to_do(self, district):
+        """
+        The pages of a target a resumed run still has to scrape.
+
+        Args:
+            district (str): The target key.
+        Returns:
+            list: Page numbers to queue now. When the page count is unknown,
+                this is the next page to probe (or nothing if the end was seen).
+        """
+        if district in self.page_counts:
+            return [p for p in range(1, self.page_counts[district] + 1) if not self.is_done(district, p)]
+        done = self.done_pages.get(district)
+        next_page = max(done) + 1 if done else 1
+        if district in self.ended and self.ended[district] <= next_page:
+            return []
+        return [next_page]
+
+    def recover_csv(self, district, csv_file_path):
+        """
+        Cut a target's CSV back to its last journaled size, dropping rows of a
+        page whose write was not journaled (and will therefore be redone).
+
+        Args:
+            district (str): The target key.
+            csv_file_path (str): The target's CSV.
+        Returns:
+            int: The number of bytes removed.
+        """
+        if district not in self.csv_sizes or not os.path.exists(csv_file_path):
+            return 0
+        size = os.path.getsize(csv_file_path)
+        journaled = self.csv_sizes[district]
+        if size <= journaled:
+            return 0
+        with open(csv_file_path, "r+b") as f:
+            f.truncate(journaled)
+            f.flush()
+            os.fsync(f.fileno())
+        return size - journaled
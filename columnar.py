@@ -0,0 +1,227 @@
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset  # noqa: F401  (pa.dataset)
+import pyarrow.parquet as pq
+
+from locations import district_categorical, district_id, encode_locations
+
+# Where the columnar copies go, next to the CSV files:
+#   listings/        merged listings as Parquet, one directory per district ID (District Id=2/)
+#   listings.arrow   the same rows as one uncompressed Arrow IPC file, for memory-mapped reads
+#   <table>.parquet  the CPI, population, GDP and income tables
+COLUMNAR_DIR = 'data/parquet'
+LISTINGS_DATASET = 'listings'
+LISTINGS_ARROW = 'listings.arrow'
+REFERENCE_TABLES = ['consumer_price_index', 'population_by_district', 'GDP_per_capita', 'income_hanoi_per_person']
+
+# "21.0064972996948, 105.846686151416"
+_COORDINATES_PATTERN = r'^\s*([-+]?[0-9]+(?:\.[0-9]+)?)\s*,\s*([-+]?[0-9]+(?:\.[0-9]+)?)\s*$'
+
+LISTINGS_SCHEMA = pa.schema([
+    ("Id", pa.int64()),
+    ("Date Posted", pa.date32()),
+    ("Product Title", pa.string()),
+    ("Price", pa.float64()),
+    ("Area", pa.float64()),
+    ("Price per m²", pa.float64()),
+    ("calc price", pa.float64()),
+    ("Bedrooms", pa.float64()),
+    ("Toilets", pa.float64()),
+    ("Location", pa.dictionary(pa.int32(), pa.string())),
+    ("Latitude", pa.float64()),
+    ("Longitude", pa.float64()),
+    ("District Id", pa.int8()),
+    ("Ward Id", pa.int32()),
+    ("District", pa.dictionary(pa.int8(), pa.string())),
+])
+# The Parquet dataset is partitioned on the district ID; -1 holds the listings of unknown districts
+LISTINGS_PARTITIONING = pa.dataset.partitioning(pa.schema([("District Id", pa.int8())]), flavor="hive")
+
+
+def split_coordinates(coordinates):
+    """
+    Split "lat, lon" strings into two float columns.
+
+    Args:
+        coordinates (pd.Series): The "Coordinates" column.
+    Returns:
+        tuple: (latitude, longitude) float Series, NaN where the value is missing or "N/A".
+    """
+    parts = coordinates.astype("string").str.extract(_COORDINATES_PATTERN)
+    return parts[0].astype(float), parts[1].astype(float)
+
+
+def to_listings_table(df, wards=None):
+    """
+    Convert merged listings to a typed Arrow table.
+
+    "Coordinates" becomes float "Latitude" and "Longitude" columns, "Date Posted"
+    a date, "Location" a dictionary column, and the location's integer
+    "District Id" and "Ward Id" and canonical "District" name are added
+    (see locations.py; -1 and null where the district is unknown).
+
+    Args:
+        df (pd.DataFrame): Listings as written to the merged CSV.
+        wards (locations.WardTable): Ward IDs to use and extend.
+    Returns:
+        pa.Table: The table, with LISTINGS_SCHEMA.
+    """
+    typed = pd.DataFrame({
+        "Id": pd.to_numeric(df["Id"], errors="coerce").astype("Int64"),
+        "Date Posted": pd.to_datetime(df["Date Posted"], format="%d/%m/%Y", errors="coerce").dt.date,
+        "Product Title": df["Product Title"],
+        "Price": df["Price"],
+        "Area": df["Area"],
+        "Price per m²": df["Price per m²"],
+        "calc price": df["calc price"],
+        "Bedrooms": pd.to_numeric(df["Bedrooms"], errors="coerce"),
+        "Toilets": pd.to_numeric(df["Toilets"], errors="coerce"),
+        "Location": df["Location"],
+    })
+    typed["Latitude"], typed["Longitude"] = split_coordinates(df["Coordinates"])
+    codes = encode_locations(df["Location"], wards)
+    typed["District Id"] = codes["District Id"].to_numpy()
+    typed["Ward Id"] = codes["Ward Id"].to_numpy()
+    # Categorical with the districts in ID order, so the dictionary indices are the district IDs
+    typed["District"] = district_categorical(typed["District Id"].to_numpy(), index=typed.index)
+    return pa.Table.from_pandas(typed, schema=LISTINGS_SCHEMA, preserve_index=False)
+
+
+def _replace_directory(tmp_dir, target):
+    # Swap the finished directory in, so readers never see a half-written dataset
+    old = None
+    if os.path.exists(target):
+        old = f"{target}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(target, old)
+    os.replace(tmp_dir, target)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_listings(df, out_dir=COLUMNAR_DIR, wards=None):
+    """
+    Write merged listings as a zstd-compressed Parquet dataset partitioned by
+    district, and as an uncompressed Arrow IPC file. Both replace the
+    previous copies.
+
+    Args:
+        df (pd.DataFrame): Listings as written to the merged CSV.
+        out_dir (str): Directory for the columnar files.
+        wards (locations.WardTable): Ward IDs to use and extend.
+    Returns:
+        pa.Table: The table that was written.
+    """
+    table = to_listings_table(df, wards)
+    os.makedirs(out_dir, exist_ok=True)
+    dataset_path = os.path.join(out_dir, LISTINGS_DATASET)
+    arrow_path = os.path.join(out_dir, LISTINGS_ARROW)
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp_listings_", dir=out_dir)
+    try:
+        pq.write_to_dataset(table, tmp_dir, partitioning=LISTINGS_PARTITIONING, compression="zstd")
+        _replace_directory(tmp_dir, dataset_path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    tmp_path = f"{arrow_path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+    return table
+
+
+def read_listings(columns=None, districts=None, out_dir=COLUMNAR_DIR):
+    """
+    Read listings from the Parquet dataset, decoding only what is asked for.
+
+    Args:
+        columns (list): Columns to read (all by default).
+        districts (list): Only read these districts' partitions, by name, slug or ID (all by default).
+        out_dir (str): Directory of the columnar files.
+    Returns:
+        pd.DataFrame: The listings, "Date Posted" as datetime64.
+    """
+    filters = None
+    if districts:
+        ids = [d if isinstance(d, int) else district_id(d) for d in districts]
+        filters = [("District Id", "in", ids)]
+    table = pq.read_table(os.path.join(out_dir, LISTINGS_DATASET), columns=columns, filters=filters, memory_map=True,
+                          partitioning=LISTINGS_PARTITIONING)
+    return table.to_pandas(date_as_object=False)
+
+
+def map_listings(columns=None, out_dir=COLUMNAR_DIR):
+    """
+    Memory-map the Arrow IPC copy of the listings.
+
+    Nothing is decoded or copied: the columns point into the mapped file, and
+    the OS pages in only what is touched.
+
+    Args:
+        columns (list): Columns to keep (all by default).
+        out_dir (str): Directory of the columnar files.
+    Returns:
+        pa.Table: The listings.
+    """
+    source = pa.memory_map(os.path.join(out_dir, LISTINGS_ARROW), "r")
+    table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def map_listings_df(columns=None, out_dir=COLUMNAR_DIR):
+    """
+    map_listings as a DataFrame backed by the mapped Arrow buffers (pd.ArrowDtype
+    columns), so the conversion does not copy either.
+
+    Args:
+        columns (list): Columns to keep (all by default).
+        out_dir (str): Directory of the columnar files.
+    Returns:
+        pd.DataFrame: The listings.
+    """
+    return map_listings(columns, out_dir).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def write_reference_tables(data_dir="data", out_dir=COLUMNAR_DIR):
+    """
+    Convert the CPI, population, GDP and income CSVs to Parquet, when the
+    Parquet copy is missing or older than the CSV.
+
+    Args:
+        data_dir (str): Directory of the CSV files.
+        out_dir (str): Directory for the Parquet files.
+    Returns:
+        list: The tables that were (re)written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name in REFERENCE_TABLES:
+        source = os.path.join(data_dir, f"{name}.csv")
+        target = os.path.join(out_dir, f"{name}.parquet")
+        if not os.path.exists(source):
+            continue
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            continue
+        # GDP_per_capita.csv starts with a byte order mark; income uses "N/A" for missing years
+        df = pd.read_csv(source, encoding="utf-8-sig")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), target, compression="zstd")
+        written.append(name)
+    return written
+
+
+def read_reference_table(name, out_dir=COLUMNAR_DIR):
+    """
+    Args:
+        name (str): One of REFERENCE_TABLES.
+        out_dir (str): Directory of the Parquet files.
+    Returns:
+        pd.DataFrame: The table.
+    """
+    return pq.read_table(os.path.join(out_dir, f"{name}.parquet"), memory_map=True).to_pandas()
+
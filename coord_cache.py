@@ -0,0 +1,228 @@
+import csv
+import os
+import sqlite3
+import time
+import zlib
+
+
+class CoordinateCache:
+    """
+    On-disk cache of detail-page results keyed by data-product-id.
+
+    Stores the "lat, lon" string and, optionally, a zlib-compressed copy of
+    the detail HTML in a SQLite file shared by all districts and workers.
+    Entries older than ttl_seconds are treated as misses, and once the cache
+    holds more than max_entries (or its HTML exceeds max_html_bytes) the least
+    recently used entries are evicted. The access times of hits are kept in
+    memory and written in one go before an eviction pass and on close, so a
+    hit costs a read and no commit.
+    """
+
+    def __init__(self, path="data/coordinate_cache.sqlite", ttl_seconds=90 * 24 * 3600,
+                 max_entries=500_000, max_html_bytes=512 * 1024 * 1024, store_html=False):
+        """
+        Args:
+            path (str): The SQLite file.
+            ttl_seconds (float): Age after which an entry is stale (None keeps entries forever).
+            max_entries (int): Maximum number of entries kept.
+            max_html_bytes (int): Maximum total size of the compressed HTML kept.
+            store_html (bool): Also keep the compressed detail HTML.
+        Returns:
+            None
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_html_bytes = max_html_bytes
+        self.store_html = store_html
+        self.hits = 0
+        self.misses = 0
+        self.evict_every = 100  # puts between eviction passes
+        self._puts_since_evict = 0
+        self.flush_every = 1000  # buffered access times written at once
+        self._accessed = {}  # product_id -> time of the last hit not written yet
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS coordinates ("
+            " product_id TEXT PRIMARY KEY,"
+            " coordinates TEXT NOT NULL,"
+            " html BLOB,"
+            " fetched_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS coordinates_last_access ON coordinates (last_access)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seeded (csv_path TEXT PRIMARY KEY, csv_size INTEGER)")
+        self.conn.commit()
+
+    def _is_fresh(self, fetched_at, now):
+        return self.ttl_seconds is None or now - fetched_at <= self.ttl_seconds
+
+    def get(self, product_id):
+        """
+        Look up the coordinates of a product.
+
+        Args:
+            product_id (str): The data-product-id.
+        Returns:
+            str: The cached "lat, lon", or None on a miss or stale entry.
+        """
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT coordinates, fetched_at FROM coordinates WHERE product_id = ?", (str(product_id),)
+        ).fetchone()
+        if row is None or not self._is_fresh(row[1], now):
+            self.misses += 1
+            return None
+        self._accessed[str(product_id)] = now
+        if len(self._accessed) >= self.flush_every:
+            self.flush_access_times()
+        self.hits += 1
+        return row[0]
+
+    def flush_access_times(self):
+        """
+        Write the access times of the hits since the last flush.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE coordinates SET last_access = MAX(last_access, ?) WHERE product_id = ?",
+                [(now, product_id) for product_id, now in accessed.items()],
+            )
+
+    def get_html(self, product_id):
+        """
+        Args:
+            product_id (str): The data-product-id.
+        Returns:
+            str: The cached detail HTML, or None if it was not stored.
+        """
+        row = self.conn.execute("SELECT html FROM coordinates WHERE product_id = ?", (str(product_id),)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, product_id, coordinates, html=None):
+        """
+        Store the result of a detail page fetch; every evict_every puts the
+        caps are enforced.
+
+        Args:
+            product_id (str): The data-product-id.
+            coordinates (str): The "lat, lon" string.
+            html (str): The detail HTML, kept only if store_html is set.
+        Returns:
+            None
+        """
+        now = time.time()
+        blob = zlib.compress(html.encode("utf-8"), 6) if (html is not None and self.store_html) else None
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO coordinates VALUES (?, ?, ?, ?, ?)",
+                (str(product_id), coordinates, blob, now, now),
+            )
+        self._puts_since_evict += 1
+        if self._puts_since_evict >= self.evict_every:
+            self.evict()
+
+    def evict(self):
+        """
+        Drop stale entries, then the least recently used ones above the caps.
+
+        Args:
+            None
+        Returns:
+            int: The number of entries removed.
+        """
+        removed = 0
+        self._puts_since_evict = 0
+        # The least recently used entries are only known once the hits are written
+        self.flush_access_times()
+        with self.conn:
+            if self.ttl_seconds is not None:
+                removed += self.conn.execute(
+                    "DELETE FROM coordinates WHERE fetched_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+            count = self.conn.execute("SELECT COUNT(*) FROM coordinates").fetchone()[0]
+            if count > self.max_entries:
+                removed += self.conn.execute(
+                    "DELETE FROM coordinates WHERE product_id IN ("
+                    " SELECT product_id FROM coordinates ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+            if self.store_html:
+                html_bytes = self.conn.execute("SELECT COALESCE(SUM(LENGTH(html)), 0) FROM coordinates").fetchone()[0]
+                while html_bytes > self.max_html_bytes:
+                    # Drop the HTML (not the coordinates) of the oldest 10% that still have some
+                    rows = self.conn.execute(
+                        "SELECT product_id, LENGTH(html) FROM coordinates WHERE html IS NOT NULL"
+                        " ORDER BY last_access LIMIT MAX(1, (SELECT COUNT(html) FROM coordinates) / 10)"
+                    ).fetchall()
+                    if not rows:
+                        break
+                    self.conn.executemany("UPDATE coordinates SET html = NULL WHERE product_id = ?",
+                                          [(product_id,) for product_id, _ in rows])
+                    html_bytes -= sum(size for _, size in rows)
+        return removed
+
+    def seed_from_csv(self, csv_file_path):
+        """
+        Load the coordinates already scraped into a district CSV.
+
+        The CSV size is remembered, so an unchanged file is not scanned again.
+        Existing cache entries are kept.
+
+        Args:
+            csv_file_path (str): The path to a filtered_real_estate_listings_*.csv file.
+        Returns:
+            int: The number of entries added.
+        """
+        if not os.path.exists(csv_file_path) or os.path.getsize(csv_file_path) == 0:
+            return 0
+        size = os.path.getsize(csv_file_path)
+        row = self.conn.execute("SELECT csv_size FROM seeded WHERE csv_path = ?", (csv_file_path,)).fetchone()
+        if row is not None and row[0] == size:
+            return 0
+
+        fetched_at = os.path.getmtime(csv_file_path)
+        with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            if not reader.fieldnames or "Coordinates" not in reader.fieldnames:
+                return 0
+            entries = [
+                (r["Id"], r["Coordinates"], None, fetched_at, fetched_at)
+                for r in reader
+                if r["Coordinates"] and r["Coordinates"] != "N/A"
+            ]
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO coordinates VALUES (?, ?, ?, ?, ?)", entries)
+            added = self.conn.total_changes - before
+            self.conn.execute("INSERT OR REPLACE INTO seeded VALUES (?, ?)", (csv_file_path, size))
+        self.evict()
+        return added
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters and the current number of entries.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": self.conn.execute("SELECT COUNT(*) FROM coordinates").fetchone()[0],
+        }
+
+    def close(self):
+        self.flush_access_times()
+        self.conn.close()
@@ -0,0 +1,205 @@
+import csv
+import os
+import sqlite3
+from collections import OrderedDict
+
+
+class DedupIndex:
+    """
+    Persistent (Id, Date Posted) index for one district CSV.
+
+    The index lives next to the CSV in a SQLite sidecar file
+    (e.g. data/filtered_real_estate_listings_ba-dinh.seen.sqlite), so it is
+    built from the CSV only once and survives restarts. SQLite handles the
+    locking, which lets the Pool workers in main.py share the same sidecar.
+    """
+
+    def __init__(self, csv_file_path, index_path=None):
+        """
+        Open (and if needed build) the dedup index for a district CSV.
+
+        Args:
+            csv_file_path (str): The path to the district CSV file.
+            index_path (str): Optional path of the SQLite sidecar. Defaults to
+                the CSV path with a ".seen.sqlite" suffix.
+        Returns:
+            None
+        """
+        self.csv_file_path = csv_file_path
+        self.index_path = index_path or os.path.splitext(csv_file_path)[0] + ".seen.sqlite"
+        self.conn = sqlite3.connect(self.index_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " id TEXT NOT NULL,"
+            " date_posted TEXT NOT NULL,"
+            " PRIMARY KEY (id, date_posted)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self.sync_from_csv()
+
+    def _csv_stat(self):
+        # (size, mtime in ns, inode) of the CSV, zeros if it does not exist
+        if not os.path.exists(self.csv_file_path):
+            return 0, 0, 0
+        stat = os.stat(self.csv_file_path)
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def sync_from_csv(self):
+        """
+        Rescan the CSV into the index if it changed since the last sync.
+
+        The CSV size, modification time and inode are recorded after every
+        sync, so the full scan only runs when the sidecar is new or the CSV
+        was modified outside the index (e.g. rewritten by hand or appended by
+        an older scraper). A CSV that shrank, went back in time or was
+        replaced by another file (as atomic_to_csv does) may have lost rows,
+        whose pairs must stop counting as duplicates: the index is then
+        rebuilt rather than added to.
+
+        Args:
+            None
+        Returns:
+            int: The number of rows scanned (0 if the index was up to date).
+        """
+        size, mtime, inode = self._csv_stat()
+        recorded = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        if "csv_size" in recorded:
+            rewritten = (int(recorded["csv_size"]) > size
+                         or mtime < int(recorded.get("csv_mtime", 0))
+                         or int(recorded.get("csv_inode", 0)) not in (0, inode))
+            if rewritten:
+                return self.rebuild()
+            if int(recorded["csv_size"]) == size:
+                return 0
+
+        scanned = 0
+        if size > 0:
+            with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
+                reader = csv.DictReader(csvfile)
+                if reader.fieldnames and "Id" in reader.fieldnames and "Date Posted" in reader.fieldnames:
+                    keys = [(r["Id"], r["Date Posted"]) for r in reader]
+                    scanned = len(keys)
+                    with self.conn:
+                        self.conn.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?)", keys)
+        self._record_csv_stat(size, mtime, inode)
+        return scanned
+
+    def rebuild(self):
+        """
+        Drop every indexed pair and rebuild the index from the CSV.
+
+        Used when the CSV was truncated and rewritten, since pairs that are no
+        longer in the file must stop counting as duplicates.
+
+        Args:
+            None
+        Returns:
+            int: The number of rows scanned.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM seen")
+            self.conn.execute("DELETE FROM meta WHERE key IN ('csv_size', 'csv_mtime', 'csv_inode')")
+        return self.sync_from_csv()
+
+    def _record_csv_stat(self, size, mtime, inode):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                  [("csv_size", str(size)), ("csv_mtime", str(mtime)), ("csv_inode", str(inode))])
+
+    def contains(self, product_id, date_element):
+        """
+        Check if a product_id and date_element pair is already in the index.
+
+        Args:
+            product_id (str): The product ID to check.
+            date_element (str): The date element to check.
+        Returns:
+            bool: True if the pair exists, False otherwise.
+        """
+        row = self.conn.execute(
+            "SELECT 1 FROM seen WHERE id = ? AND date_posted = ?",
+            (str(product_id), str(date_element)),
+        ).fetchone()
+        return row is not None
+
+    def add_many(self, keys, csv_size_before=None):
+        """
+        Record (Id, Date Posted) pairs that were just appended to the CSV.
+
+        If csv_size_before is given, the recorded CSV size is advanced with a
+        compare-and-set, so an append by another worker that is not in the
+        index yet still triggers a rescan on the next open.
+
+        Args:
+            keys (iterable): Iterable of (product_id, date_element) pairs.
+            csv_size_before (int): The CSV size right before the append.
+        Returns:
+            None
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen VALUES (?, ?)",
+                [(str(product_id), str(date_element)) for product_id, date_element in keys],
+            )
+            if csv_size_before is not None:
+                size, mtime, inode = self._csv_stat()
+                advanced = self.conn.execute(
+                    "UPDATE meta SET value = ? WHERE key = 'csv_size' AND value = ?",
+                    (str(size), str(csv_size_before)),
+                ).rowcount
+                if advanced:
+                    self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                          [("csv_mtime", str(mtime)), ("csv_inode", str(inode))])
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def close(self):
+        """
+        Close the SQLite connection.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        self.conn.close()
+
+
+class DedupIndexCache:
+    """
+    The DedupIndex of each CSV a process writes to or checks, opened on first
+    use and kept open for the next page, with at most max_open connections:
+    the least recently used index is closed when another one is needed, so a
+    run over thousands of targets holds a bounded number of SQLite files open.
+    """
+
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        self._indexes = OrderedDict()
+
+    def get(self, csv_file_path):
+        """
+        Args:
+            csv_file_path (str): The CSV (its directory is created if needed).
+        Returns:
+            DedupIndex: The open index of that CSV.
+        """
+        index = self._indexes.pop(csv_file_path, None)
+        if index is None:
+            os.makedirs(os.path.dirname(csv_file_path) or ".", exist_ok=True)
+            index = DedupIndex(csv_file_path)
+            while len(self._indexes) >= self.max_open:
+                self._indexes.popitem(last=False)[1].close()
+        self._indexes[csv_file_path] = index
+        return index
+
+    def close(self):
+        """
+        Close every open index.
+        """
+        for index in self._indexes.values():
+            index.close()
+        self._indexes.clear()
@@ -0,0 +1,183 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psutil
+from selenium.common.exceptions import WebDriverException
+
+from metrics import REGISTRY, count, stage_timer
+
+# A driver is replaced after this many pages, or once its browser uses this much memory
+MAX_PAGES_PER_DRIVER = 200
+MAX_DRIVER_RSS_MB = 1024
+
+
+def browser_rss(driver):
+    """
+    Memory used by the browser behind a WebDriver: chromedriver and every
+    Chrome process it started.
+
+    Args:
+        driver (WebDriver): The driver.
+    Returns:
+        int: The summed RSS in bytes, or None if the driver has no local browser process.
+    """
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if process is None:
+        return None
+    try:
+        root = psutil.Process(process.pid)
+        return sum(p.memory_info().rss for p in [root, *root.children(recursive=True)])
+    except psutil.Error:
+        return None
+
+
+class DriverPool:
+    """
+    Warm WebDrivers shared by the fetches of a process.
+
+    A driver is handed to one caller at a time and goes back to the pool
+    afterwards, so the seconds Chrome takes to start are paid once per
+    driver rather than once per district. Drivers are retired and replaced
+    after max_pages pages, once their browser's RSS crosses max_rss_mb, or
+    when a command fails with a WebDriverException (e.g. a crashed tab).
+    """
+
+    def __init__(self, driver_factory, size=1, max_pages=MAX_PAGES_PER_DRIVER, max_rss_mb=MAX_DRIVER_RSS_MB):
+        """
+        Args:
+            driver_factory (callable): Returns a new WebDriver (e.g. scraping.setup_driver).
+            size (int): Maximum number of drivers, i.e. of pages loading at once.
+            max_pages (int): Pages a driver loads before it is replaced (None for no limit).
+            max_rss_mb (float): Browser RSS in MB above which a driver is replaced (None for no limit).
+        Returns:
+            None
+        """
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._idle = queue.LifoQueue()  # the most recently used driver is the warmest
+        self._slots = threading.BoundedSemaphore(size)
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _start(self):
+        with stage_timer("driver_start"):
+            driver = self.driver_factory()
+        count("scraper_driver_starts_total")
+        with self._lock:
+            self._pages[id(driver)] = 0
+        return driver
+
+    def _retire(self, driver, reason):
+        if reason != "closed":
+            count("scraper_driver_recycles_total", reason=reason)
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error quitting a retired driver: {e}")
+
+    def warm(self, n=None):
+        """
+        Start drivers ahead of the first page, in parallel.
+
+        Args:
+            n (int): How many (default: the pool size), counting those already idle.
+        Returns:
+            int: The number of drivers started.
+        """
+        n = min(n or self.size, self.size) - self._idle.qsize()
+        if n <= 0:
+            return 0
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            for driver in executor.map(lambda _: self._start(), range(n)):
+                self._idle.put(driver)
+        return n
+
+    def acquire(self):
+        """
+        Take a driver, starting one if none is idle. Blocks while all size drivers are busy.
+
+        Returns:
+            WebDriver: The driver, to be given back with release.
+        """
+        if self._closed:
+            raise RuntimeError("The driver pool is closed")
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._start()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, driver, broken=False):
+        """
+        Give a driver back after one page, replacing it if it is broken or due for recycling.
+
+        Args:
+            driver (WebDriver): A driver from acquire.
+            broken (bool): The driver failed and must not be reused.
+        Returns:
+            None
+        """
+        try:
+            with self._lock:
+                pages = self._pages.get(id(driver), 0) + 1
+                self._pages[id(driver)] = pages
+            rss = browser_rss(driver)
+            if rss is not None:
+                REGISTRY.set_gauge("browser_resident_memory_bytes", rss)
+            if broken:
+                self._retire(driver, "error")
+            elif self._closed:
+                self._retire(driver, "closed")
+            elif self.max_pages is not None and pages >= self.max_pages:
+                self._retire(driver, "pages")
+            elif self.max_rss_mb is not None and rss is not None and rss > self.max_rss_mb * 1024 * 1024:
+                print(f"Browser uses {rss / 1024 / 1024:.0f} MB after {pages} pages: recycling the driver")
+                self._retire(driver, "memory")
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def driver(self):
+        """
+        Borrow a driver for a with block:
+
+            with pool.driver() as driver:
+                driver.get(url)
+        """
+        driver = self.acquire()
+        try:
+            yield driver
+        except WebDriverException:
+            self.release(driver, broken=True)
+            raise
+        except BaseException:
+            self.release(driver)
+            raise
+        else:
+            self.release(driver)
+
+    def close(self):
+        """
+        Quit the idle drivers; drivers still in use are quit when they are released.
+        """
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(driver, "closed")
@@ -2,185 +2,523 @@ import os
 import re
 import pandas as pd
 import numpy as np
+from checkpoint import atomic_to_csv
+from history import HISTORY_FILE, ListingHistory
+from locations import WardTable
+from merge_cache import MergeCache
+from near_duplicates import NEAR_DUPLICATES_FILE, drop_near_duplicates
 
-def process_real_estate_data():
+# List of district CSV files
+DISTRICT_FILES = [
+    'data/filtered_real_estate_listings_thanh-xuan.csv',
+    'data/filtered_real_estate_listings_ba-dinh.csv',
+    'data/filtered_real_estate_listings_cau-giay.csv',
+    'data/filtered_real_estate_listings_nam-tu-liem.csv',
+    'data/filtered_real_estate_listings_bac-tu-liem.csv',
+    'data/filtered_real_estate_listings_hai-ba-trung.csv',
+    'data/filtered_real_estate_listings_hoan-kiem.csv',
+    'data/filtered_real_estate_listings_dong-da.csv',
+    'data/filtered_real_estate_listings_ha-dong.csv',
+    'data/filtered_real_estate_listings_hoang-mai.csv',
+    'data/filtered_real_estate_listings_long-bien.csv',
+    'data/filtered_real_estate_listings_tay-ho.csv'
+]
+
+MERGED_FILE = 'data/merged_real_estate_listings.csv'
+
+# Cleaned per-district rows and their manifest, for the incremental mode
+MERGE_CACHE_DIR = 'data/merge_cache'
+# Bump when prepare_district_frame changes, so cached cleaned rows are rebuilt
+PREPARED_VERSION = '1'
+
+# Helper columns added by prepare_district_frame and dropped by merge_prepared_frames
+EMPTY_COUNT = '_empty_count'
+OTHER_UNIT = '_other_unit'
+HELPER_COLUMNS = [EMPTY_COUNT, OTHER_UNIT]
+
+# A number with a decimal comma followed by its unit, e.g. "5,8 tỷ", "850 triệu",
+# "110 m²" or "52,73 tr/m²": the form almost every value takes. Anything else goes
+# through the original one-value-at-a-time cleaning below.
+_PRICE_PATTERN = r'^([0-9]+(?:,[0-9]+)?)\s*(tỷ|triệu)$'
+_AREA_PATTERN = r'^([0-9]+(?:,[0-9]+)?)\s*(m²)$'
+_PRICE_PER_M2_PATTERN = r'^([0-9]+(?:,[0-9]+)?)\s*(tr/m²)$'
+
+# Divisors from a "Price" unit to tỷ (billion đồng), the unit of the cleaned column.
+# "Price per m²" is only kept in tr/m²: rows in nghìn/m², tỉ/m² or đồng/m² are dropped.
+PRICE_UNITS = {"tỷ": 1.0, "triệu": 1000.0}
+DROPPED_PRICE_PER_M2_UNITS = r'nghìn/m²|tỉ/m²|đồng/m²'
+
+# Rentals are priced by the month, e.g. "15 triệu/tháng": their "Price" is kept in
+# triệu a month instead. Rents per m² ("200 nghìn/m²/tháng") do not parse.
+_RENT_PATTERN = r'^([0-9]+(?:,[0-9]+)?)\s*(tỷ|triệu|nghìn)/tháng$'
+RENT_UNITS = {"tỷ": 0.001, "triệu": 1.0, "nghìn": 1000.0}
+
+
+def clean_price(price):
     """
-    This function processes real estate data from multiple CSV files, cleans and merges them into a single DataFrame.
-    
+    Clean a single "Price" value: "x tỷ" becomes x and "x triệu" becomes
+    x / 1000, with None when the number does not parse. "Giá thỏa thuận"
+    and anything else is returned as is.
+
     Args:
-        None
-    
+        price: The raw value.
     Returns:
-        None
+        The cleaned value.
     """
-    # List of district CSV files
-    district_files = [
-        'data/filtered_real_estate_listings_thanh-xuan.csv',
-        'data/filtered_real_estate_listings_ba-dinh.csv',
-        'data/filtered_real_estate_listings_cau-giay.csv',
-        'data/filtered_real_estate_listings_nam-tu-liem.csv',
-        'data/filtered_real_estate_listings_bac-tu-liem.csv',
-        'data/filtered_real_estate_listings_hai-ba-trung.csv',
-        'data/filtered_real_estate_listings_hoan-kiem.csv',
-        'data/filtered_real_estate_listings_dong-da.csv',
-        'data/filtered_real_estate_listings_ha-dong.csv',
-        'data/filtered_real_estate_listings_hoang-mai.csv',
-        'data/filtered_real_estate_listings_long-bien.csv',
-        'data/filtered_real_estate_listings_tay-ho.csv'
-    ]
-
-    # Initialize an empty list to hold dataframes
-    dfs = []
-
-        # Loop through each district file
-    for file in district_files:
-        if os.path.exists(file):
-            # Check if file is empty (0 bytes)
-            if os.path.getsize(file) == 0:
-                print(f"Skipping empty file (0 bytes): {file}")
-                continue
-            
+    if isinstance(price, str):
+        # Check if "Giá thỏa thuận", if yes, return the same value
+        if "Giá thỏa thuận" in price:
+            return price
+
+        # Remove "tỉ", replace "," with ".", and convert to float
+        if "tỷ" in price:
+            price = re.sub(r"\s*tỷ", "", price)  # Remove "tỉ"
+            price = price.replace(",", ".")  # Replace comma with period
             try:
-                df = pd.read_csv(file)  # Read the CSV file into a DataFrame
-                if df.empty:
-                    print(f"Skipping file with no data (but has headers): {file}")
-                    continue
-                dfs.append(df)
-                print(f"Loaded data from: {file}")
-            except pd.errors.EmptyDataError:
-                print(f"Skipping completely empty file (no headers): {file}")
-                continue
-            except Exception as e:
-                print(f"Error reading {file}: {e}")
-                continue
-        else:
-            print(f"File does not exist: {file}")
+                return float(price)
+            except ValueError:
+                return None  # Handle cases where conversion fails
+
+        # Remove "triệu", replace "," with ".", convert to float, and divide by 1000
+        if "triệu" in price:
+            price = re.sub(r"\s*triệu", "", price)  # Remove "triệu"
+            price = price.replace(",", ".")  # Replace comma with period
+            try:
+                return float(price) / 1000
+            except ValueError:
+                return None  # Handle cases where conversion fails
+    return price  # Return the price as is if no conditions match
+
+
+def clean_rent(price):
+    """
+    Clean a single rental "Price" value: "x triệu/tháng" becomes x, and "x tỷ/tháng"
+    or "x nghìn/tháng" the same rent in triệu. "Thỏa thuận" becomes "Giá thỏa thuận",
+    as for the listings for sale, and anything else None.
+
+    Args:
+        price: The raw value.
+    Returns:
+        The cleaned value.
+    """
+    if not isinstance(price, str):
+        return price
+    if "thỏa thuận" in price.lower():
+        return "Giá thỏa thuận"
+    match = re.match(_RENT_PATTERN, price.strip())
+    if match is None:
+        return None
+    return float(match.group(1).replace(",", ".")) / RENT_UNITS[match.group(2)]
+
+
+def clean_area(area):
+    """
+    Clean a single "Area" value: "110 m²" becomes 110.0, with None when the
+    number does not parse. Non-strings are returned as is.
+
+    Args:
+        area: The raw value.
+    Returns:
+        The cleaned value.
+    """
+    if isinstance(area, str):
+        area = area.replace("m²", "")  # Remove "m²"
+        area = area.replace(",", ".")  # Replace comma with period
+        try:
+            return float(area)  # Convert to float
+        except ValueError:
+            return None  # Handle cases where conversion fails
+    return area  # Return the value as is if it's not a string
+
+
+def map_unique(values, parse):
+    """
+    Apply a column parser to the distinct values only and spread the results back.
+
+    Listings repeat the same few thousand price and area strings, so parsing
+    each distinct string once does a fraction of the string work. Missing
+    values are left as they are.
+
+    Args:
+        values (pd.Series): The column.
+        parse (callable): Takes a Series of distinct values, returns an array-like
+            of the same length.
+    Returns:
+        pd.Series: The parsed column, same index.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = np.asarray(parse(pd.Series(uniques, dtype=object)))
+    if (codes >= 0).all():
+        return pd.Series(parsed[codes], index=values.index)
+    result = values.to_numpy(dtype=object, copy=True)
+    present = codes >= 0
+    result[present] = parsed[codes[present]]
+    return pd.Series(result, index=values.index)
+
+
+def _parse_with_units(text, pattern, units, fallback):
+    """
+    Parse "<number> <unit>" strings in one str.extract pass.
+
+    Matching values become float(number) / units[unit]; the rest go through
+    fallback, the original per-value cleaning, so results are the same as
+    fallback for every value.
+
+    Args:
+        text (pd.Series): Distinct raw values.
+        pattern (str): Regex capturing the number and the unit.
+        units (dict): Unit -> divisor.
+        fallback (callable): Per-value cleaning for what the pattern does not match.
+    Returns:
+        np.ndarray: Object array of the cleaned values.
+    """
+    parts = text.str.extract(pattern)
+    matched = parts[0].notna().to_numpy()
+    result = np.empty(len(text), dtype=object)
+    numbers = parts.loc[matched, 0].str.replace(",", ".", regex=False).astype(float)
+    result[matched] = (numbers / parts.loc[matched, 1].map(units)).to_numpy()
+    result[~matched] = [fallback(value) for value in text[~matched]]
+    return result
+
+
+def clean_price_column(price, rent=False):
+    """
+    Vectorized clean_price (clean_rent for rentals) over the "Price" column.
+
+    Args:
+        price (pd.Series): The raw "Price" column.
+        rent (bool): The prices are monthly rents.
+    Returns:
+        pd.Series: The cleaned column.
+    """
+    if price.dtype != object:
+        return price
+    if rent:
+        return map_unique(price, lambda text: _parse_with_units(text, _RENT_PATTERN, RENT_UNITS, clean_rent))
+    return map_unique(price, lambda text: _parse_with_units(text, _PRICE_PATTERN, PRICE_UNITS, clean_price))
+
+
+def clean_area_column(area):
+    """
+    Vectorized clean_area over the "Area" column.
+
+    Args:
+        area (pd.Series): The raw "Area" column.
+    Returns:
+        pd.Series: The cleaned column.
+    """
+    if area.dtype != object:
+        return area
+    return map_unique(area, lambda text: _parse_with_units(text, _AREA_PATTERN, {"m²": 1.0}, clean_area))
+
+
+def _strip_price_per_m2(value):
+    return re.sub(r'\s*tr/m²', '', value).replace(",", ".")
+
+
+def clean_price_per_m2_column(price_per_m2):
+    """
+    Vectorized cleaning of the "Price per m²" column: "52,73 tr/m²" becomes 52.73.
+
+    The number is converted with pd.to_numeric, as it always has been, since
+    that parser can differ from float() in the last bit.
+
+    Args:
+        price_per_m2 (pd.Series): The "Price per m²" values (nghìn/tỉ/đồng per m² already removed).
+    Returns:
+        pd.Series: Float series, NaN where the value does not parse.
+    """
+    def parse(text):
+        numbers = text.str.extract(_PRICE_PER_M2_PATTERN)[0]
+        matched = numbers.notna()
+        numbers[matched] = numbers[matched].str.replace(",", ".", regex=False)
+        numbers[~matched] = text[~matched].map(_strip_price_per_m2)
+        return pd.to_numeric(numbers, errors='coerce')
+
+    return map_unique(price_per_m2.astype(str), parse)
+
+
+def round_like_python(values, ndigits):
+    """
+    Round a float array exactly like the builtin round(x, ndigits).
+
+    np.round scales by 10**ndigits first, which can pick the other side of a
+    near-tie, so those few values are redone with round().
+
+    Args:
+        values (pd.Series): Float values.
+        ndigits (int): Number of decimals.
+    Returns:
+        pd.Series: The rounded values.
+    """
+    scale = 10.0 ** ndigits
+    scaled = values.to_numpy(dtype=float) * scale
+    rounded = np.round(scaled) / scale
+    fraction = np.abs(scaled - np.floor(scaled) - 0.5)
+    near_tie = fraction < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(float(x), ndigits) for x in values.to_numpy(dtype=float)[near_tie]]
+    return pd.Series(rounded, index=values.index)
+
+
+def read_district_file(file):
+    """
+    Read one district CSV file.
+
+    Args:
+        file (str): Path of the district CSV file.
+    Returns:
+        pd.DataFrame: The listings, or None if the file is missing, empty or unreadable.
+    """
+    if not os.path.exists(file):
+        print(f"File does not exist: {file}")
+        return None
+    # Check if file is empty (0 bytes)
+    if os.path.getsize(file) == 0:
+        print(f"Skipping empty file (0 bytes): {file}")
+        return None
+    try:
+        df = pd.read_csv(file)  # Read the CSV file into a DataFrame
+    except pd.errors.EmptyDataError:
+        print(f"Skipping completely empty file (no headers): {file}")
+        return None
+    except Exception as e:
+        print(f"Error reading {file}: {e}")
+        return None
+    if df.empty:
+        print(f"Skipping file with no data (but has headers): {file}")
+        return None
+    print(f"Loaded data from: {file}")
+    return df
+
+
+def load_district_files(district_files):
+    """
+    Read the district CSV files that exist and hold data.
+
+    Args:
+        district_files (list): Paths of the district CSV files.
+    Returns:
+        list: One DataFrame per readable, non-empty file.
+    """
+    dfs = [read_district_file(file) for file in district_files]
+    return [df for df in dfs if df is not None]
+
+
+def prepare_district_frame(df, rent=False):
+    """
+    The row-by-row part of the processing, done on one district file.
+
+    Counts the empty cells of each raw row, flags the rows whose "Price per m²"
+    is in nghìn/tỉ/đồng per m², and cleans "Price per m²", "Price" and "Area".
+    Nothing is dropped here: which rows survive and in what order is decided
+    on the whole dataset by merge_prepared_frames.
+
+    Args:
+        df (pd.DataFrame): The raw listings of one district file.
+        rent (bool): The listings are rentals, priced by the month (see clean_rent).
+    Returns:
+        pd.DataFrame: The cleaned listings, with the EMPTY_COUNT and OTHER_UNIT helper columns.
+    """
+    df = df.copy()
+    # Count the number of empty cells (NaN) per row
+    empty_count = df.isna().sum(axis=1)
+
+    other_unit = pd.Series(False, index=df.index)
+    if "Price per m²" in df.columns:
+        other_unit = df["Price per m²"].astype(str).str.contains(DROPPED_PRICE_PER_M2_UNITS, na=False)
+        df["Price per m²"] = clean_price_per_m2_column(df["Price per m²"])
+
+    if "Price" in df.columns:
+        df["Price"] = clean_price_column(df["Price"], rent)
+
+    if "Area" in df.columns:
+        df["Area"] = clean_area_column(df["Area"])
+
+    df[EMPTY_COUNT] = empty_count
+    df[OTHER_UNIT] = other_unit
+    return df
+
+
+def merge_prepared_frames(frames, rent=False):
+    """
+    Merge cleaned district files and apply the rules that need the whole dataset:
+    sorting, dropping duplicate listings and the "calc price" check.
+
+    Args:
+        frames (list): DataFrames from prepare_district_frame, in district file order.
+        rent (bool): The listings are rentals (see finish_merged_rows).
+    Returns:
+        pd.DataFrame: The merged listings, ready to be saved.
+    """
+    # A column some files lack is empty in their rows once concatenated
+    columns = []
+    for frame in frames:
+        columns += [c for c in frame.columns if c not in columns and c not in HELPER_COLUMNS]
+    missing = [len(columns) - (len(frame.columns) - len(HELPER_COLUMNS)) for frame in frames]
 
-    # Check if there’s any data to process
-    if not dfs:
-        print("No valid data to process. Exiting.")
-        return
     # Concatenate all dataframes into one
-    merged_df = pd.concat(dfs, ignore_index=True)
-    
-    # Remove duplicates based on "Product ID" and "Date Posted", keeping the first occurrence
-    # if "Id" in merged_df.columns and "Date Posted" in merged_df.columns:
-    #     initial_rows = len(merged_df)
-    #     merged_df = merged_df.drop_duplicates(subset=["Id", "Date Posted"], keep='first')
-    #     duplicates_removed = initial_rows - len(merged_df)
-    #     print(f"Removed {duplicates_removed} duplicate rows based on 'Product ID' and 'Date Posted'.")
+    merged_df = pd.concat(frames, ignore_index=True)
+    if any(missing):
+        merged_df[EMPTY_COUNT] += np.repeat(missing, [len(frame) for frame in frames])
 
     # Ensure "Location" column exists before sorting
     if "Location" in merged_df.columns:
         # Sort by "Location" in ascending alphabetical order
         merged_df = merged_df.sort_values(by="Location", ascending=True)
 
-    # Count the number of empty cells (NaN) per row
-    merged_df["empty_count"] = merged_df.isna().sum(axis=1)
-
     # Remove rows that have 3 or more empty cells
-    merged_df = merged_df[merged_df["empty_count"] < 3]
+    merged_df = merged_df[merged_df[EMPTY_COUNT] < 3]
 
     # Sort: 
     # 1️⃣ Rows with no empty cells first
     # 2️⃣ Then rows with 1 or more empty cells at the bottom
-    merged_df = merged_df.sort_values(by=["empty_count", "Location"], ascending=[True, True]).drop(columns=["empty_count"])
-
-    # Clean "Price per m²" column
-    if "Price per m²" in merged_df.columns:
-        # Separate rows with nghìn/m², tỉ/m², đồng/m² and keep them at the bottom
-        nghin_ti_dong_rows = merged_df[merged_df["Price per m²"].astype(str).str.contains(r'nghìn/m²|tỉ/m²|đồng/m²', na=False)]
-        valid_rows = merged_df[~merged_df["Price per m²"].astype(str).str.contains(r'nghìn/m²|tỉ/m²|đồng/m²', na=False)]
-        
-        # Clean the valid rows (those that are not nghìn/m², tỉ/m², đồng/m²)
-        valid_rows.loc[:, "Price per m²"] = valid_rows["Price per m²"].astype(str).apply(lambda x: re.sub(r'\s*tr/m²', '', x))  # Remove tr/m²
-        valid_rows.loc[:, "Price per m²"] = valid_rows["Price per m²"].apply(lambda x: x.replace(",", "."))  # Replace commas with periods
-        valid_rows.loc[:, "Price per m²"] = pd.to_numeric(valid_rows["Price per m²"], errors='coerce')  # Convert to float
-        
-        # Concatenate the valid rows and nghìn/tỉ/dồng rows (with nghìn/tỉ/dồng at the bottom)
-        merged_df = pd.concat([valid_rows, nghin_ti_dong_rows], ignore_index=True)
-    # Remove rows where 'Price per m²' contain "nghìn", "tỉ", or "đồng"
-    merged_df = merged_df[~merged_df["Price per m²"].str.contains("nghìn|tỉ|đồng", na=False)]
-
-    if "Price" in merged_df.columns:
-        # Define a function to clean and process the price values
-        def clean_price(price):
-            if isinstance(price, str):
-                # Check if "Giá thỏa thuận", if yes, return the same value
-                if "Giá thỏa thuận" in price:
-                    return price
-                
-                # Remove "tỉ", replace "," with ".", and convert to float
-                if "tỷ" in price:
-                    price = re.sub(r"\s*tỷ", "", price)  # Remove "tỉ"
-                    price = price.replace(",", ".")  # Replace comma with period
-                    try:
-                        return float(price)  # Convert to float and multiply by 1 million (tỉ to đồng)
-                    except ValueError:
-                        return None  # Handle cases where conversion fails
-                
-                # Remove "triệu", replace "," with ".", convert to float, and divide by 1000
-                if "triệu" in price:
-                    price = re.sub(r"\s*triệu", "", price)  # Remove "triệu"
-                    price = price.replace(",", ".")  # Replace comma with period
-                    try:
-                        return float(price) / 1000  # Convert to float and multiply by 1000 (triệu to đồng)
-                    except ValueError:
-                        return None  # Handle cases where conversion fails
-            return price  # Return the price as is if no conditions match
-
-        # Apply the cleaning function to the "Price" column
-        merged_df["Price"] = merged_df["Price"].apply(clean_price)
-        
-    if "Area" in merged_df.columns:
-        # Define a function to clean and process the area values
-        def clean_area(area):
-            if isinstance(area, str):
-                area = area.replace("m²", "")  # Remove "m²"
-                area = area.replace(",", ".")  # Replace comma with period
-                try:
-                    return float(area)  # Convert to float
-                except ValueError:
-                    return None  # Handle cases where conversion fails
-            return area  # Return the value as is if it's not a string
-
-        # Apply the cleaning function to the "Area" column
-        merged_df["Area"] = merged_df["Area"].apply(clean_area)
+    merged_df = merged_df.sort_values(by=[EMPTY_COUNT, "Location"], ascending=[True, True])
+
+    # Drop rows priced in nghìn/m², tỉ/m² or đồng/m²
+    merged_df = merged_df[~merged_df[OTHER_UNIT]].drop(columns=HELPER_COLUMNS).reset_index(drop=True)
 
     # Remove all duplicate rows (not keeping any)
     merged_df = merged_df[~merged_df.duplicated(keep=False)]
+    return finish_merged_rows(merged_df, rent)
 
-    # Convert "Price" to string first to ensure compatibility for replacement
-    merged_df["Price"] = merged_df["Price"].astype(str)
 
-    # Replace "Giá thỏa thuận" with -1, then convert to float
-    merged_df["Price"] = merged_df["Price"].replace("Giá thỏa thuận", -1, regex=False)
-    merged_df["Price"] = pd.to_numeric(merged_df["Price"], errors='coerce')  # Convert to float, errors become NaN
+def finish_merged_rows(merged_df, rent=False):
+    """
+    The last, row-by-row steps of the merge: convert "Price", "Price per m²" and
+    "Area" to numbers, add "calc price" and drop the rows that fail the check.
 
-    # Convert "Price per m²" to float
-    merged_df["Price per m²"] = pd.to_numeric(merged_df["Price per m²"], errors='coerce')
-    merged_df["Price per m²"] = merged_df["Price per m²"].replace(np.nan, 0)
-    # Convert "Area" to float
-    merged_df["Area"] = merged_df["Area"].replace(" m²", "")  # Remove "m²" if exists
-    merged_df["Area"] = pd.to_numeric(merged_df["Area"], errors='coerce')
+    Rentals have no "Price per m²" to check their rent against: their "calc
+    price" is left empty, and only the rows whose rent did not parse are dropped.
 
-    merged_df.insert(merged_df.columns.get_loc("Price per m²") + 1, "calc price", None)
+    Args:
+        merged_df (pd.DataFrame): Merged listings, duplicates already removed.
+        rent (bool): The listings are rentals.
+    Returns:
+        pd.DataFrame: The listings, ready to be saved.
+    """
+    # Replace "Giá thỏa thuận" with -1 and convert "Price" to float. This goes through
+    # str on purpose: pandas' parser is not correctly rounded, and the saved values
+    # have always been the result of that round trip.
+    price = merged_df["Price"].astype(str)
+    merged_df["Price"] = pd.to_numeric(price.mask(price == "Giá thỏa thuận", -1), errors='coerce')
 
-    # Ensure "Price per m²" and "Area" are numeric, then calculate "calc price"
-    merged_df["Price per m²"] = pd.to_numeric(merged_df["Price per m²"], errors='coerce')
+    # "Price per m²" is already float: missing values become 0
+    merged_df["Price per m²"] = merged_df["Price per m²"].fillna(0)
+    # Convert "Area" to float
     merged_df["Area"] = pd.to_numeric(merged_df["Area"], errors='coerce')
 
-    # Calculate the "calc price" and insert it into the column
-    merged_df["calc price"] = (merged_df["Price per m²"] * merged_df["Area"]) / 1000
-    merged_df["calc price"] = merged_df["calc price"].apply(lambda x: round(x, 2))
-    merged_df["calc price"] = (merged_df["calc price"] - merged_df["Price"]).apply(lambda x: round(x, 3))
+    if rent:
+        merged_df.insert(merged_df.columns.get_loc("Price per m²") + 1, "calc price", np.nan)
+        return merged_df[merged_df["Price"].notna()]
+
+    # Calculate the "calc price" and insert it after "Price per m²"
+    calc_price = round_like_python((merged_df["Price per m²"] * merged_df["Area"]) / 1000, 2)
+    calc_price = round_like_python(calc_price - merged_df["Price"], 3)
+    merged_df.insert(merged_df.columns.get_loc("Price per m²") + 1, "calc price", calc_price)
 
     # Remove rows where "calc price" deviates too much from 0, except for -1
     tolerance = 1.1  # Define a tolerance level
-    merged_df = merged_df[(merged_df["calc price"].abs() <= tolerance) | (merged_df["calc price"] == -1)]
+    return merged_df[(merged_df["calc price"].abs() <= tolerance) | (merged_df["calc price"] == -1)]
+
+
+def process_real_estate_data(district_files=None, output_path=MERGED_FILE, incremental=False,
+                             cache_dir=MERGE_CACHE_DIR, columnar=False, cube=False, near_duplicates=False,
+                             history=False, rent=False):
+    """
+    This function processes real estate data from multiple CSV files, cleans and merges them into a single DataFrame.
+
+    In incremental mode the cleaned rows of each district file are kept in
+    cache_dir, and only the files that changed since the last run are read
+    and cleaned again. The merge itself always runs on the whole dataset,
+    so the output is the same as a full run. If no file changed and the
+    merged CSV is the one the last run wrote, nothing is done.
+
+    With columnar=True the merged listings are also written as a Parquet
+    dataset partitioned by district and an Arrow IPC file, typed and with
+    float latitude/longitude and integer district and ward IDs, in a
+    "parquet" directory next to output_path (see columnar.py), along with
+    Parquet copies of the reference tables. Ward IDs are kept in a
+    wards.csv next to output_path so they stay the same between runs.
+    pyarrow is only needed in this mode.
+
+    With cube=True the analytics cube in a "cube" directory next to
+    output_path is brought up to date; only the cells of listings that were
+    added, changed or dropped are computed again (see analytics_cube.py).
+
+    With near_duplicates=True the same apartment posted several times under
+    different Ids and slightly different titles is kept only once (see
+    near_duplicates.py); which listings were dropped, and the Id of the one
+    kept in their place, go to a near_duplicates.csv next to output_path.
+
+    With history=True the merged listings are also recorded as today's
+    snapshot in a history.sqlite next to output_path, which keeps every
+    version of every listing (see history.py).
+
+    With rent=True the listings are rentals: "Price" is the monthly rent in
+    triệu, and the "calc price" check is skipped (see finish_merged_rows).
+    
+    Args:
+        district_files (list): The district CSV files (defaults to DISTRICT_FILES).
+        output_path (str): Where the merged CSV is written.
+        incremental (bool): Reuse the cleaned rows of unchanged district files.
+        cache_dir (str): Where the incremental mode keeps its manifest and cleaned rows.
+        columnar (bool): Also write the columnar copies.
+        cube (bool): Also update the analytics cube.
+        near_duplicates (bool): Also drop near-duplicate listings.
+        history (bool): Also record the listings in the listing history.
+        rent (bool): The listings are rentals, priced by the month.
+    
+    Returns:
+        None
+    """
+    if columnar:
+        from columnar import LISTINGS_ARROW, write_listings, write_reference_tables
+    if cube:
+        from analytics_cube import CELLS_FILE, refresh_cube
+    district_files = district_files or DISTRICT_FILES
+    columnar_dir = os.path.join(os.path.dirname(output_path), "parquet")
+    cube_dir = os.path.join(os.path.dirname(output_path), "cube")
+    clusters_path = os.path.join(os.path.dirname(output_path), NEAR_DUPLICATES_FILE)
+    if incremental:
+        cache = MergeCache(cache_dir, version=PREPARED_VERSION + ("-rent" if rent else ""))
+        reparsed = cache.refresh(district_files, read_district_file, lambda df: prepare_district_frame(df, rent))
+        if not reparsed and cache.output_is_current(output_path) and (
+                not columnar or os.path.exists(os.path.join(columnar_dir, LISTINGS_ARROW))) and (
+                not cube or os.path.exists(os.path.join(cube_dir, CELLS_FILE))) and (
+                not near_duplicates or os.path.exists(clusters_path)):
+            cache.save()
+            print(f"No district file has changed: '{output_path}' is up to date.")
+            return None
+        print(f"{len(reparsed)} of {len(district_files)} district files re-parsed.")
+        frames = cache.frames()
+    else:
+        frames = [prepare_district_frame(df, rent) for df in load_district_files(district_files)]
+
+    # Check if there’s any data to process
+    if not frames:
+        print("No valid data to process. Exiting.")
+        return
+    merged_df = merge_prepared_frames(frames, rent)
+    if near_duplicates:
+        merged_df, clusters = drop_near_duplicates(merged_df)
+        atomic_to_csv(clusters, clusters_path, index=False)
 
     # Save the sorted dataframe back to a CSV
-    merged_df.to_csv('data/merged_real_estate_listings.csv', index=False)
+    atomic_to_csv(merged_df, output_path, index=False)
+    if incremental:
+        cache.record_output(output_path)
+    if columnar:
+        wards = WardTable(os.path.join(os.path.dirname(output_path), "wards.csv"))
+        write_listings(merged_df, columnar_dir, wards)
+        wards.save()
+        write_reference_tables(os.path.dirname(output_path) or ".", columnar_dir)
+    if cube:
+        refresh_cube(merged_df, cube_dir)
+    if history:
+        listing_history = ListingHistory(os.path.join(os.path.dirname(output_path), HISTORY_FILE))
+        changes = listing_history.record(merged_df)
+        listing_history.close()
 
     print("✔ Data has been merged, sorted alphabetically by 'Location'.")
     print("✔ Rows with 3 or more empty cells have been removed.")
@@ -189,9 +527,20 @@ def process_real_estate_data():
     print("✔ 'Price' column has been cleaned.")
     print("✔ 'Area' column has been cleaned.")
     print("✔ Duplicate rows have been removed.")
+    if near_duplicates:
+        print(f"✔ {(~clusters['Kept']).sum()} near-duplicate listings have been removed, "
+              f"clusters saved to '{clusters_path}'.")
     print("✔ 'Giá thỏa thuận' values have been replaced with -1 in 'Price' column.")
-    print("✔ 'calc price' column has been calculated and added.")
-    print("✔ Rows with 'calc price' deviating too much from 0 have been removed.")
-    print("✔ Final data has been saved to 'data/merged_real_estate_listings.csv'.")
+    if rent:
+        print("✔ Rows whose monthly rent could not be parsed have been removed.")
+    else:
+        print("✔ 'calc price' column has been calculated and added.")
+        print("✔ Rows with 'calc price' deviating too much from 0 have been removed.")
+    print(f"✔ Final data has been saved to '{output_path}'.")
+    if columnar:
+        print(f"✔ Columnar copies have been saved to '{columnar_dir}'.")
+    if history:
+        print(f"✔ Snapshot recorded in the listing history: {changes['new']} new, {changes['changed']} changed, "
+              f"{changes['removed']} removed listings.")
     
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,322 @@
+import asyncio
+import re
+import threading
+import time
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from driver_pool import DriverPool
+from metrics import count, stage_timer
+from throttle import AdaptiveFetcher, AimdController, RetryPolicy, classify
+
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
+
+# Result of fetching one page, whatever the backend.
+#   ok:     True if the page loaded and contains the element we waited for
+#   text:   the page source (also set when ok is False, for debugging)
+#   title:  the document title ("" if unknown)
+#   status: the HTTP status code (None for Selenium, which does not expose it)
+#   timed_out: True if the browser gave up waiting for the element (a slow
+#              page, or one without it: see throttle.AdaptiveFetcher)
+FetchResult = namedtuple("FetchResult", ["url", "ok", "text", "title", "status", "backend", "timed_out"],
+                         defaults=(False,))
+
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+def has_class(page_source, class_name):
+    """
+    Cheap check whether an element with the given class is in the HTML.
+
+    Args:
+        page_source (str): The HTML to search.
+        class_name (str): The CSS class to look for.
+    Returns:
+        bool: True if some class attribute contains class_name.
+    """
+    pattern = r"""class\s*=\s*["'][^"']*(?<![\w-])""" + re.escape(class_name) + r"""(?![\w-])"""
+    return re.search(pattern, page_source) is not None
+
+
+class SeleniumFetcher:
+    """
+    Fetcher backed by a DriverPool of Chrome WebDrivers.
+
+    Drivers are started lazily on first use, so an HttpFetcher can hold one
+    as a fallback without paying the browser startup unless a page needs JS.
+    A driver loads one page at a time, so at most pool.size pages load at once.
+    """
+
+    backend = "selenium"
+
+    def __init__(self, driver_factory, timeout=10, pool=None):
+        """
+        Args:
+            driver_factory (callable): Returns a new WebDriver (e.g. scraping.setup_driver).
+            timeout (int): Seconds to wait for the expected element.
+            pool (DriverPool): Drivers shared with other fetchers, left open by close;
+                by default the fetcher has a pool of one driver of its own.
+        Returns:
+            None
+        """
+        self.driver_factory = driver_factory
+        self.timeout = timeout
+        self.owns_pool = pool is None
+        self.pool = pool if pool is not None else DriverPool(driver_factory)
+
+    def fetch(self, url, wait_for_class):
+        """
+        Load a page and wait until an element with wait_for_class is present.
+
+        Args:
+            url (str): The URL to load.
+            wait_for_class (str): The class name of the element to wait for.
+        Returns:
+            FetchResult: The loaded page; on timeout ok is False and timed_out True.
+        """
+        with self.pool.driver() as driver:
+            with stage_timer("page_load"):
+                driver.get(url)
+            try:
+                with stage_timer("wait"):
+                    WebDriverWait(driver, self.timeout).until(
+                        EC.presence_of_element_located((By.CLASS_NAME, wait_for_class))
+                    )
+                ok = True
+            except TimeoutException as e:
+                print(f"Timeout waiting for {wait_for_class} on {url}: {e}")
+                count("scraper_timeouts_total", backend=self.backend)
+                ok = False
+            return FetchResult(url, ok, driver.page_source, driver.title, None, self.backend, timed_out=not ok)
+
+    async def afetch(self, url, wait_for_class):
+        """
+        Async wrapper around fetch that runs the blocking driver in a thread.
+        """
+        return await asyncio.to_thread(self.fetch, url, wait_for_class)
+
+    async def afetch_many(self, urls, wait_for_class):
+        """
+        Fetch several URLs, as many at once as the pool has drivers, keeping the input order.
+        """
+        if self.pool.size == 1:
+            return [await self.afetch(url, wait_for_class) for url in urls]
+        return await asyncio.gather(*(self.afetch(url, wait_for_class) for url in urls))
+
+    def fetch_many(self, urls, wait_for_class):
+        return asyncio.run(self.afetch_many(urls, wait_for_class))
+
+    def close(self):
+        """
+        Quit the drivers, unless the pool is shared.
+        """
+        if self.owns_pool:
+            self.pool.close()
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to the same host to at most rate_per_host per second.
+
+    The schedule is kept under a threading lock and the wait happens with
+    asyncio.sleep, so one limiter can be shared by several event loops.
+    """
+
+    def __init__(self, rate_per_host):
+        self.interval = 1.0 / rate_per_host if rate_per_host else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host):
+        """
+        Reserve the next free slot for host.
+
+        Args:
+            host (str): The host name.
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+            return slot - now
+
+    async def wait(self, host):
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class HttpFetcher:
+    """
+    Plain-HTTP fetcher driven by asyncio.
+
+    Requests go through one pooled requests.Session whose blocking calls run
+    on a private thread pool, with an asyncio semaphore for the concurrency
+    limit and a HostRateLimiter for per-host pacing. Pages whose HTML lacks the
+    element we wait for (i.e. they need JS) are handed to the fallback fetcher,
+    normally a SeleniumFetcher; block pages, HTTP errors and timeouts are
+    not, since the browser would get the same answer (AdaptiveFetcher
+    retries them instead).
+    """
+
+    backend = "http"
+
+    def __init__(self, concurrency=8, rate_per_host=4.0, timeout=10, fallback=None, headers=None,
+                 final_page_markers=()):
+        """
+        Args:
+            concurrency (int): Maximum number of requests in flight.
+            rate_per_host (float): Maximum requests per second to one host (0 disables pacing).
+            timeout (int): Request timeout in seconds.
+            fallback (SeleniumFetcher): Fetcher for pages that need JS, or None.
+            headers (dict): Extra HTTP headers.
+            final_page_markers (tuple): Strings that mark a complete page without
+                the expected element (e.g. "no results"), which must not be
+                retried in the browser.
+        Returns:
+            None
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.fallback = fallback
+        self.final_page_markers = final_page_markers
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept-Language": "vi-VN,vi;q=0.9,en;q=0.8",
+        })
+        if headers:
+            self.session.headers.update(headers)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="http-fetch")
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        # asyncio primitives are bound to the loop that first uses them
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
+    def _get(self, url):
+        try:
+            with stage_timer("page_load"):
+                response = self.session.get(url, timeout=self.timeout)
+        except requests.Timeout as e:
+            print(f"HTTP timeout fetching {url}: {e}")
+            count("scraper_timeouts_total", backend=self.backend)
+            return None, ""
+        except requests.RequestException as e:
+            print(f"HTTP error fetching {url}: {e}")
+            return None, ""
+        if "charset" not in response.headers.get("Content-Type", ""):
+            response.encoding = "utf-8"  # requests would guess ISO-8859-1 for text/html
+        return response.status_code, response.text
+
+    async def afetch(self, url, wait_for_class):
+        """
+        Fetch a page over HTTP, falling back to the browser if it needs JS.
+
+        Args:
+            url (str): The URL to load.
+            wait_for_class (str): The class name that marks a usable page.
+        Returns:
+            FetchResult: The loaded page.
+        """
+        async with self._semaphore():
+            await self.rate_limiter.wait(urlsplit(url).netloc)
+            loop = asyncio.get_running_loop()
+            status, text = await loop.run_in_executor(self._executor, self._get, url)
+
+        ok = status == 200 and has_class(text, wait_for_class)
+        needs_js = classify(status, text, ok, self.final_page_markers) == "missing"
+        if needs_js and self.fallback is not None:
+            count("scraper_fallbacks_total")
+            return await self.fallback.afetch(url, wait_for_class)
+        match = _TITLE_RE.search(text)
+        title = match.group(1).strip() if match else ""
+        return FetchResult(url, ok, text, title, status, self.backend)
+
+    async def afetch_many(self, urls, wait_for_class):
+        """
+        Fetch several URLs concurrently, keeping the input order.
+        """
+        return await asyncio.gather(*(self.afetch(url, wait_for_class) for url in urls))
+
+    def fetch(self, url, wait_for_class):
+        """
+        Blocking version of afetch.
+        """
+        return asyncio.run(self.afetch(url, wait_for_class))
+
+    def fetch_many(self, urls, wait_for_class):
+        """
+        Blocking version of afetch_many.
+        """
+        return asyncio.run(self.afetch_many(urls, wait_for_class))
+
+    def close(self):
+        """
+        Close the HTTP session, the thread pool and the fallback fetcher.
+        """
+        self.session.close()
+        self._executor.shutdown(wait=False)
+        self._semaphores.clear()
+        if self.fallback is not None:
+            self.fallback.close()
+
+
+def make_fetcher(backend, driver_factory, concurrency=8, rate_per_host=4.0, timeout=10, final_page_markers=(),
+                 pool=None, retries=3, adaptive=True, retry_wait_timeouts=("re__srp-list",)):
+    """
+    Build the fetcher for a backend name.
+
+    Args:
+        backend (str): "selenium" for the browser only, "http" for HTTP first
+            with the browser as fallback for pages that need JS.
+        driver_factory (callable): Returns a new WebDriver.
+        concurrency (int): HTTP requests in flight (http backend only).
+        rate_per_host (float): HTTP requests per second per host (http backend only).
+        timeout (int): Page load / wait timeout in seconds.
+        final_page_markers (tuple): See HttpFetcher.
+        pool (DriverPool): Warm drivers to use instead of starting new ones
+            (the fetcher does not close it).
+        retries (int): Extra attempts for pages that time out, fail or are blocked.
+        adaptive (bool): Wrap the fetcher in a throttle.AdaptiveFetcher, which
+            retries with backoff and adjusts the fetches in flight (up to
+            concurrency, or the pool size in the browser) to the latency and
+            errors it sees.
+        retry_wait_timeouts (tuple): The elements a browser wait that ran out
+            on is retried for (default: the search results list); see AdaptiveFetcher.
+    Returns:
+        AdaptiveFetcher, SeleniumFetcher or HttpFetcher: The fetcher.
+    """
+    if backend == "selenium":
+        fetcher = SeleniumFetcher(driver_factory, timeout=timeout, pool=pool)
+        maximum = fetcher.pool.size
+    elif backend == "http":
+        fallback = SeleniumFetcher(driver_factory, timeout=timeout, pool=pool)
+        fetcher = HttpFetcher(concurrency=concurrency, rate_per_host=rate_per_host, timeout=timeout,
+                              fallback=fallback, final_page_markers=final_page_markers)
+        maximum = concurrency
+    else:
+        raise ValueError(f"Unknown fetch backend: {backend}")
+    if not adaptive:
+        return fetcher
+    return AdaptiveFetcher(fetcher, AimdController(maximum=maximum), RetryPolicy(attempts=retries + 1),
+                           final_page_markers=final_page_markers, retry_wait_timeouts=retry_wait_timeouts)
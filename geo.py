@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from columnar import split_coordinates
+
+EARTH_RADIUS_KM = 6371
+# Hoàn Kiếm Lake, the city centre the analysis measures distances from
+CENTER_LAT, CENTER_LON = 21.0285, 105.8521
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance, element-wise over arrays.
+
+    The same formula as the scalar haversine the analysis notebook used, but
+    any argument can be an array, a Series or a scalar, and they broadcast.
+
+    Args:
+        lat1, lon1 (array-like): First points, in degrees.
+        lat2, lon2 (array-like): Second points, in degrees.
+    Returns:
+        np.ndarray or pd.Series: Distances in km (a Series, with its index, if lat1 is one).
+    """
+    index = lat1.index if isinstance(lat1, pd.Series) else None
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return pd.Series(distance, index=index) if index is not None else distance
+
+
+def _unit_vectors(lat, lon):
+    # Points on the unit sphere: the straight-line (chord) distance between two of
+    # them grows with their great-circle distance, so a k-d tree over these
+    # answers great-circle queries exactly
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float), np.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def coordinates_of(df):
+    """
+    Args:
+        df (pd.DataFrame): Listings with "Latitude"/"Longitude" columns, or a "Coordinates" column.
+    Returns:
+        tuple: (latitude, longitude) float Series.
+    """
+    if "Latitude" in df.columns and "Longitude" in df.columns:
+        return pd.to_numeric(df["Latitude"], errors="coerce"), pd.to_numeric(df["Longitude"], errors="coerce")
+    return split_coordinates(df["Coordinates"])
+
+
+class ListingIndex:
+    """
+    A k-d tree over listing coordinates for nearest-neighbour, radius and
+    comparable-listing queries.
+
+    Listings without coordinates are left out of the tree. Queries return the
+    positions of listings in the frame the index was built from, with
+    great-circle distances in km.
+    """
+
+    def __init__(self, df, leafsize=32):
+        """
+        Args:
+            df (pd.DataFrame): Listings, with coordinates as coordinates_of reads them.
+            leafsize (int): Points per leaf of the tree.
+        Returns:
+            None
+        """
+        self.df = df
+        lat, lon = coordinates_of(df)
+        self.latitude = lat.to_numpy()
+        self.longitude = lon.to_numpy()
+        # Numeric copies of the columns comparables filters on
+        self.area = self._numeric_column("Area")
+        self.bedrooms = self._numeric_column("Bedrooms")
+        valid = ~(np.isnan(self.latitude) | np.isnan(self.longitude))
+        self.positions = np.flatnonzero(valid)  # tree point -> row position in df
+        self.tree = cKDTree(_unit_vectors(self.latitude[valid], self.longitude[valid]), leafsize=leafsize)
+
+    def _numeric_column(self, column):
+        if column not in self.df.columns:
+            return np.full(len(self.df), np.nan)
+        return pd.to_numeric(self.df[column], errors="coerce").to_numpy(dtype=float)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        The k listings closest to a point, or to each of several points.
+
+        Args:
+            lat, lon (float or array-like): Query point(s), in degrees.
+            k (int): Number of neighbours.
+        Returns:
+            tuple: (positions, distances_km), each shaped (k,) for one point or (n, k)
+                for n points. Where fewer than k listings exist, positions are -1 and
+                distances inf.
+        """
+        single = np.ndim(lat) == 0
+        points = _unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))
+        if not len(self.positions):
+            # No listing has coordinates: nothing to query
+            positions, distances = np.full((len(points), k), -1), np.full((len(points), k), np.inf)
+            return (positions[0], distances[0]) if single else (positions, distances)
+        chord, found = self.tree.query(points, k=[i + 1 for i in range(k)])
+        missing = found >= len(self.positions)
+        positions = np.where(missing, -1, self.positions[np.minimum(found, max(len(self.positions) - 1, 0))])
+        distances = np.where(missing, np.inf, _chord_to_km(chord))
+        return (positions[0], distances[0]) if single else (positions, distances)
+
+    def within(self, lat, lon, radius_km):
+        """
+        Every listing within radius_km of a point, closest first.
+
+        Args:
+            lat, lon (float): Query point, in degrees.
+            radius_km (float): Search radius.
+        Returns:
+            tuple: (positions, distances_km) arrays.
+        """
+        found = np.asarray(self.tree.query_ball_point(_unit_vectors([lat], [lon])[0], _km_to_chord(radius_km)),
+                           dtype=np.intp)
+        positions = self.positions[found]
+        distances = haversine(lat, lon, self.latitude[positions], self.longitude[positions])
+        order = np.argsort(distances, kind="stable")
+        return positions[order], distances[order]
+
+    def count_within(self, lat, lon, radius_km):
+        """
+        Args:
+            lat, lon (array-like): Query points, in degrees.
+            radius_km (float): Search radius.
+        Returns:
+            np.ndarray: The number of listings within radius_km of each point.
+        """
+        points = _unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))
+        return np.asarray(self.tree.query_ball_point(points, _km_to_chord(radius_km), return_length=True))
+
+    def comparables(self, listing, radius_km=1.0, area_tolerance=0.2, same_bedrooms=True, exclude_self=True):
+        """
+        Listings like a given one nearby: within radius_km, with an area within
+        area_tolerance of its area and, optionally, the same number of bedrooms.
+
+        Args:
+            listing (pd.Series or dict): The listing, with coordinates and "Area"
+                (and "Bedrooms" when same_bedrooms); a row of the indexed frame works.
+            radius_km (float): Search radius.
+            area_tolerance (float): Allowed relative difference in area (0.2 is ±20%).
+            same_bedrooms (bool): Only keep listings with the same number of bedrooms.
+            exclude_self (bool): Leave out the listing itself, if it is in the index.
+        Returns:
+            pd.DataFrame: The comparable rows of the indexed frame, closest first, with a "Distance_km" column.
+        """
+        listing = pd.Series(listing)
+        lat, lon = coordinates_of(listing.to_frame().T)
+        lat, lon = float(lat.iloc[0]), float(lon.iloc[0])
+        if np.isnan(lat) or np.isnan(lon):
+            return self.df.iloc[:0].assign(Distance_km=pd.Series(dtype=float))
+        positions, distances = self.within(lat, lon, radius_km)
+        keep = np.ones(len(positions), dtype=bool)
+        area = pd.to_numeric(pd.Series([listing.get("Area")]), errors="coerce").iloc[0]
+        if area_tolerance is not None and not np.isnan(area):
+            keep &= np.abs(self.area[positions] - area) <= area_tolerance * area
+        if same_bedrooms and "Bedrooms" in listing.index:
+            keep &= self.bedrooms[positions] == pd.to_numeric(pd.Series([listing["Bedrooms"]]), errors="coerce").iloc[0]
+        if exclude_self and listing.name is not None and listing.name in self.df.index:
+            keep &= self.df.index[positions] != listing.name
+        return self.df.iloc[positions[keep]].assign(Distance_km=distances[keep])
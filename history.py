@@ -0,0 +1,227 @@
+import datetime
+import os
+import sqlite3
+
+import pandas as pd
+
+HISTORY_FILE = "history.sqlite"
+
+# valid_to of the versions still on the site: a date after any other, so that
+# "still valid on day X" is one range on the valid_to index
+OPEN = "9999-12-31"
+
+# The columns of a listing kept in each version, as (CSV column, SQL column)
+SNAPSHOT_COLUMNS = [
+    ("Date Posted", "date_posted"),
+    ("Product Title", "title"),
+    ("Price", "price"),
+    ("Area", "area"),
+    ("Price per m²", "price_per_m2"),
+    ("calc price", "calc_price"),
+    ("Bedrooms", "bedrooms"),
+    ("Toilets", "toilets"),
+    ("Location", "location"),
+    ("Coordinates", "coordinates"),
+]
+
+
+def parse_posted_dates(date_posted):
+    """
+    Args:
+        date_posted (pd.Series): "Date Posted" strings, e.g. "17/02/2025".
+    Returns:
+        pd.Series: ISO dates ("2025-02-17"), None where the date does not parse.
+    """
+    dates = pd.to_datetime(date_posted, format="%d/%m/%Y", errors="coerce")
+    return dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None)
+
+
+def _iso(day):
+    if day is None:
+        return datetime.date.today().isoformat()
+    return pd.Timestamp(day).date().isoformat()
+
+
+class ListingHistory:
+    """
+    Append-only history of the listings, one snapshot per scrape, in SQLite.
+
+    Each snapshot stores only what changed since the previous one: a version
+    of a listing is written when its Id first appears or any of its
+    SNAPSHOT_COLUMNS changes, and is valid from that scrape until the scrape
+    that changed or no longer had it (valid_to, OPEN while it is still up).
+    A version is never rewritten, apart from closing its validity once
+    (or reopening it when the snapshot that closed it is recorded again).
+
+    Versions are keyed by (Id, valid_from) in a WITHOUT ROWID table, so the
+    price trajectory of a listing is a range read of its own rows; the
+    state as of a day reads the valid_to index from that day on; and
+    "Date Posted" is kept as an ISO date with its own index, so a range of
+    posting dates only reads the listings posted in it.
+    """
+
+    def __init__(self, path=os.path.join("data", HISTORY_FILE)):
+        """
+        Args:
+            path (str): The SQLite file.
+        Returns:
+            None
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = "".join(f" {name}," for _, name in SNAPSHOT_COLUMNS)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            " id INTEGER NOT NULL,"
+            " valid_from TEXT NOT NULL,"
+            " valid_to TEXT NOT NULL,"
+            " posted_on TEXT,"
+            f"{columns}"
+            " row_hash INTEGER NOT NULL,"
+            " PRIMARY KEY (id, valid_from)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS versions_valid_to ON versions (valid_to, valid_from)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS versions_posted_on ON versions (posted_on)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scrapes ("
+            " scraped_on TEXT PRIMARY KEY,"
+            " listings INTEGER NOT NULL,"
+            " new INTEGER NOT NULL,"
+            " changed INTEGER NOT NULL,"
+            " removed INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+
+    def last_scrape(self):
+        """
+        Returns:
+            str: The ISO date of the latest snapshot, or None.
+        """
+        return self.conn.execute("SELECT MAX(scraped_on) FROM scrapes").fetchone()[0]
+
+    def record(self, df, scraped_on=None):
+        """
+        Add a snapshot: the listings on the site on the day of a scrape.
+
+        Only the listings that are new or changed get a new version; the
+        versions of the listings missing from df are closed. Recording the
+        same day again first undoes that day's snapshot (its versions are
+        deleted and the versions it closed reopened), so a re-run of the
+        merge replaces it.
+
+        Args:
+            df (pd.DataFrame): The listings, e.g. as written to the merged CSV
+                (the first row of a repeated Id is kept).
+            scraped_on (date or str): The day of the scrape (default: today).
+                Snapshots must be recorded in order.
+        Returns:
+            dict: Counts of the "new", "changed", "unchanged" and "removed"
+                listings, against the previous day's snapshot (as in scrapes()).
+        """
+        scraped_on = _iso(scraped_on)
+        last = self.last_scrape()
+        if last is not None and scraped_on < last:
+            raise ValueError(f"Snapshot of {scraped_on} is older than the last one ({last})")
+
+        df = df.assign(Id=pd.to_numeric(df["Id"]).astype("int64")).drop_duplicates(subset="Id")
+        values = pd.DataFrame({name: df[column] if column in df.columns else None
+                               for column, name in SNAPSHOT_COLUMNS})
+        # Compare rows through a hash of their text, which does not depend on the dtypes read
+        row_hash = pd.util.hash_pandas_object(values.astype(str), index=False).astype("int64")
+        values = values.astype(object).where(values.notna(), None)
+        ids = df["Id"].tolist()
+
+        with self.conn:
+            if scraped_on == last:
+                # Undo the snapshot of the same day, so this one is compared with the one before
+                self.conn.execute("DELETE FROM versions WHERE valid_from = ?", (scraped_on,))
+                self.conn.execute("UPDATE versions SET valid_to = ? WHERE valid_to = ?", (OPEN, scraped_on))
+            current = dict(self.conn.execute(
+                "SELECT id, row_hash FROM versions WHERE valid_to = ?", (OPEN,)
+            ).fetchall())
+            changed = [i for i, (listing_id, digest) in enumerate(zip(ids, row_hash))
+                       if current.get(listing_id) != digest]
+            removed = current.keys() - set(ids)
+            closed = [listing_id for listing_id in (ids[i] for i in changed) if listing_id in current]
+            # "+valid_to" keeps SQLite on the primary key rather than the index of every open version
+            self.conn.executemany(
+                "UPDATE versions SET valid_to = ? WHERE id = ? AND +valid_to = ?",
+                [(scraped_on, listing_id, OPEN) for listing_id in (*closed, *removed)],
+            )
+            posted_on = parse_posted_dates(df["Date Posted"].iloc[changed]).tolist()
+            new_rows = [
+                (ids[i], scraped_on, OPEN, posted, *row, int(row_hash.iat[i]))
+                for i, posted, row in zip(changed, posted_on, values.iloc[changed].itertuples(index=False, name=None))
+            ]
+            placeholders = ", ".join("?" * (5 + len(SNAPSHOT_COLUMNS)))
+            self.conn.executemany(f"INSERT INTO versions VALUES ({placeholders})", new_rows)
+            counts = {
+                "new": len(changed) - len(closed),
+                "changed": len(closed),
+                "unchanged": len(ids) - len(changed),
+                "removed": len(removed),
+            }
+            self.conn.execute("INSERT OR REPLACE INTO scrapes VALUES (?, ?, ?, ?, ?)",
+                              (scraped_on, len(ids), counts["new"], counts["changed"], counts["removed"]))
+        return counts
+
+    def _frame(self, rows, extra):
+        columns = ["Id", *extra, "Posted On", *(column for column, _ in SNAPSHOT_COLUMNS)]
+        df = pd.DataFrame(rows, columns=columns)
+        df["Posted On"] = pd.to_datetime(df["Posted On"])
+        return df
+
+    def as_of(self, day=None, posted_from=None, posted_to=None):
+        """
+        The listings that were up on a day, as the last scrape before it saw them.
+
+        Args:
+            day (date or str): The day (default: today).
+            posted_from (date or str): Only the listings posted on or after this day.
+            posted_to (date or str): Only the listings posted on or before this day.
+        Returns:
+            pd.DataFrame: "Id", "Posted On" (datetime64) and the CSV columns, by Id.
+        """
+        day = _iso(day)
+        sql = (f"SELECT id, posted_on, {', '.join(name for _, name in SNAPSHOT_COLUMNS)} FROM versions"
+               " WHERE valid_to > ? AND valid_from <= ?")
+        params = [day, day]
+        if posted_from is not None:
+            sql += " AND posted_on >= ?"
+            params.append(_iso(posted_from))
+        if posted_to is not None:
+            sql += " AND posted_on <= ?"
+            params.append(_iso(posted_to))
+        rows = self.conn.execute(sql + " ORDER BY id", params).fetchall()
+        return self._frame(rows, [])
+
+    def trajectory(self, listing_id):
+        """
+        Every version of one listing, oldest first: how its price (and the
+        rest) changed, and from when to when it was up.
+
+        Args:
+            listing_id (int): The listing Id.
+        Returns:
+            pd.DataFrame: "Id", "Valid From", "Valid To" (NaT while still up),
+                "Posted On" and the CSV columns.
+        """
+        rows = self.conn.execute(
+            f"SELECT id, valid_from, valid_to, posted_on, {', '.join(name for _, name in SNAPSHOT_COLUMNS)}"
+            " FROM versions WHERE id = ? ORDER BY valid_from", (listing_id,)
+        ).fetchall()
+        df = self._frame(rows, ["Valid From", "Valid To"])
+        df["Valid From"] = pd.to_datetime(df["Valid From"])
+        df["Valid To"] = pd.to_datetime(df["Valid To"].where(df["Valid To"] != OPEN))
+        return df
+
+    def scrapes(self):
+        """
+        Returns:
+            pd.DataFrame: One row per snapshot, with its counts.
+        """
+        return pd.read_sql_query("SELECT * FROM scrapes ORDER BY scraped_on", self.conn)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,249 @@
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from checkpoint import atomic_to_csv
+
+# The districts the scraper covers, as (URL slug, name). A district's ID is its
+# position in this list, so new districts go at the end.
+DISTRICTS = [
+    ("hoan-kiem", "Hoàn Kiếm"),
+    ("thanh-xuan", "Thanh Xuân"),
+    ("cau-giay", "Cầu Giấy"),
+    ("nam-tu-liem", "Nam Từ Liêm"),
+    ("bac-tu-liem", "Bắc Từ Liêm"),
+    ("hai-ba-trung", "Hai Bà Trưng"),
+    ("dong-da", "Đống Đa"),
+    ("ha-dong", "Hà Đông"),
+    ("hoang-mai", "Hoàng Mai"),
+    ("long-bien", "Long Biên"),
+    ("tay-ho", "Tây Hồ"),
+    ("ba-dinh", "Ba Đình"),
+]
+# The city of DISTRICTS: listings of other cities have no district or ward ID,
+# so the columnar copies, the cube and the valuation only cover this one
+DISTRICTS_CITY = "ha-noi"
+DISTRICT_SLUGS = [slug for slug, _ in DISTRICTS]
+DISTRICT_NAMES = [name for _, name in DISTRICTS]
+# Categorical district names whose codes are the district IDs
+DISTRICT_DTYPE = pd.CategoricalDtype(DISTRICT_NAMES)
+UNKNOWN_ID = -1
+WARDS_FILE = 'data/wards.csv'
+
+# Administrative words around a name: "Quận Cầu Giấy", "Cau Giay district", "Phường Dịch Vọng"
+_PREFIXES = ("quan-", "huyen-", "thi-xa-", "phuong-", "xa-", "thi-tran-")
+_SUFFIXES = ("-district", "-ward", "-quan", "-phuong")
+_DISTRICT_IDS = {slug: i for i, slug in enumerate(DISTRICT_SLUGS)}
+
+
+def slugify(text):
+    """
+    The ASCII slug of a name, as the site uses in its URLs: "Đống Đa" -> "dong-da".
+
+    Args:
+        text (str): A name, with or without diacritics.
+    Returns:
+        str: Lowercase ASCII words joined by "-".
+    """
+    text = unicodedata.normalize("NFKD", str(text).replace("Đ", "D").replace("đ", "d"))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", "-", text).strip("-")
+
+
+def match_key(text):
+    """
+    The slug of a name without "Quận"/"Phường"/"district"-style words, so that
+    the spellings of one place in the listings, the reference tables and the
+    scraper all give the same key.
+
+    Args:
+        text (str): A district or ward name, or a slug.
+    Returns:
+        str: The key.
+    """
+    key = slugify(text)
+    for prefix in _PREFIXES:
+        if key.startswith(prefix) and len(key) > len(prefix):
+            key = key[len(prefix):]
+    for suffix in _SUFFIXES:
+        if key.endswith(suffix) and len(key) > len(suffix):
+            key = key[:-len(suffix)]
+    return key
+
+
+def district_id(name):
+    """
+    Args:
+        name (str): A district name in any spelling match_key handles, or its slug.
+    Returns:
+        int: The district ID, or UNKNOWN_ID.
+    """
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return UNKNOWN_ID
+    return _DISTRICT_IDS.get(match_key(name), UNKNOWN_ID)
+
+
+def district_ids(names):
+    """
+    district_id over a column, matching each distinct name once.
+
+    Args:
+        names (pd.Series): District names.
+    Returns:
+        np.ndarray: int8 district IDs, UNKNOWN_ID where the name is missing or unknown.
+    """
+    codes, uniques = pd.factorize(names)
+    ids = np.array([district_id(name) for name in uniques] + [UNKNOWN_ID], dtype=np.int8)
+    return ids[codes]  # code -1 (missing) picks the trailing UNKNOWN_ID
+
+
+def district_categorical(ids, index=None):
+    """
+    Args:
+        ids (array-like): District IDs.
+        index (pd.Index): Index of the result.
+    Returns:
+        pd.Series: Categorical canonical district names (NaN for UNKNOWN_ID).
+    """
+    return pd.Series(pd.Categorical.from_codes(np.asarray(ids), dtype=DISTRICT_DTYPE), index=index)
+
+
+def split_location(location):
+    """
+    Split "Ward, District" locations, parsing each distinct location once.
+
+    Args:
+        location (pd.Series): The "Location" column.
+    Returns:
+        tuple: (ward names, district IDs): an object array with None where there
+            is no ward part, and an int8 array of district IDs.
+    """
+    codes, uniques = pd.factorize(location)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.split(',')
+    wards = parts.str[0].str.strip().where(parts.str.len() > 1, None)
+    districts = district_ids(parts.str[-1].str.strip())
+    wards = np.append(wards.to_numpy(dtype=object), None)
+    districts = np.append(districts, np.int8(UNKNOWN_ID))
+    return wards[codes], districts[codes]
+
+
+def location_districts(location):
+    """
+    The canonical district of each "Ward, District" location.
+
+    Args:
+        location (pd.Series): The "Location" column.
+    Returns:
+        pd.Series: Categorical district names, NaN where the district is not one of DISTRICTS.
+    """
+    return district_categorical(split_location(location)[1], index=location.index)
+
+
+class WardTable:
+    """
+    Interned ward IDs.
+
+    A ward is identified by its district and the match_key of its name, so
+    spellings with and without diacritics share an ID. IDs are handed out
+    in the order wards are first seen and saved to a CSV, so a ward keeps its
+    ID from one run to the next.
+    """
+
+    def __init__(self, path=WARDS_FILE):
+        """
+        Args:
+            path (str): The CSV of known wards (None keeps the table in memory only).
+        Returns:
+            None
+        """
+        self.path = path
+        self.table = pd.DataFrame({"Ward Id": pd.Series(dtype=np.int32), "District Id": pd.Series(dtype=np.int8),
+                                   "Slug": pd.Series(dtype=object), "Ward": pd.Series(dtype=object)})
+        if path is not None and os.path.exists(path):
+            self.table = pd.read_csv(path, dtype={"Ward Id": np.int32, "District Id": np.int8, "Slug": str,
+                                                  "Ward": str}, keep_default_na=False)
+        self._ids = dict(zip(zip(self.table["District Id"].tolist(), self.table["Slug"].tolist()),
+                             self.table["Ward Id"].tolist()))
+        self._added = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def ward_id(self, district, name):
+        """
+        Args:
+            district (int): District ID.
+            name (str): Ward name.
+        Returns:
+            int: The ward's ID, a new one if it was not known. UNKNOWN_ID without a
+                known district or a name.
+        """
+        if district == UNKNOWN_ID or name is None or not str(name).strip():
+            return UNKNOWN_ID
+        key = (int(district), match_key(name))
+        if key not in self._ids:
+            self._ids[key] = len(self._ids)
+            self._added.append({"Ward Id": self._ids[key], "District Id": key[0], "Slug": key[1],
+                                "Ward": str(name).strip()})
+        return self._ids[key]
+
+    def save(self):
+        """
+        Append the wards seen since loading to the CSV.
+
+        Returns:
+            int: The number of new wards.
+        """
+        added = len(self._added)
+        if self._added:
+            self.table = pd.concat([self.table, pd.DataFrame(self._added).astype(self.table.dtypes.to_dict())],
+                                   ignore_index=True)
+            self._added = []
+        if self.path is not None and (added or not os.path.exists(self.path)):
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            atomic_to_csv(self.table, self.path, index=False)
+        return added
+
+
+def encode_locations(location, wards=None):
+    """
+    Integer district and ward IDs for the "Location" column.
+
+    Args:
+        location (pd.Series): The "Location" column.
+        wards (WardTable): Ward IDs to use and extend (an in-memory table by default).
+    Returns:
+        pd.DataFrame: "District Id" (int8) and "Ward Id" (int32), UNKNOWN_ID where
+            a location has no known district or no ward.
+    """
+    wards = wards if wards is not None else WardTable(path=None)
+    codes, uniques = pd.factorize(location)
+    ward_names, districts = split_location(pd.Series(uniques, dtype=object))
+    ward_ids = np.array([wards.ward_id(d, w) for d, w in zip(districts.tolist(), ward_names.tolist())]
+                        + [UNKNOWN_ID], dtype=np.int32)
+    districts = np.append(districts, np.int8(UNKNOWN_ID))
+    return pd.DataFrame({"District Id": districts[codes], "Ward Id": ward_ids[codes]}, index=location.index)
+
+
+def district_table(data_dir="data"):
+    """
+    The district dimension: ID, slug and name of every district, joined by ID
+    with population_by_district.csv when it is there.
+
+    Args:
+        data_dir (str): Directory of the reference CSVs.
+    Returns:
+        pd.DataFrame: Indexed by "District Id".
+    """
+    table = pd.DataFrame({"Slug": DISTRICT_SLUGS, "District": DISTRICT_NAMES},
+                         index=pd.Index(np.arange(len(DISTRICTS), dtype=np.int8), name="District Id"))
+    path = os.path.join(data_dir, "population_by_district.csv")
+    if os.path.exists(path):
+        population = pd.read_csv(path, encoding="utf-8-sig")
+        population.index = pd.Index(district_ids(population["District"]), name="District Id")
+        population = population[population.index != UNKNOWN_ID].drop(columns=["District"])
+        table = table.join(population)
+    return table
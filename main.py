@@ -1,68 +1,120 @@
-from multiprocessing import Pool
-from scraping import districts, scrape_district
-from fetch_parse import process_real_estate_data
+import argparse
 import os
-import pandas as pd
+from scheduler import run_scheduler
+from fetch_parse import MERGED_FILE, process_real_estate_data
+from locations import DISTRICTS_CITY
+from map_export import export_map
+from metrics import GC_POLICIES
+from streaming_merge import stream_real_estate_data
+from targets import TARGET_CONFIG, build_targets, load_config, partitions
+
+
+def parse_args():
+    """
+    Parse the command line options.
+
+    Args:
+        None
+    Returns:
+        argparse.Namespace: The options.
+    """
+    parser = argparse.ArgumentParser(description="Scrape and process Hanoi apartment listings.")
+    parser.add_argument("--targets", help="JSON file of categories, cities and outputs to add to targets.TARGET_CONFIG")
+    parser.add_argument("--categories", nargs="+",
+                        help="listing categories to scrape and merge, or 'all' (default: apartments for sale)")
+    parser.add_argument("--cities", nargs="+", help="cities to scrape and merge, or 'all' (default: Hanoi)")
+    parser.add_argument("--workers", type=int, default=3, help="number of scraper processes")
+    parser.add_argument("--backend", choices=["selenium", "http"], default="selenium",
+                        help="fetch pages in Chrome, or over HTTP with Chrome as a fallback")
+    parser.add_argument("--detail-workers", type=int, default=8,
+                        help="detail pages fetched at once per scraper process")
+    parser.add_argument("--drivers", type=int, default=1,
+                        help="Chrome drivers kept warm per scraper process (recycled every 200 pages)")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the pages already recorded in data/scrape_journal.jsonl")
+    parser.add_argument("--gc-policy", choices=GC_POLICIES, default="auto",
+                        help="when scraper processes collect garbage: after every page, or left to Python")
+    parser.add_argument("--metrics-file", help="append scraping metrics to this JSONL file every 10 seconds")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve scraping metrics in the Prometheus format on this port (/metrics)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-clean the district files that changed since the last merge")
+    parser.add_argument("--streaming", action="store_true",
+                        help="merge in chunks through sorted runs on disk, for data larger than memory")
+    parser.add_argument("--memory-limit", type=float, default=256,
+                        help="MB of rows held at once by the streaming merge")
+    parser.add_argument("--columnar", action="store_true",
+                        help="also write the merged listings as Parquet and Arrow files in a parquet directory "
+                             "next to the merged CSV (Hanoi only, needs pyarrow, not with --streaming)")
+    parser.add_argument("--cube", action="store_true",
+                        help="also update the analytics cube in a cube directory next to the merged CSV "
+                             "(Hanoi only, needs pyarrow, not with --streaming)")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="also drop listings reposted under new Ids (not with --streaming)")
+    parser.add_argument("--history", action="store_true",
+                        help="record the merged listings in the listing history (not with --streaming)")
+    parser.add_argument("--export-map", action="store_true",
+                        help="after parsing, write aggregated map layers and map.html in a map directory next to "
+                             "each merged CSV (Hanoi only)")
+    return parser.parse_args()
 
 
 def main():
     """
     Main function to scrape real estate listings for all districts in Hanoi
-    and process the data.
+    (or the categories and cities asked for) and process the data.
     """
+    args = parse_args()
+    config = load_config(args.targets) if args.targets else TARGET_CONFIG
+    targets = build_targets(config, args.categories, args.cities)
     # Ask user if they want to start scraping
     user_input = input("Do you want to start scraping? (yes/no): ").strip().lower()
     if user_input == 'yes':
-        if len(districts) == 1:
-            district = districts[0]
-            csv_file_path = f"data/filtered_real_estate_listings_{district}.csv"
-            os.makedirs("data", exist_ok=True)
-
-            # Define page ranges for 3 processes (adjust max_pages as needed)
-            max_pages = 143  # Estimate or dynamically determine total pages if possible
-            pages_per_process = max_pages // 3
-            page_ranges = [
-                (1, pages_per_process),                         # Process 1: Pages 1-3
-                (pages_per_process + 1, 2 * pages_per_process), # Process 2: Pages 4-6
-                (2 * pages_per_process + 1, max_pages)          # Process 3: Pages 7-10
-            ]
-
-            with Pool(processes=3) as pool:
-                # Run 3 processes, each scraping a range of pages
-                results = pool.starmap(scrape_district, [(district, start, end) for start, end in page_ranges])
-            
-            # Combine all data into one list
-            all_data = []
-            for data in results:
-                all_data.extend(data)
-
-            if all_data:
-                # Write combined data to a single CSV
-                df = pd.DataFrame(all_data, columns=[
-                    "Id", "Date Posted", "Product Title", "Price", "Area", "Price per m²", 
-                    "Bedrooms", "Toilets", "Location", "Coordinates"
-                ])
-                df.to_csv(csv_file_path, index=False)
-                print(f"All data saved to {csv_file_path}")
-            else:
-                print(f"No data scraped for {district}.")
-        else:
-            # Original logic for multiple districts
-            with Pool(processes=3) as pool:
-                pool.map(scrape_district, districts)
+        # Page counts are read from each target's pagination, and the workers
+        # share one queue of (target, page) tasks until every target is done
+        run_scheduler(targets, workers=args.workers, backend=args.backend, detail_workers=args.detail_workers,
+                      resume=args.resume, gc_policy=args.gc_policy, metrics_file=args.metrics_file,
+                      metrics_port=args.metrics_port, drivers=args.drivers)
         print("Scraping completed for all districts.")
     else:
         print("Scraping skipped.")
-    
+
     # Ask user if they want to start parsing
     user_input = input("Do you want to start parsing? (yes/no): ").strip().lower()
     if user_input == 'yes':
         print("Starting parsing...")
-        process_real_estate_data()
+        # One merged CSV per category and city
+        mapped = []
+        for (category, city), (files, merged_path) in partitions(targets, config).items():
+            if merged_path == MERGED_FILE:
+                files = None  # fetch_parse.DISTRICT_FILES, in the order the merged CSV has always been built in
+            else:
+                files = [file for file in files if os.path.exists(file)]
+                if not files:
+                    print(f"No listings scraped for {category}/{city}. Skipping...")
+                    continue
+            print(f"Merging {category}/{city} into {merged_path}...")
+            rent = config["categories"][category].get("rent", False)
+            # Only the districts of one city have IDs (see locations.DISTRICTS)
+            located = city == DISTRICTS_CITY
+            if (args.columnar or args.cube or args.export_map) and not located:
+                print(f"No district IDs for {city}: no columnar copies, cube or map for {category}/{city}.")
+            elif args.export_map:
+                mapped.append(merged_path)
+            if args.streaming:
+                stream_real_estate_data(district_files=files, output_path=merged_path,
+                                        memory_limit_mb=args.memory_limit, rent=rent)
+            else:
+                process_real_estate_data(district_files=files, output_path=merged_path, incremental=args.incremental,
+                                         cache_dir=os.path.join(os.path.dirname(merged_path), "merge_cache"),
+                                         columnar=args.columnar and located, cube=args.cube and located,
+                                         near_duplicates=args.near_duplicates, history=args.history, rent=rent)
         print("Parsing completed for all districts.")
+        for merged_path in filter(os.path.exists, mapped):
+            export_map(out_dir=os.path.join(os.path.dirname(merged_path), "map"), merged_path=merged_path)
     else:
         print("Parsing skipped.")
-    
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,369 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from fetch_parse import MERGED_FILE
+from geo import CENTER_LAT, CENTER_LON, coordinates_of
+from locations import location_districts
+
+# Pre-aggregated map layers, next to the other derived data:
+#   grid_z<zoom>.geojson  listings binned into square cells, one file per zoom level
+#   districts.geojson     one point per district, at the mean position of its listings
+#   map.html              a Leaflet map that embeds the layers and shows the grid for the current zoom
+MAP_DIR = 'data/map'
+DEFAULT_ZOOMS = (11, 13, 15)
+# Cell size in screen pixels: cells are squares in Web Mercator, aligned with the map
+# tiles, so they are the same size on screen at every zoom (about 2.4 km across at
+# zoom 11, 600 m at 13, 150 m at 15 for 64 px)
+CELL_PX = 64
+TILE_PX = 256
+# Colours for the median price per m², low to high (ColorBrewer YlOrRd)
+PALETTE = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+NO_PRICE_COLOR = '#9e9e9e'
+LEAFLET_VERSION = '1.9.3'
+
+
+def _mercator_pixels(lat, lon, zoom):
+    # Global Web Mercator pixel coordinates at a zoom level, as slippy map tiles use them
+    size = TILE_PX * 2 ** zoom
+    lat = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    x = (lon + 180) / 360 * size
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * size
+    return x, y
+
+
+def _pixels_to_latlon(x, y, zoom):
+    size = TILE_PX * 2 ** zoom
+    lon = x / size * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / size))))
+    return lat, lon
+
+
+def listing_points(df):
+    """
+    The columns the map layers aggregate, one row per listing with coordinates.
+
+    Args:
+        df (pd.DataFrame): Merged listings, as written to the merged CSV.
+    Returns:
+        pd.DataFrame: "Latitude", "Longitude", "District", and "Price" and
+            "Price per m²" (NaN where the price is negotiable or unknown).
+    """
+    lat, lon = coordinates_of(df)
+    price = pd.to_numeric(df["Price"], errors="coerce")
+    price_m2 = pd.to_numeric(df["Price per m²"], errors="coerce")
+    points = pd.DataFrame({
+        "Latitude": lat.to_numpy(),
+        "Longitude": lon.to_numpy(),
+        "District": location_districts(df["Location"]).to_numpy(),
+        # -1 is "Giá thỏa thuận"
+        "Price": price.where(price > 0).to_numpy(),
+        "Price per m²": price_m2.where(price_m2 > 0).to_numpy(),
+    })
+    return points.dropna(subset=["Latitude", "Longitude"]).reset_index(drop=True)
+
+
+def _summarize(points, keys):
+    # Count and median prices of every group, in one vectorized groupby
+    grouped = points.groupby(keys, sort=True)
+    return grouped.agg(
+        count=("Latitude", "size"),
+        median_price=("Price", "median"),
+        median_price_m2=("Price per m²", "median"),
+        latitude=("Latitude", "mean"),
+        longitude=("Longitude", "mean"),
+    ).reset_index()
+
+
+def aggregate_grid(points, zoom, cell_px=CELL_PX):
+    """
+    Bin listings into square Web Mercator cells of cell_px screen pixels at a zoom level.
+
+    Args:
+        points (pd.DataFrame): listing_points output.
+        zoom (int): Map zoom level.
+        cell_px (int): Cell size in pixels at that zoom.
+    Returns:
+        pd.DataFrame: One row per non-empty cell: "cell_x", "cell_y", "count",
+            "median_price", "median_price_m2", the mean position of its listings,
+            and its bounds ("south", "west", "north", "east").
+    """
+    x, y = _mercator_pixels(points["Latitude"].to_numpy(), points["Longitude"].to_numpy(), zoom)
+    cells = _summarize(points.assign(cell_x=(x // cell_px).astype(np.int64), cell_y=(y // cell_px).astype(np.int64)),
+                       ["cell_x", "cell_y"])
+    cells["north"], cells["west"] = _pixels_to_latlon(cells["cell_x"] * cell_px, cells["cell_y"] * cell_px, zoom)
+    cells["south"], cells["east"] = _pixels_to_latlon((cells["cell_x"] + 1) * cell_px,
+                                                      (cells["cell_y"] + 1) * cell_px, zoom)
+    return cells
+
+
+def aggregate_districts(points):
+    """
+    Args:
+        points (pd.DataFrame): listing_points output.
+    Returns:
+        pd.DataFrame: One row per district: "District", "count", "median_price",
+            "median_price_m2" and the mean position of its listings.
+    """
+    return _summarize(points, ["District"])
+
+
+def price_breaks(points, bins=len(PALETTE)):
+    """
+    Args:
+        points (pd.DataFrame): listing_points output.
+        bins (int): Number of colour classes.
+    Returns:
+        np.ndarray: The inner class boundaries of "Price per m²" (quantiles of all
+            listings, so every zoom level uses the same colours).
+    """
+    values = points["Price per m²"].dropna().to_numpy()
+    if not len(values):
+        return np.array([])
+    return np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+
+
+def _colors(median_price_m2, breaks):
+    values = np.asarray(median_price_m2, dtype=float)
+    colors = np.array(PALETTE, dtype=object)[np.searchsorted(breaks, values, side="right")]
+    colors[np.isnan(values)] = NO_PRICE_COLOR
+    return colors
+
+
+def _properties(rows, breaks):
+    # Rounded, and NaN as null, so the files stay small and valid JSON
+    props = pd.DataFrame({
+        "count": rows["count"].astype(int),
+        "median_price": rows["median_price"].round(2),
+        "median_price_m2": rows["median_price_m2"].round(1),
+        "color": _colors(rows["median_price_m2"], breaks),
+    })
+    props = props.astype(object).where(props.notna(), None)
+    return props.to_dict("records")
+
+
+def grid_geojson(cells, breaks):
+    """
+    Args:
+        cells (pd.DataFrame): aggregate_grid output.
+        breaks (np.ndarray): price_breaks output.
+    Returns:
+        dict: A GeoJSON FeatureCollection of cell polygons.
+    """
+    south, west = cells["south"].round(5).to_numpy(), cells["west"].round(5).to_numpy()
+    north, east = cells["north"].round(5).to_numpy(), cells["east"].round(5).to_numpy()
+    features = [
+        {"type": "Feature",
+         "geometry": {"type": "Polygon",
+                      "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]]},
+         "properties": props}
+        for s, w, n, e, props in zip(south.tolist(), west.tolist(), north.tolist(), east.tolist(),
+                                     _properties(cells, breaks))
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def district_geojson(districts, breaks):
+    """
+    Args:
+        districts (pd.DataFrame): aggregate_districts output.
+        breaks (np.ndarray): price_breaks output.
+    Returns:
+        dict: A GeoJSON FeatureCollection of district points.
+    """
+    features = [
+        {"type": "Feature",
+         "geometry": {"type": "Point", "coordinates": [round(lon, 5), round(lat, 5)]},
+         "properties": dict(props, district=name)}
+        for name, lat, lon, props in zip(districts["District"], districts["latitude"].tolist(),
+                                         districts["longitude"].tolist(), _properties(districts, breaks))
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+
+
+def _write_text(path, text):
+    # Through a temporary file, so a reader never sees half a layer
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _legend_rows(breaks):
+    edges = [None] + [float(b) for b in breaks] + [None]
+    rows = []
+    for color, low, high in zip(PALETTE, edges[:-1], edges[1:]):
+        if low is None and high is None:
+            label = "all"
+        elif low is None:
+            label = f"&lt; {high:.0f}"
+        elif high is None:
+            label = f"≥ {low:.0f}"
+        else:
+            label = f"{low:.0f} – {high:.0f}"
+        rows.append(f"<div><i style='background:{color}'></i>{label}</div>")
+    rows.append(f"<div><i style='background:{NO_PRICE_COLOR}'></i>no price</div>")
+    return "".join(rows)
+
+
+_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8"/>
+<title>Hanoi apartment listings</title>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@{leaflet}/dist/leaflet.css"/>
+<script src="https://cdn.jsdelivr.net/npm/leaflet@{leaflet}/dist/leaflet.js"></script>
+<style>
+html, body, #map {{width: 100%; height: 100%; margin: 0; padding: 0;}}
+.legend {{background: white; padding: 6px 8px; font: 12px sans-serif; line-height: 18px;}}
+.legend i {{width: 14px; height: 14px; float: left; margin-right: 6px; opacity: 0.8;}}
+</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var layers = {layers};
+var map = L.map("map").setView([{lat}, {lon}], {zoom});
+L.tileLayer("https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png", {{
+  maxZoom: 19, attribution: "&copy; OpenStreetMap contributors"}}).addTo(map);
+
+function popup(p) {{
+  var text = (p.district ? "<b>" + p.district + "</b><br>" : "") + p.count + " listings";
+  if (p.median_price !== null) text += "<br>Median price: " + p.median_price + " tỷ";
+  if (p.median_price_m2 !== null) text += "<br>Median price/m²: " + p.median_price_m2 + " triệu";
+  return text;
+}}
+// Grid cells come as [cell_x, cell_y, count, median_price, median_price_m2, colour] rows;
+// their corners are Web Mercator pixels at the layer's zoom, so Leaflet can unproject them
+function gridLayer(zoom, rows) {{
+  var size = layers.cell_px;
+  var cells = rows.map(function (r) {{
+    var corner = map.unproject([r[0] * size, r[1] * size], zoom);
+    var opposite = map.unproject([(r[0] + 1) * size, (r[1] + 1) * size], zoom);
+    return L.rectangle(L.latLngBounds(corner, opposite), {{color: layers.colors[r[5]], weight: 0.5,
+      fillOpacity: 0.6}}).bindPopup(popup({{count: r[2], median_price: r[3], median_price_m2: r[4]}}));
+  }});
+  return L.layerGroup(cells);
+}}
+// One grid layer per exported zoom; the finest one not finer than the map is shown
+var zooms = Object.keys(layers.grid).map(Number).sort(function (a, b) {{ return a - b; }});
+var grids = {{}};
+zooms.forEach(function (z) {{ grids[z] = gridLayer(z, layers.grid[z]); }});
+var shown = null;
+var grid = L.layerGroup().addTo(map);
+function showGrid() {{
+  var pick = zooms[0];
+  zooms.forEach(function (z) {{ if (z <= map.getZoom()) pick = z; }});
+  if (pick === shown) return;
+  grid.clearLayers();
+  grid.addLayer(grids[pick]);
+  shown = pick;
+}}
+map.on("zoomend", showGrid);
+showGrid();
+
+var districts = L.geoJSON(layers.districts, {{
+  pointToLayer: function (f, latlng) {{
+    return L.circleMarker(latlng, {{radius: 4 + Math.sqrt(f.properties.count) / 2, color: "#333",
+      weight: 1, fillColor: f.properties.color, fillOpacity: 0.9}});
+  }},
+  onEachFeature: function (f, layer) {{ layer.bindPopup(popup(f.properties)); }}
+}});
+L.control.layers(null, {{"Price grid": grid, "Districts": districts}}).addTo(map);
+
+var legend = L.control({{position: "bottomright"}});
+legend.onAdd = function () {{
+  var div = L.DomUtil.create("div", "legend");
+  div.innerHTML = "<b>Median price/m² (triệu)</b>{legend}";
+  return div;
+}};
+legend.addTo(map);
+</script>
+</body>
+</html>
+"""
+
+
+def _compact_rows(cells, breaks):
+    # [cell_x, cell_y, count, median_price, median_price_m2, colour index] per cell
+    colors = _colors(cells["median_price_m2"], breaks)
+    color_index = {color: i for i, color in enumerate(PALETTE + [NO_PRICE_COLOR])}
+    props = _properties(cells, breaks)
+    return [[x, y, p["count"], p["median_price"], p["median_price_m2"], color_index[c]]
+            for x, y, p, c in zip(cells["cell_x"].tolist(), cells["cell_y"].tolist(), props, colors)]
+
+
+def render_map_html(cells, districts, breaks, cell_px=CELL_PX):
+    """
+    A standalone Leaflet page with the aggregated layers embedded.
+
+    Grid cells are embedded as compact rows of cell indices and statistics,
+    and turned into rectangles in the browser. The page size depends on the
+    number of occupied cells, not on the number of listings.
+
+    Args:
+        cells (dict): Zoom level -> aggregate_grid output.
+        districts (dict): district_geojson output.
+        breaks (np.ndarray): price_breaks output, for the colours and the legend.
+        cell_px (int): Grid cell size the cells were aggregated with.
+    Returns:
+        str: The HTML.
+    """
+    layers = _dumps({
+        "cell_px": cell_px,
+        "colors": PALETTE + [NO_PRICE_COLOR],
+        "grid": {str(zoom): _compact_rows(zoom_cells, breaks) for zoom, zoom_cells in cells.items()},
+        "districts": districts,
+    })
+    start_zoom = min(cells) if cells else 11
+    return _HTML_TEMPLATE.format(leaflet=LEAFLET_VERSION, layers=layers.replace("</", "<\\/"), lat=CENTER_LAT,
+                                 lon=CENTER_LON, zoom=start_zoom, legend=_legend_rows(breaks))
+
+
+def export_map(df=None, out_dir=MAP_DIR, zooms=DEFAULT_ZOOMS, cell_px=CELL_PX, html=True, merged_path=MERGED_FILE):
+    """
+    Aggregate the listings into grid cells at each zoom level and into district
+    bins, and write them as GeoJSON (and a Leaflet page embedding them).
+
+    Args:
+        df (pd.DataFrame): Merged listings (read from merged_path by default).
+        out_dir (str): Directory for the layers.
+        zooms (iterable): Zoom levels to export a grid for.
+        cell_px (int): Grid cell size in screen pixels.
+        html (bool): Also write map.html.
+        merged_path (str): The merged CSV read when df is None.
+    Returns:
+        dict: Layer name -> path written.
+    """
+    if df is None:
+        df = pd.read_csv(merged_path)
+    points = listing_points(df)
+    breaks = price_breaks(points)
+    os.makedirs(out_dir, exist_ok=True)
+
+    written = {}
+    cells = {}
+    for zoom in zooms:
+        cells[zoom] = aggregate_grid(points, zoom, cell_px)
+        path = os.path.join(out_dir, f"grid_z{zoom}.geojson")
+        _write_text(path, _dumps(grid_geojson(cells[zoom], breaks)))
+        written[f"grid_z{zoom}"] = path
+    districts = district_geojson(aggregate_districts(points), breaks)
+    path = os.path.join(out_dir, "districts.geojson")
+    _write_text(path, _dumps(districts))
+    written["districts"] = path
+    if html:
+        path = os.path.join(out_dir, "map.html")
+        _write_text(path, render_map_html(cells, districts, breaks, cell_px))
+        written["html"] = path
+
+    print(f"✔ Map layers for {len(points)} listings saved to '{out_dir}': "
+          + ", ".join(f"zoom {z}: {len(zoom_cells)} cells" for z, zoom_cells in cells.items())
+          + f", {len(districts['features'])} districts.")
+    return written
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Args:
+        path (str): The file to hash.
+        chunk_size (int): Bytes read at a time.
+    Returns:
+        str: The hex SHA-256 of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace_atomically(path, write):
+    # write(tmp_path), then rename over path so a crash never leaves half a file
+    tmp_path = f"{path}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MergeCache:
+    """
+    Cleaned per-district intermediates for an incremental merge.
+
+    A manifest records the size, mtime and SHA-256 of every district CSV
+    that was cleaned, next to a pickle of the cleaned rows. A file whose size
+    and mtime are unchanged is trusted without hashing; one whose mtime moved
+    but whose hash did not is not re-parsed either. Only the rest are read
+    and cleaned again. The manifest also remembers which inputs the merged
+    CSV was last built from, so a run with nothing new can skip the merge.
+    """
+
+    def __init__(self, cache_dir="data/merge_cache", version="1"):
+        """
+        Args:
+            cache_dir (str): Directory for the manifest and the intermediates.
+            version (str): Format version of the cleaned rows; intermediates written
+                with another version (or another pandas) are rebuilt.
+        Returns:
+            None
+        """
+        self.cache_dir = cache_dir
+        self.version = f"{version}/pandas-{pd.__version__}"
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = {"sources": {}, "output": None}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Ignoring unreadable merge manifest {self.manifest_path}: {e}")
+        self.inputs = []  # (path, sha256) of the files seen by refresh, in order
+        self._fresh = {}  # path -> cleaned rows re-parsed by refresh
+
+    def _intermediate_path(self, source_path):
+        key = hashlib.sha1(os.path.abspath(source_path).encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{os.path.splitext(os.path.basename(source_path))[0]}-{key}.pkl")
+
+    def _usable(self, entry):
+        return (entry is not None and entry.get("version") == self.version
+                and (entry["intermediate"] is None or os.path.exists(entry["intermediate"])))
+
+    def refresh(self, district_files, read, prepare):
+        """
+        Re-parse the district files that changed since their cleaned copy was made.
+
+        Args:
+            district_files (list): Paths of the district CSV files.
+            read (callable): path -> DataFrame, or None for a file without data.
+            prepare (callable): Raw DataFrame -> cleaned DataFrame.
+        Returns:
+            list: The re-parsed paths.
+        """
+        reparsed = []
+        self.inputs = []
+        self._fresh = {}
+        for path in district_files:
+            if not os.path.exists(path):
+                print(f"File does not exist: {path}")
+                self.inputs.append((path, None))
+                continue
+            stat = os.stat(path)
+            entry = self.manifest["sources"].get(path)
+            unchanged = (self._usable(entry) and entry["size"] == stat.st_size
+                         and entry["mtime_ns"] == stat.st_mtime_ns)
+            if not unchanged:
+                digest = file_sha256(path)
+                if self._usable(entry) and entry["sha256"] == digest:
+                    # Touched but not modified
+                    entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    unchanged = True
+            if unchanged:
+                self.inputs.append((path, entry["sha256"]))
+                continue
+
+            df = read(path)
+            intermediate = None
+            if df is not None:
+                df = prepare(df)
+                intermediate = self._intermediate_path(path)
+                _replace_atomically(intermediate, df.to_pickle)
+                self._fresh[path] = df
+            self.manifest["sources"][path] = {
+                "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest,
+                "intermediate": intermediate, "version": self.version,
+            }
+            self.inputs.append((path, digest))
+            reparsed.append(path)
+        return reparsed
+
+    def frames(self):
+        """
+        The cleaned rows of the files seen by the last refresh, in file order.
+
+        Returns:
+            list: DataFrames, leaving out files without data.
+        """
+        frames = []
+        for path, digest in self.inputs:
+            if digest is None:
+                continue
+            if path in self._fresh:
+                frames.append(self._fresh[path])
+                continue
+            intermediate = self.manifest["sources"][path]["intermediate"]
+            if intermediate is not None:
+                frames.append(pd.read_pickle(intermediate))
+                print(f"Unchanged, using cleaned copy: {path}")
+        return frames
+
+    def _output_state(self, output_path):
+        stat = os.stat(output_path)
+        return {"path": os.path.abspath(output_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "inputs": [list(item) for item in self.inputs]}
+
+    def output_is_current(self, output_path):
+        """
+        Args:
+            output_path (str): The merged CSV.
+        Returns:
+            bool: True if it was built by record_output from exactly the inputs
+                of the last refresh and has not been modified since.
+        """
+        if not os.path.exists(output_path):
+            return False
+        return self.manifest.get("output") == self._output_state(output_path)
+
+    def record_output(self, output_path):
+        """
+        Remember that the merged CSV was built from the current inputs, and save the manifest.
+
+        Args:
+            output_path (str): The merged CSV, already written.
+        Returns:
+            None
+        """
+        self.manifest["output"] = self._output_state(output_path)
+        self.save()
+
+    def save(self):
+        """
+        Write the manifest.
+
+        Returns:
+            None
+        """
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=1, ensure_ascii=False)
+        _replace_atomically(self.manifest_path, write)
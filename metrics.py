@@ -0,0 +1,466 @@
+import gc
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+# Upper bounds, in seconds, of the buckets every timer is counted into
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+GC_POLICIES = ("page", "auto", "off")
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    The counters, gauges and timers of one process.
+
+    Every series is a name plus labels, e.g. scraper_pages_total{status="ok"}.
+    Counters only go up, gauges hold the last value set, and timers count
+    observations into TIMER_BUCKETS with their sum, like a Prometheus
+    histogram. The scheduler's workers each fill their own registry and send
+    snapshots to the parent, which merges them for export.
+    """
+
+    def __init__(self, process="main"):
+        """
+        Args:
+            process (str): Name of the process, added as a label to its gauges.
+        Returns:
+            None
+        """
+        self._lock = threading.Lock()
+        self._help = {}
+        self.reset(process)
+
+    def reset(self, process="main"):
+        """
+        Drop every series, e.g. in a worker process that inherited its parent's registry.
+
+        Args:
+            process (str): The new process name.
+        Returns:
+            None
+        """
+        with self._lock:
+            self.process = process
+            self._counters = {}
+            self._gauges = {}
+            self._timers = {}
+
+    def describe(self, name, text):
+        """
+        Set the help text of a metric (the # HELP line of the Prometheus format).
+        """
+        self._help[name] = text
+
+    def count(self, name, value=1, **labels):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): The counter, e.g. "scraper_pages_total".
+            value (float): The increment.
+            **labels: The labels of the series.
+        Returns:
+            None
+        """
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Set a gauge of this process.
+        """
+        key = _series_key(name, dict(labels, process=self.process))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record one duration in a timer.
+        """
+        key = _series_key(name, labels)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = {"count": 0, "sum": 0.0, "buckets": [0] * len(TIMER_BUCKETS)}
+            timer["count"] += 1
+            timer["sum"] += seconds
+            for i, bound in enumerate(TIMER_BUCKETS):
+                if seconds <= bound:
+                    timer["buckets"][i] += 1
+                    break
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time the body of a with block:
+
+            with REGISTRY.timer("scraper_stage_seconds", stage="parse"):
+                ...
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: The current value of every series, as plain JSON-able data.
+        """
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self._gauges.items()],
+                "timers": [[name, dict(labels), dict(timer, buckets=list(timer["buckets"]))]
+                           for (name, labels), timer in self._timers.items()],
+                "help": dict(self._help),
+            }
+
+
+def merge_snapshots(snapshots):
+    """
+    Add up the snapshots of several processes: counters and timers are summed,
+    gauges are kept apart by their "process" label.
+
+    Args:
+        snapshots (list): Snapshots from Registry.snapshot.
+    Returns:
+        dict: One snapshot.
+    """
+    counters, gauges, timers, help_texts = {}, {}, {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = _series_key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snapshot["gauges"]:
+            gauges[_series_key(name, labels)] = value
+        for name, labels, timer in snapshot["timers"]:
+            key = _series_key(name, labels)
+            if key not in timers:
+                timers[key] = {"count": 0, "sum": 0.0, "buckets": [0] * len(TIMER_BUCKETS)}
+            timers[key]["count"] += timer["count"]
+            timers[key]["sum"] += timer["sum"]
+            timers[key]["buckets"] = [a + b for a, b in zip(timers[key]["buckets"], timer["buckets"])]
+        help_texts.update(snapshot.get("help", {}))
+    return {
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        "gauges": [[name, dict(labels), value] for (name, labels), value in gauges.items()],
+        "timers": [[name, dict(labels), timer] for (name, labels), timer in timers.items()],
+        "help": help_texts,
+    }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(snapshot):
+    """
+    Format a snapshot in the Prometheus text exposition format.
+
+    Args:
+        snapshot (dict): From Registry.snapshot or merge_snapshots.
+    Returns:
+        str: The text served on /metrics.
+    """
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            if name in snapshot["help"]:
+                lines.append(f"# HELP {name} {snapshot['help'][name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for kind, series in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+        for name, labels, value in sorted(series, key=lambda s: (s[0], sorted(s[1].items()))):
+            declare(name, kind)
+            lines.append(f"{name}{_format_labels(labels)} {value!r}")
+    for name, labels, timer in sorted(snapshot["timers"], key=lambda s: (s[0], sorted(s[1].items()))):
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, n in zip(TIMER_BUCKETS, timer["buckets"]):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labels, le=f'{bound:g}')} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {timer['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {timer['sum']:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {timer['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# The default registry of this process, like the global registry of prometheus_client
+REGISTRY = Registry()
+REGISTRY.describe("scraper_stage_seconds", "Time spent in each scraping stage.")
+REGISTRY.describe("scraper_pages_total", "Search pages scraped, by outcome.")
+REGISTRY.describe("scraper_listings_total", "Listing cards seen, by outcome.")
+REGISTRY.describe("scraper_detail_pages_total", "Detail pages, by outcome.")
+REGISTRY.describe("scraper_timeouts_total", "Page loads that timed out, by backend.")
+REGISTRY.describe("scraper_fallbacks_total", "Pages the HTTP backend handed to the browser.")
+REGISTRY.describe("process_resident_memory_bytes", "Resident set size.")
+REGISTRY.describe("process_virtual_memory_bytes", "Virtual memory size.")
+REGISTRY.describe("python_gc_seconds", "Time spent in garbage collection, by generation.")
+REGISTRY.describe("python_gc_collected_objects_total", "Objects freed by garbage collection, by generation.")
+
+
+def timer(name, **labels):
+    """
+    REGISTRY.timer: time a with block into the default registry.
+    """
+    return REGISTRY.timer(name, **labels)
+
+
+def count(name, value=1, **labels):
+    """
+    REGISTRY.count: add to a counter of the default registry.
+    """
+    REGISTRY.count(name, value, **labels)
+
+
+def stage_timer(stage):
+    """
+    Time one scraping stage ("page_load", "wait", "parse", "detail_fetch", "dedup", "csv_write", ...).
+    """
+    return REGISTRY.timer("scraper_stage_seconds", stage=stage)
+
+
+def sample_memory(registry=REGISTRY):
+    """
+    Set the memory gauges from the current RSS and VMS of this process.
+
+    Returns:
+        None
+    """
+    mem_info = psutil.Process().memory_info()
+    registry.set_gauge("process_resident_memory_bytes", mem_info.rss)
+    registry.set_gauge("process_virtual_memory_bytes", mem_info.vms)
+
+
+class GcMonitor:
+    """
+    Times every garbage collection through gc.callbacks, so the cost of the
+    GC policy shows up next to the stage timers.
+    """
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self._started = None
+
+    def _callback(self, phase, info):
+        if phase == "start":
+            self._started = time.perf_counter()
+        elif self._started is not None:
+            generation = str(info.get("generation"))
+            self.registry.observe("python_gc_seconds", time.perf_counter() - self._started, generation=generation)
+            self.registry.count("python_gc_collected_objects_total", info.get("collected", 0), generation=generation)
+            self._started = None
+
+    def start(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+        return self
+
+    def stop(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+
+class GcPolicy:
+    """
+    When to run a full garbage collection while scraping.
+
+        "page": after every search page (what the scraper always did)
+        "auto": leave it to Python's generational collector
+        "off":  disable the automatic collector as well (only for measuring)
+    """
+
+    def __init__(self, mode="page"):
+        """
+        Args:
+            mode (str): One of GC_POLICIES.
+        Returns:
+            None
+        """
+        if mode not in GC_POLICIES:
+            raise ValueError(f"Unknown GC policy: {mode}")
+        self.mode = mode
+        if mode == "off":
+            gc.disable()
+
+    def after_page(self):
+        """
+        Called once a search page and its rows are done.
+        """
+        if self.mode == "page":
+            gc.collect()
+
+    def close(self):
+        if self.mode == "off":
+            gc.enable()
+        gc.collect()
+
+
+class _PeriodicThread:
+    # Calls tick every interval seconds from a daemon thread, and once more on stop
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def tick(self):
+        raise NotImplementedError
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.tick()
+
+    def start(self):
+        self.tick()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+            self.tick()
+
+
+class MemorySampler(_PeriodicThread):
+    """
+    Samples the memory gauges every interval seconds, in place of the old
+    thread that printed RSS/VMS.
+    """
+
+    def __init__(self, registry=REGISTRY, interval=10):
+        super().__init__(interval)
+        self.registry = registry
+
+    def tick(self):
+        sample_memory(self.registry)
+
+
+class JsonlExporter(_PeriodicThread):
+    """
+    Appends a timestamped snapshot to a JSONL file every interval seconds
+    (and when stopped), for looking at a run afterwards.
+    """
+
+    def __init__(self, path, collect=REGISTRY.snapshot, interval=10):
+        """
+        Args:
+            path (str): The JSONL file.
+            collect (callable): Returns the snapshot to write.
+            interval (float): Seconds between lines.
+        Returns:
+            None
+        """
+        super().__init__(interval)
+        self.path = path
+        self.collect = collect
+
+    def tick(self):
+        snapshot = self.collect()
+        line = json.dumps({"time": round(time.time(), 3), "pid": os.getpid(),
+                           **{k: v for k, v in snapshot.items() if k != "help"}}, ensure_ascii=False)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus(self.server.collect()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    Serves the Prometheus text format on http://host:port/metrics from a background thread.
+    """
+
+    def __init__(self, port, collect=REGISTRY.snapshot, host="127.0.0.1"):
+        """
+        Args:
+            port (int): The port (0 picks a free one).
+            collect (callable): Returns the snapshot to serve.
+            host (str): The address to listen on.
+        Returns:
+            None
+        """
+        self.httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.collect = collect
+        self.port = self.httpd.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"Metrics are served on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self._thread.join()
+            self._thread = None
+
+
+@contextmanager
+def exporting(collect=REGISTRY.snapshot, metrics_file=None, metrics_port=None, interval=10):
+    """
+    Sample memory and export metrics for the duration of a with block.
+
+    Args:
+        collect (callable): Returns the snapshot to export (the default registry by default).
+        metrics_file (str): JSONL file to append snapshots to, or None.
+        metrics_port (int): Port of the Prometheus endpoint, or None.
+        interval (float): Seconds between memory samples and JSONL lines.
+    Returns:
+        None
+    """
+    monitors = [MemorySampler(interval=interval), GcMonitor()]
+    if metrics_file:
+        monitors.append(JsonlExporter(metrics_file, collect, interval=interval))
+    if metrics_port is not None:
+        monitors.append(MetricsServer(metrics_port, collect))
+    for monitor in monitors:
+        monitor.start()
+    try:
+        yield
+    finally:
+        for monitor in reversed(monitors):
+            monitor.stop()
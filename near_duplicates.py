@@ -0,0 +1,288 @@
+import itertools
+import re
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from geo import EARTH_RADIUS_KM, coordinates_of, haversine
+
+CLUSTER_ID = "Cluster Id"
+NEAR_DUPLICATES_FILE = "near_duplicates.csv"
+
+# MinHash signatures of the title shingles, cut into LSH bands: two titles
+# share a band with probability about 1 - (1 - J**ROWS)**BANDS for a
+# Jaccard similarity J, i.e. 50% at J = 0.5 and 99% at J = 0.8
+SHINGLE = 4       # characters per shingle
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Blocks: listings are only compared within a geo grid cell and an area bucket
+CELL_KM = 0.4
+AREA_TOLERANCE = 0.05
+# What makes two candidates the same apartment
+MIN_SIMILARITY = 0.6     # estimated Jaccard similarity of the title shingles
+# Without both prices (e.g. negotiable, -1) the price cannot tell two flats of a
+# building apart: the titles must be much closer and the areas equal
+UNPRICED_MIN_SIMILARITY = 0.8
+MAX_DISTANCE_KM = 0.2
+PRICE_TOLERANCE = 0.1
+# Tower, block, floor and unit numbers in a normalized title ("toa 29t1", "ct4",
+# "tang 20", "can 409"): two titles that name different ones are different flats
+_UNIT_LABEL = re.compile(r"\b(?:toa|tang|can|block|lo)\s+(\d+[a-z]?\d*)\b|\b([a-z]+\d+[a-z0-9]*|\d+[a-z]+\d+)\b")
+_NOT_A_LABEL = re.compile(r"^\d+m2$")
+# Candidates compared per listing and block, in price order: bounds the work in crowded blocks
+WINDOW = 32
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MASK = np.uint64(0xFFFFFFFF)
+_PERMUTATIONS = np.random.default_rng(1).integers(1, 1 << 32, size=(2, NUM_PERM), dtype=np.uint64)
+_MIX = np.random.default_rng(2).integers(1, 1 << 63, size=8, dtype=np.uint64) | np.uint64(1)
+
+
+def normalize_titles(titles):
+    """
+    Lowercase ASCII words of each title: diacritics dropped ("Bán căn hộ" ->
+    "ban can ho"), everything but letters and digits turned into single spaces.
+
+    Args:
+        titles (pd.Series): Product titles.
+    Returns:
+        pd.Series: The normalized titles ("" for missing ones).
+    """
+    text = titles.fillna("").astype(str).str.replace("Đ", "D").str.replace("đ", "d")
+    text = text.str.normalize("NFKD").str.replace(r"[̀-ͯ]", "", regex=True).str.lower()
+    return text.str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+
+
+def minhash_signatures(titles):
+    """
+    MinHash signatures of the SHINGLE-character shingles of each title.
+
+    The shingles of all titles are read at once from one byte array (four
+    ASCII characters pack exactly into a uint32), so the cost is linear in
+    the total title length with no per-shingle Python code.
+
+    Args:
+        titles (list): Normalized titles (ASCII, see normalize_titles).
+    Returns:
+        np.ndarray: (len(titles), NUM_PERM) uint32 signatures.
+    """
+    # Pad short titles so every title has at least one shingle
+    titles = [title.ljust(SHINGLE) for title in titles]
+    lengths = np.array([len(title) for title in titles], dtype=np.int64)
+    data = np.frombuffer("".join(titles).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    # Shingle i starts at byte i; it is valid if it does not run into the next title
+    owner = np.repeat(np.arange(len(titles)), lengths)
+    valid = np.arange(len(data)) - starts[owner] <= lengths[owner] - SHINGLE
+    positions = np.flatnonzero(valid)
+    shingles = np.zeros(len(positions), dtype=np.uint64)
+    for offset in range(SHINGLE):
+        shingles = (shingles << np.uint64(8)) | data[positions + offset]
+    first = np.searchsorted(owner[positions], np.arange(len(titles)))
+
+    signatures = np.empty((len(titles), NUM_PERM), dtype=np.uint32)
+    for j in range(NUM_PERM):
+        a, b = _PERMUTATIONS[0, j], _PERMUTATIONS[1, j]
+        hashed = ((a * shingles + b) % _MERSENNE) & _MASK
+        signatures[:, j] = np.minimum.reduceat(hashed, first)
+    return signatures
+
+
+def _band_hashes(signatures):
+    # One uint64 per (title, band), mixing its ROWS signature values
+    bands = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    hashes = np.zeros((len(signatures), BANDS), dtype=np.uint64)
+    for r in range(ROWS):
+        hashes = (hashes ^ bands[:, :, r]) * _MIX[r]
+    return hashes
+
+
+def _block_keys(lat, lon, area, location_codes):
+    # Grid cell and area bucket of every listing, in the 8 grids shifted by half a
+    # cell / bucket in each dimension: two listings closer than half a cell and
+    # half a bucket in every dimension share a block in at least one of them
+    lat_step = CELL_KM / (EARTH_RADIUS_KM * np.pi / 180)
+    lon_step = lat_step / np.cos(np.radians(np.nanmean(lat) if np.isfinite(lat).any() else 21.0))
+    log_area = np.log(np.where(area > 0, area, np.nan)) / np.log1p(2 * AREA_TOLERANCE)
+    has_point = np.isfinite(lat) & np.isfinite(lon)
+    keys = []
+    for grid, (shift_lat, shift_lon, shift_area) in enumerate(itertools.product((0.0, 0.5), repeat=3)):
+        # Listings without coordinates are blocked by their "Location" instead
+        x = np.where(has_point, np.floor(lat / lat_step + shift_lat), -1.0)
+        y = np.where(has_point, np.floor(lon / lon_step + shift_lon), location_codes)
+        bucket = np.where(np.isfinite(log_area), np.floor(log_area + shift_area), -1.0)
+        key = np.full(len(area), grid, dtype=np.uint64)
+        for part in (x, y, bucket):
+            key = (key ^ part.astype(np.int64).astype(np.uint64)) * _MIX[7]
+        keys.append(key)
+    return keys
+
+
+def candidate_pairs(df, signatures, title_codes):
+    """
+    Pairs of listings that share an LSH band of their title signature within
+    a block (grid cell, area bucket).
+
+    Listings with the same bucket key are sorted by price and each is paired
+    with the next WINDOW - 1 of them, so the number of pairs grows linearly
+    with the number of listings however crowded a block is.
+
+    Args:
+        df (pd.DataFrame): The listings.
+        signatures (np.ndarray): minhash_signatures of the distinct titles.
+        title_codes (np.ndarray): The position of each listing's title in signatures.
+    Returns:
+        np.ndarray: (n, 2) positions i < j of the candidate pairs, without repeats.
+    """
+    lat, lon = (s.to_numpy(dtype=float) for s in coordinates_of(df))
+    area = pd.to_numeric(df["Area"], errors="coerce").to_numpy(dtype=float)
+    price = pd.to_numeric(df["Price"], errors="coerce").fillna(-1).to_numpy(dtype=float)
+    location_codes = pd.factorize(df["Location"])[0].astype(float)
+    band_hashes = _band_hashes(signatures)[title_codes]
+    pairs = []
+    for block_key in _block_keys(lat, lon, area, location_codes):
+        for band in range(BANDS):
+            keys = (block_key ^ band_hashes[:, band]) * _MIX[band % 7]
+            order = np.lexsort((price, keys))
+            sorted_keys = keys[order]
+            for offset in range(1, WINDOW):
+                same = np.flatnonzero(sorted_keys[offset:] == sorted_keys[:-offset])
+                if not len(same):
+                    break
+                i, j = order[same], order[same + offset]
+                pairs.append(np.column_stack([np.minimum(i, j), np.maximum(i, j)]))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def unit_labels(titles):
+    """
+    Args:
+        titles (list): Normalized titles (see normalize_titles).
+    Returns:
+        list: The tower, block, floor and unit numbers each title names, as frozensets
+            (e.g. {"n05", "29t1"} for "ban chung cu n05 toa 29t1 dt 152m2").
+    """
+    labels = []
+    for title in titles:
+        found = (a or b for a, b in _UNIT_LABEL.findall(title))
+        labels.append(frozenset(label for label in found if not _NOT_A_LABEL.match(label)))
+    return labels
+
+
+def _same_listing(df, pairs, signatures, title_codes, units):
+    # Which candidate pairs are the same apartment: similar titles that do not name
+    # different towers, floors or units, and area, price, bedrooms and position that
+    # agree wherever both listings have them; a pair without both prices needs
+    # UNPRICED_MIN_SIMILARITY and the same area
+    i, j = pairs[:, 0], pairs[:, 1]
+    similarity = np.empty(len(pairs))
+    for start in range(0, len(pairs), 100_000):
+        a, b = title_codes[i[start:start + 100_000]], title_codes[j[start:start + 100_000]]
+        similarity[start:start + 100_000] = (signatures[a] == signatures[b]).mean(axis=1)
+
+    def values(column):
+        return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+
+    def close(column, tolerance):
+        x, y = values(column)[i], values(column)[j]
+        known = (x > 0) & (y > 0)
+        return ~known | (np.abs(x - y) <= tolerance * np.maximum(x, y))
+
+    price, area = values("Price"), values("Area")
+    priced = (price[i] > 0) & (price[j] > 0)
+    keep = similarity >= np.where(priced, MIN_SIMILARITY, UNPRICED_MIN_SIMILARITY)
+    keep &= priced | ((area[i] > 0) & (area[i] == area[j]))
+    keep &= close("Area", AREA_TOLERANCE) & close("Price", PRICE_TOLERANCE)
+    if "Bedrooms" in df.columns:
+        keep &= close("Bedrooms", 0)
+    lat, lon = (s.to_numpy(dtype=float) for s in coordinates_of(df))
+    has_points = np.isfinite(lat[i]) & np.isfinite(lat[j])
+    distance = haversine(np.where(has_points, lat[i], 0), np.where(has_points, lon[i], 0),
+                         np.where(has_points, lat[j], 0), np.where(has_points, lon[j], 0))
+    location = df["Location"].to_numpy()
+    keep &= np.where(has_points, distance <= MAX_DISTANCE_KM, location[i] == location[j])
+    # A repost may leave a label out, but not name another one
+    for k in np.flatnonzero(keep):
+        a, b = units[title_codes[i[k]]], units[title_codes[j[k]]]
+        keep[k] = a <= b or b <= a
+    return keep
+
+
+def find_near_duplicates(df):
+    """
+    Cluster the listings that are the same apartment posted more than once,
+    e.g. by several brokers, with new Ids and slightly different titles.
+
+    Titles are compared through MinHash LSH within blocks of nearby listings
+    of similar area, so the work is roughly linear in the number of listings
+    rather than quadratic; candidate pairs are then checked on the estimated
+    title similarity, the tower, floor and unit numbers in the titles, area,
+    price, bedrooms and distance, and joined into clusters by connected
+    components.
+
+    Args:
+        df (pd.DataFrame): Listings with "Product Title", "Area", "Price",
+            "Location" and coordinates (see geo.coordinates_of).
+    Returns:
+        np.ndarray: For each row, the position of its cluster's first row
+            (the row's own position if it has no near duplicate).
+    """
+    if df.empty:
+        return np.empty(0, dtype=np.int64)
+    title_codes, titles = pd.factorize(normalize_titles(df["Product Title"]))
+    signatures = minhash_signatures(list(titles))
+    units = unit_labels(titles)
+    pairs = candidate_pairs(df, signatures, title_codes)
+    pairs = pairs[_same_listing(df, pairs, signatures, title_codes, units)]
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(len(df), len(df)))
+    _, labels = connected_components(graph, directed=False)
+    # Name each cluster after its first row
+    first = np.full(labels.max() + 1, len(df), dtype=np.int64)
+    np.minimum.at(first, labels, np.arange(len(df)))
+    canonical = first[labels]
+    # Chains of small differences can join listings that are not alike: every
+    # member must also match the first row itself, or it stays on its own
+    members = np.flatnonzero(canonical != np.arange(len(df)))
+    pairs = np.column_stack([canonical[members], members])
+    unlike = members[~_same_listing(df, pairs, signatures, title_codes, units)]
+    canonical[unlike] = unlike
+    return canonical
+
+
+def drop_near_duplicates(df):
+    """
+    Keep one listing of each near-duplicate cluster: the first one with a
+    price, or the first one if none has a price (in the merged order the
+    first rows are the most complete).
+
+    Args:
+        df (pd.DataFrame): The merged listings.
+    Returns:
+        tuple: (the listings without the near duplicates, a DataFrame of the
+            "Id", "Date Posted" and CLUSTER_ID (the Id of the listing kept) of
+            every listing in a cluster of two or more, and whether it was kept).
+    """
+    canonical = find_near_duplicates(df)
+    positions = np.arange(len(df))
+    sizes = np.bincount(canonical, minlength=len(df))
+    clustered = sizes[canonical] > 1
+    # The kept row of each cluster: priced rows first, then in merged order
+    unpriced = ~(pd.to_numeric(df["Price"], errors="coerce").to_numpy(dtype=float) > 0)
+    order = np.lexsort((positions, unpriced, canonical))
+    first = np.r_[True, canonical[order][1:] != canonical[order][:-1]]
+    kept = np.empty(len(df), dtype=np.int64)
+    kept[canonical[order][first]] = order[first]
+    kept = kept[canonical]
+    ids = df["Id"].to_numpy()
+    clusters = pd.DataFrame({
+        "Id": ids[clustered],
+        "Date Posted": df["Date Posted"].to_numpy()[clustered],
+        CLUSTER_ID: ids[kept[clustered]],
+        "Kept": (kept == positions)[clustered],
+    }).sort_values([CLUSTER_ID, "Kept"], ascending=[True, False], kind="stable")
+    return df[kept == positions], clusters.reset_index(drop=True)
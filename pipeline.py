@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+from metrics import count, stage_timer
+
+
+class StageMetrics:
+    """
+    Running counters of a pipeline stage: throughput and queue depth.
+    """
+
+    def __init__(self):
+        self.submitted = 0
+        self.cached = 0
+        self.resolved = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def sample_queue_depth(self, depth):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    @property
+    def mean_queue_depth(self):
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+    @property
+    def throughput(self):
+        """
+        Detail pages resolved per second of stage run time.
+        """
+        return self.resolved / self.busy_seconds if self.busy_seconds else 0.0
+
+    def summary(self):
+        """
+        Returns:
+            dict: The metrics as plain numbers.
+        """
+        return {
+            "submitted": self.submitted,
+            "cached": self.cached,
+            "resolved": self.resolved,
+            "failed": self.failed,
+            "seconds": round(self.busy_seconds, 3),
+            "per_second": round(self.throughput, 2),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_queue_depth": round(self.mean_queue_depth, 2),
+        }
+
+    def __str__(self):
+        s = self.summary()
+        return (f"{s['resolved']}/{s['submitted']} resolved ({s['failed']} failed, {s['cached']} from cache) in {s['seconds']}s, "
+                f"{s['per_second']}/s, queue depth max {s['max_queue_depth']} mean {s['mean_queue_depth']}")
+
+
+class CoordinateStage:
+    """
+    Resolve coordinates for the listing stubs of a search page concurrently.
+
+    The search page loop only parses cards into stubs; this stage puts their
+    detail URLs on a bounded asyncio queue, lets `workers` coroutines fetch and
+    parse them, and writes the coordinates back into the stubs before the page
+    is flushed to CSV. With a CoordinateCache, cached product IDs never reach
+    the queue and fresh results are written back to the cache.
+    """
+
+    def __init__(self, fetcher, parse_coordinates, base_url, workers=8, queue_size=32, cache=None):
+        """
+        Args:
+            fetcher (HttpFetcher or SeleniumFetcher): The fetcher used for detail pages.
+            parse_coordinates (callable): Turns detail page HTML into "lat, lon" or "N/A".
+            base_url (str): The site root prepended to relative hrefs.
+            workers (int): Number of detail pages resolved at once.
+            queue_size (int): Maximum number of pending detail URLs.
+            cache (CoordinateCache): Consulted before any fetch, or None.
+        Returns:
+            None
+        """
+        self.fetcher = fetcher
+        self.parse_coordinates = parse_coordinates
+        self.base_url = base_url
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache = cache
+        self.metrics = StageMetrics()
+
+    async def _worker(self, queue, stubs):
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            index, url = item
+            try:
+                with stage_timer("detail_fetch"):
+                    detail = await self.fetcher.afetch(url, "lazyload")
+                if detail.ok:
+                    with stage_timer("detail_parse"):
+                        coordinates = self.parse_coordinates(detail.text)
+                    stubs[index]["Coordinates"] = coordinates
+                    if self.cache is not None and coordinates != "N/A":
+                        self.cache.put(stubs[index]["Id"], coordinates, detail.text)
+                    self.metrics.resolved += 1
+                    count("scraper_detail_pages_total", outcome="resolved")
+                else:
+                    self.metrics.failed += 1
+                    count("scraper_detail_pages_total", outcome="failed")
+            except Exception as e:
+                print(f"Error resolving coordinates for {url}: {e}")
+                self.metrics.failed += 1
+                count("scraper_detail_pages_total", outcome="failed")
+            finally:
+                queue.task_done()
+
+    async def aresolve(self, stubs):
+        """
+        Fill in "Coordinates" for every stub that has an "href".
+
+        Args:
+            stubs (list): Listing dicts from scraping.parse_listing_card.
+        Returns:
+            list: The same stubs, with coordinates joined back in.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        n_workers = max(1, min(self.workers, len(stubs)))
+        tasks = [asyncio.create_task(self._worker(queue, stubs)) for _ in range(n_workers)]
+        started = time.perf_counter()
+        try:
+            for index, stub in enumerate(stubs):
+                if not stub.get("href"):
+                    continue
+                if self.cache is not None:
+                    coordinates = self.cache.get(stub["Id"])
+                    if coordinates is not None:
+                        stub["Coordinates"] = coordinates
+                        self.metrics.cached += 1
+                        count("scraper_detail_pages_total", outcome="cached")
+                        continue
+                self.metrics.submitted += 1
+                await queue.put((index, f"{self.base_url}{stub['href']}"))
+                self.metrics.sample_queue_depth(queue.qsize())
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.metrics.busy_seconds += time.perf_counter() - started
+        return stubs
+
+    def resolve(self, stubs):
+        """
+        Blocking version of aresolve.
+        """
+        return asyncio.run(self.aresolve(stubs))
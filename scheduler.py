@@ -0,0 +1,294 @@
+import os
+import queue
+import time
+from multiprocessing import Process, Queue
+
+from checkpoint import CheckpointJournal
+from coord_cache import CoordinateCache
+from dedup_index import DedupIndex, DedupIndexCache
+from driver_pool import DriverPool
+from fetcher import make_fetcher
+from metrics import REGISTRY, GcMonitor, GcPolicy, exporting, merge_snapshots, sample_memory
+from pipeline import CoordinateStage
+from scraping import BASE_URL, FINAL_PAGE_MARKERS, append_rows, parse_coordinates, scrape_page, setup_driver
+from targets import Target, district_target
+
+# Dedup indexes (SQLite connections) kept open at once per process
+MAX_OPEN_INDEXES = 64
+# Tries of a page whose worker failed on it before the run gives up on the page
+MAX_PAGE_ATTEMPTS = 3
+
+
+def unseen_rows(rows, dedup_index):
+    """
+    The rows whose (Id, Date Posted) is neither in the dedup index nor earlier in rows.
+
+    Workers check the index before sending rows, but two of them can scrape
+    the same listing (e.g. on pages that shifted while being read) before
+    the parent has written either copy, so the parent checks again.
+
+    Args:
+        rows (list): Rows in scraping.COLUMNS order.
+        dedup_index (DedupIndex): The index of the CSV the rows go to.
+    Returns:
+        list: The rows to append, in order.
+    """
+    keys = set()
+    unseen = []
+    for row in rows:
+        key = (str(row[0]), str(row[1]))
+        if key in keys or dedup_index.contains(*key):
+            continue
+        keys.add(key)
+        unseen.append(row)
+    return unseen
+
+
+def scrape_worker(worker_id, task_queue, result_queue, targets, backend, base_url, detail_workers, cache_path,
+                  gc_policy="auto", drivers=1):
+    """
+    Pull (target key, page) tasks from the shared queue until a None sentinel arrives.
+
+    The fetcher and its pool of Chrome drivers, the coordinate cache and the
+    dedup indexes are opened once and reused for every task, whatever its
+    category or city. Rows are sent back to the parent, which is the only
+    process writing the CSV files, together with a snapshot of the worker's
+    metrics.
+
+    Args:
+        worker_id (int): The worker number, for log messages.
+        task_queue (Queue): The shared queue of (target key, page) tasks.
+        result_queue (Queue): Where (worker_id, target key, page, status, rows, page_count,
+            metrics snapshot) results go.
+        targets (dict): Target key -> Target (see targets.py).
+        backend (str): The fetch backend, see fetcher.make_fetcher.
+        base_url (str): The site root.
+        detail_workers (int): Number of detail pages fetched at once.
+        cache_path (str): The coordinate cache file, or None.
+        gc_policy (str): When to collect garbage, see metrics.GcPolicy.
+        drivers (int): Chrome drivers kept warm by the worker (see driver_pool.DriverPool).
+    Returns:
+        None
+    """
+    # A forked worker starts with a copy of the parent's metrics
+    REGISTRY.reset(f"worker-{worker_id}")
+    gc_monitor = GcMonitor().start()
+    gc_policy = GcPolicy(gc_policy)
+    driver_pool = DriverPool(setup_driver, size=drivers)
+    fetcher = make_fetcher(backend, setup_driver, concurrency=detail_workers, final_page_markers=FINAL_PAGE_MARKERS,
+                           pool=driver_pool)
+    coordinate_cache = CoordinateCache(cache_path) if cache_path else None
+    coordinate_stage = CoordinateStage(fetcher, parse_coordinates, base_url, workers=detail_workers,
+                                       cache=coordinate_cache)
+    dedup_indexes = DedupIndexCache(MAX_OPEN_INDEXES)
+    try:
+        if backend == "selenium":
+            # Start the browsers while the other workers do the same, not on the first task
+            driver_pool.warm()
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            key, page = task
+            target = targets[key]
+            try:
+                result = scrape_page(fetcher, coordinate_stage, dedup_indexes.get(target.csv_path), key, page,
+                                     base_url, target)
+                status, rows, page_count = result.status, result.rows, result.page_count
+                del result
+                gc_policy.after_page()
+            except Exception as e:
+                print(f"Worker {worker_id}: error on {key} page {page}: {e}")
+                status, rows, page_count = "error", [], None
+            sample_memory()
+            result_queue.put((worker_id, key, page, status, rows, page_count, REGISTRY.snapshot()))
+    finally:
+        gc_monitor.stop()
+        gc_policy.close()
+        dedup_indexes.close()
+        fetcher.close()
+        driver_pool.close()
+        print(f"Worker {worker_id} detail pages: {coordinate_stage.metrics}")
+        if coordinate_cache is not None:
+            print(f"Worker {worker_id} coordinate cache: {coordinate_cache.stats()}")
+            coordinate_cache.close()
+
+
+def run_scheduler(target_list, workers=3, backend="selenium", base_url=BASE_URL, detail_workers=8,
+                  cache_path="data/coordinate_cache.sqlite", journal_path="data/scrape_journal.jsonl", resume=False,
+                  gc_policy="auto", metrics_file=None, metrics_port=None, drivers=1):
+    """
+    Scrape every page of every target with a pool of long-lived workers.
+
+    A target is a listing category in one district of a city (see
+    targets.py); the same workers serve every target of the run, however
+    many there are. Page 1 of each target is queued first. Its pagination
+    bar tells how many pages the target has, and the remaining pages are
+    then queued as individual (target, page) tasks, so a worker that
+    finishes early simply pulls the next page of whichever target still has
+    work. When a page has no pagination bar, the next page is queued after
+    each page that still has listings.
+
+    A page whose worker failed on it is queued again, up to
+    MAX_PAGE_ATTEMPTS tries; the pages given up on are journaled as errors
+    and listed in the summary, and a later resume tries them again.
+
+    Every finished page is recorded in a CheckpointJournal after its rows are
+    on disk. With resume=True, pages already in the journal are skipped and
+    rows from a page that was cut off mid-write are removed first.
+
+    The metrics of the workers (see metrics.py) are merged with the parent's
+    and, if asked, appended to metrics_file and served on metrics_port.
+
+    Args:
+        target_list (list): The Targets to scrape; a district slug stands for
+            the apartments for sale in that Hanoi district.
+        workers (int): Number of worker processes.
+        backend (str): The fetch backend, see fetcher.make_fetcher.
+        base_url (str): The site root.
+        detail_workers (int): Number of detail pages fetched at once per worker.
+        cache_path (str): The coordinate cache file, or None to disable it.
+        journal_path (str): The checkpoint journal.
+        resume (bool): Continue the run recorded in the journal instead of starting over.
+        gc_policy (str): When the workers collect garbage, see metrics.GcPolicy.
+        metrics_file (str): JSONL file the metrics are appended to every 10 seconds, or None.
+        metrics_port (int): Port to serve the metrics on in the Prometheus format, or None.
+        drivers (int): Chrome drivers per worker. With more than one, a worker
+            loads that many detail pages in the browser at once.
+    Returns:
+        dict: Per target key, the number of pages scraped and rows written,
+            the failed tries ("errors") and the pages given up on ("given_up").
+    """
+    os.makedirs("data", exist_ok=True)
+    targets = {}
+    for target in target_list:
+        target = target if isinstance(target, Target) else district_target(target)
+        targets[target.key] = target
+    task_queue = Queue()
+    result_queue = Queue()
+
+    journal = CheckpointJournal(journal_path, resume=resume)
+    if resume:
+        for key, target in targets.items():
+            removed = journal.recover_csv(key, target.csv_path)
+            if removed:
+                print(f"{key}: removed {removed} bytes of unjournaled rows from the CSV.")
+                dedup_index = DedupIndex(target.csv_path)
+                dedup_index.rebuild()
+                dedup_index.close()
+
+    # The parent is the only writer of the CSVs and their dedup indexes
+    dedup_indexes = DedupIndexCache(MAX_OPEN_INDEXES)
+    if cache_path:
+        # Seed once here rather than racing to do it in every worker
+        coordinate_cache = CoordinateCache(cache_path)
+        for target in targets.values():
+            coordinate_cache.seed_from_csv(target.csv_path)
+        coordinate_cache.close()
+    summary = {key: {"pages": 0, "rows": 0, "page_count": None, "errors": 0, "given_up": []} for key in targets}
+    attempts = {}  # (target key, page) -> failed tries
+
+    pending = 0
+    for key in targets:
+        pages = journal.pages_to_do(key) if resume else [1]
+        if resume and pages:
+            print(f"{key}: {len(pages)} pages to do.")
+        summary[key]["page_count"] = journal.page_counts.get(key) if resume else None
+        for page in pages:
+            task_queue.put((key, page))
+            pending += 1
+    print(f"{len(targets)} targets, {pending} pages queued.")
+
+    processes = [
+        Process(target=scrape_worker,
+                args=(i, task_queue, result_queue, targets, backend, base_url, detail_workers, cache_path,
+                      gc_policy, drivers))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    started = time.perf_counter()
+    # The workers' latest snapshots, merged with the parent's metrics for export
+    worker_metrics = {}
+
+    def collect_metrics():
+        return merge_snapshots([REGISTRY.snapshot(), *worker_metrics.values()])
+
+    with exporting(collect_metrics, metrics_file=metrics_file, metrics_port=metrics_port):
+        try:
+            while pending:
+                try:
+                    worker_id, key, page, status, rows, page_count, snapshot = result_queue.get(timeout=5)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        print(f"All workers exited with {pending} tasks left. Stopping...")
+                        break
+                    continue
+                pending -= 1
+                worker_metrics[worker_id] = snapshot
+                stats = summary[key]
+
+                if status == "error":
+                    stats["errors"] += 1
+                    attempts[key, page] = attempts.get((key, page), 0) + 1
+                    if attempts[key, page] < MAX_PAGE_ATTEMPTS:
+                        task_queue.put((key, page))
+                        pending += 1
+                    else:
+                        print(f"{key}: giving up on page {page} after {MAX_PAGE_ATTEMPTS} tries.")
+                        stats["given_up"].append(page)
+                        journal.record(key, page, "error")
+                    continue
+                if status != "ok":
+                    journal.record(key, page, status)
+                    continue
+
+                stats["pages"] += 1
+                csv_file_path = targets[key].csv_path
+                dedup_index = dedup_indexes.get(csv_file_path)
+                rows = unseen_rows(rows, dedup_index)
+                csv_size = append_rows(csv_file_path, rows, dedup_index)
+                if rows:
+                    stats["rows"] += len(rows)
+                    print(f"Data saved for {key} page {page} ({len(rows)} new rows).")
+                journal.record(key, page, "ok", ids=[row[0] for row in rows],
+                               page_count=page_count if page == 1 else None, csv_size=csv_size)
+
+                if page == 1 and page_count is not None:
+                    # The real page count is known: queue every remaining page at once
+                    stats["page_count"] = page_count
+                    for next_page in range(2, page_count + 1):
+                        task_queue.put((key, next_page))
+                        pending += 1
+                    print(f"{key}: {page_count} pages queued.")
+                elif stats["page_count"] is None:
+                    # No pagination bar: keep probing one page at a time
+                    task_queue.put((key, page + 1))
+                    pending += 1
+        finally:
+            for _ in processes:
+                task_queue.put(None)
+            for process in processes:
+                process.join()
+            dedup_indexes.close()
+
+    elapsed = time.perf_counter() - started
+    total_pages = sum(stats["pages"] for stats in summary.values())
+    print(f"Scraped {total_pages} pages of {len(targets)} targets in {elapsed:.1f}s with {workers} workers.")
+    # One line per category and city: a run can have thousands of targets
+    partitions = {}
+    for key, stats in summary.items():
+        target = targets[key]
+        totals = partitions.setdefault((target.category, target.city), {"targets": 0, "pages": 0, "rows": 0,
+                                                                        "errors": 0})
+        totals["targets"] += 1
+        for name in ("pages", "rows", "errors"):
+            totals[name] += stats[name]
+    for (category, city), totals in partitions.items():
+        print(f"  {category}/{city}: {totals['targets']} targets, {totals['pages']} pages, "
+              f"{totals['rows']} new rows, {totals['errors']} errors")
+    for key, stats in summary.items():
+        if stats["given_up"]:
+            print(f"  {key}: gave up on pages {sorted(stats['given_up'])} (run again with --resume to retry them)")
+    return summary
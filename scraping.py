@@ -1,60 +1,48 @@
-import time
-import psutil
-import gc
+import html
 import re
-import threading
-import csv
 import os
+from collections import namedtuple
+from functools import lru_cache
 import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
-
-
-districts = [
-    "hoan-kiem",
-    "thanh-xuan",
-    "cau-giay",
-    "nam-tu-liem",
-    "bac-tu-liem",
-    "hai-ba-trung",
-    "dong-da",
-    "ha-dong",
-    "hoang-mai",
-    "long-bien",
-    "tay-ho",
-    "ba-dinh",
+import lxml.html
+from lxml import etree
+from dedup_index import DedupIndex
+from checkpoint import fsync_append
+from coord_cache import CoordinateCache
+from fetcher import make_fetcher
+from locations import DISTRICT_SLUGS
+from metrics import GcPolicy, count, exporting, stage_timer
+from pipeline import CoordinateStage
+
+
+# URL slugs of the districts to scrape; locations.DISTRICTS maps them to names and IDs
+districts = list(DISTRICT_SLUGS)
+
+# Requests Chrome never has to make for us: the listings and the map iframe's
+# data-src are in the HTML, so images, fonts, styles, maps, ads and trackers
+# only cost bandwidth and memory. Patterns as Network.setBlockedURLs takes them.
+BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico", "*.mp4",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+    "*google.com/maps*", "*maps.googleapis.com*", "*maps.gstatic.com*",
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*facebook.com/tr*", "*connect.facebook*", "*tiktok.com*", "*clarity.ms*", "*hotjar*",
 ]
 
-def print_memory_usage(stop_event):
-    """
-    Print memory usage every 10 seconds until stop_event is set.
-    
-    Args:
-        stop_event (threading.Event): An event to stop the memory monitoring thread.
-    returns:
-        None
-    """
-    process = psutil.Process()  # Current process
-    while not stop_event.is_set():
-        mem_info = process.memory_info()
-        rss_mb = mem_info.rss / 1024 / 1024  # Resident Set Size in MB
-        vms_mb = mem_info.vms / 1024 / 1024  # Virtual Memory Size in MB
-        print(f"Memory Usage - RSS: {rss_mb:.2f} MB, VMS: {vms_mb:.2f} MB")
-        time.sleep(10)  # Wait 10 seconds
-    return None
 
-def setup_driver():
+def setup_driver(block_resources=True, page_load_strategy="eager"):
     """
     Set up a Chrome WebDriver with options to avoid detection.
     
     Args:
-        None
+        block_resources (bool): Block the requests in BLOCKED_URLS through the
+            Chrome DevTools Protocol.
+        page_load_strategy (str): "eager" returns from get() once the HTML is
+            parsed (DOMContentLoaded) instead of after every subresource loaded
+            ("normal"); the fetchers wait for the element they need anyway.
     Returns:
         driver (webdriver.Chrome): A Chrome WebDriver instance.
     """
@@ -64,6 +52,9 @@ def setup_driver():
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--disable-extensions")
+    chrome_options.page_load_strategy = page_load_strategy
+    if block_resources:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
     # Add user-agent to mimic a real browser
     chrome_options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36")
     # Disable automation flags to avoid detection
@@ -76,238 +67,465 @@ def setup_driver():
     driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
         "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
     })
+    if block_resources:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
     return driver
 
-def check_duplicate_in_csv(csv_file_path, product_id, date_element):
+COLUMNS = [
+    "Id", "Date Posted", "Product Title", "Price", "Area", "Price per m²",
+    "Bedrooms", "Toilets", "Location", "Coordinates"
+]
+
+BASE_URL = "https://batdongsan.com.vn"
+NO_RESULTS_TEXT = "Không có kết quả nào phù hợp"
+# Pages that are complete without re__srp-list, so the HTTP backend need not retry them in Chrome
+FINAL_PAGE_MARKERS = (NO_RESULTS_TEXT, "error-content")
+# scrape_district gives up on a district after this many failed search pages in a row
+MAX_CONSECUTIVE_ERRORS = 3
+
+
+def _has_class(class_name):
+    # XPath test for a class token, as BeautifulSoup's class_="name" matches
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def _class_is(classes):
+    # XPath test for the whole class attribute, as BeautifulSoup's class_="a b" matches
+    return f"normalize-space(@class) = '{classes}'"
+
+
+# Compiled once: the selectors of the search page and of a listing card
+_TEXT = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]", smart_strings=False)
+_ERROR_CONTENT = etree.XPath(f"//div[{_has_class('error-content')}]")
+_SRP_LIST = etree.XPath(f"//div[{_has_class('re__srp-list')}]")
+_CARDS = etree.XPath(f".//div[{_has_class('js__card')}]")
+_IN_VERIFIED_SIMILAR = etree.XPath(f"ancestor::div[{_has_class('re__listing-verified-similar-v2')}]")
+_PRODUCT_LINK = etree.XPath(f".//a[{_has_class('js__product-link-for-product-id')}]")
+_INFO = etree.XPath(f".//div[{_has_class('re__card-info')}]")
+_PUBLISHED_AT = etree.XPath(f".//span[{_has_class('re__card-published-info-published-at')}]")
+_LOCATION = etree.XPath(f".//div[{_has_class('re__card-location')}]")
+_SPAN = etree.XPath(".//span")
+# The text fields of a card, as (column, class attribute of its span); targets.py overrides them per category
+CARD_FIELDS = (
+    ("Product Title", "pr-title js__card-title"),
+    ("Price", "re__card-config-price js__card-config-item"),
+    ("Area", "re__card-config-area js__card-config-item"),
+    ("Price per m²", "re__card-config-price_per_m2 js__card-config-item"),
+    ("Bedrooms", "re__card-config-bedroom js__card-config-item"),
+    ("Toilets", "re__card-config-toilet js__card-config-item"),
+)
+_PAGINATION = etree.XPath(f"//div[{_has_class('re__pagination-group')}]")
+_PAGINATION_PIDS = etree.XPath(".//*[@pid]/@pid", smart_strings=False)
+_PAGINATION_NUMBERS = etree.XPath(f".//a[{_has_class('re__pagination-number')}]")
+
+# Detail pages: the map iframe is found by scanning the HTML instead of parsing it.
+# Comments, scripts and styles are matched too, only so that tags inside them are skipped.
+_IFRAME_SCAN = re.compile(
+    r"""<!--.*?-->|<(script|style)\b.*?</\1\s*>|<iframe(?=[\s/>])((?:[^>"']|"[^"]*"|'[^']*')*)>""",
+    re.IGNORECASE | re.DOTALL)
+_ATTRIBUTE = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+_COORDINATES = re.compile(r"q=([-+]?\d+\.\d+),([-+]?\d+\.\d+)")
+
+
+@lru_cache(maxsize=None)
+def card_field_selectors(fields=CARD_FIELDS):
     """
-    Check if a product_id and date_element pair exists in the CSV.
+    Compile the selectors of a set of card fields, once per distinct set.
+
     Args:
-        csv_file_path (str): The path to the CSV file.
-        product_id (str): The product ID to check.
-        date_element (str): The date element to check.
+        fields (tuple): (column, class attribute) pairs, as CARD_FIELDS; a None
+            class attribute leaves the column "N/A".
     Returns:
-        bool: True if the pair exists, False otherwise.
+        tuple: (column, compiled XPath or None) pairs.
     """
-    if not os.path.exists(csv_file_path):
-        return False  # No file, no duplicates
-    
-    with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if (row["Id"] == product_id and 
-                row["Date Posted"] == date_element):
-                return True
-    return False
+    return tuple((column, etree.XPath(f".//span[{_class_is(classes)}]") if classes else None)
+                 for column, classes in fields)
+
+
+_CARD_TEXT_FIELDS = card_field_selectors(CARD_FIELDS)
+
+
+def parse_html(page_source):
+    """
+    Parse a page with lxml.
+
+    Args:
+        page_source (str): The HTML.
+    Returns:
+        lxml.html.HtmlElement: The document root (an empty document for empty HTML).
+    """
+    try:
+        return lxml.html.document_fromstring(page_source)
+    except ValueError:
+        # A str with an XML encoding declaration has to be parsed from bytes
+        return lxml.html.document_fromstring(page_source.encode("utf-8"),
+                                             parser=lxml.html.HTMLParser(encoding="utf-8"))
+    except etree.ParserError:
+        return lxml.html.document_fromstring("<html></html>")
+
+
+def text_of(element):
+    """
+    Returns:
+        str: The text of an element and its descendants, without scripts and styles.
+    """
+    return "".join(_TEXT(element))
+
+
+def _first(matches):
+    return matches[0] if matches else None
 
 
-def scrape_district(district, start_page, end_page):
-    #explain the function
+def is_end_of_results(page, title=""):
+    """
+    Check if a search page is the "no results" / error page shown past the last page.
+
+    Args:
+        page (HtmlElement): The parsed search page, from parse_html.
+        title (str): The document title.
+    Returns:
+        bool: True if the page has no more listings.
+    """
+    return bool(_ERROR_CONTENT(page) or "404" in title or NO_RESULTS_TEXT in text_of(page))
+
+
+def find_srp_list(page):
+    """
+    Returns:
+        HtmlElement: The re__srp-list container of a search page, or None.
+    """
+    return _first(_SRP_LIST(page))
+
+
+def extract_listing_cards(srp_list):
+    """
+    Find the listing cards in the search results container, skipping ads,
+    promoted links and the verified similar listings section.
+
+    Args:
+        srp_list (HtmlElement): The re__srp-list container.
+    Returns:
+        list: The listing card elements.
+    """
+    listings = []
+    for card in _CARDS(srp_list):
+        card_classes = " ".join(card.get("class", "").split())
+        # Skip if it’s an ad or has prid="0"
+        if "promoted-ads-appearance-position" in card_classes or card.get("prid", "0") == "0":
+            continue
+        # Skip if it’s inside the verified similar listings section
+        if _IN_VERIFIED_SIMILAR(card):
+            continue
+        # Skip promotional links
+        product_link = _first(_PRODUCT_LINK(card))
+        if product_link is not None and "js__product-link-promotion-ads" in " ".join(product_link.get("class", "").split()):
+            continue
+        listings.append(card)
+    return listings
+
+
+def parse_listing_card(listing, fields=_CARD_TEXT_FIELDS):
+    """
+    Extract the fields of one listing card.
+
+    Args:
+        listing (HtmlElement): The listing card.
+        fields (tuple): The text field selectors, from card_field_selectors.
+    Returns:
+        dict: The row fields (Coordinates is "N/A") plus the detail page "href",
+            or None if the card has no info section.
+    """
+    product_link = _first(_PRODUCT_LINK(listing))
+    product_id = product_link.attrib["data-product-id"] if product_link is not None else "N/A"
+    if not _INFO(listing):
+        return None  # Skip if no info div found
+
+    row = {"Id": product_id}
+    date_element = _first(_PUBLISHED_AT(listing))
+    row["Date Posted"] = date_element.attrib["aria-label"] if date_element is not None else "N/A"
+    for column, selector in fields:
+        element = _first(selector(listing)) if selector is not None else None
+        row[column] = text_of(element).strip() if element is not None else "N/A"
+    location = _first(_LOCATION(listing))
+    row["Location"] = text_of(_SPAN(location)[0]).strip() if location is not None else "N/A"
+    row["Coordinates"] = "N/A"
+    row["href"] = product_link.attrib["href"] if product_link is not None else None
+    return row
+
+
+def parse_coordinates(detail_page_source):
+    """
+    Extract "lat, lon" from the map iframe of a listing detail page.
+
+    Only the first iframe with the "lazyload" class is read, as when the page
+    was parsed with BeautifulSoup, but it is found with a pattern scan rather
+    than by parsing the whole page.
+
+    Args:
+        detail_page_source (str): The detail page HTML.
+    Returns:
+        str: The coordinates, e.g. "21.021807, 105.857699", or "N/A".
+    """
+    attributes = None
+    for match in _IFRAME_SCAN.finditer(detail_page_source):
+        if match.group(2) is None:
+            continue  # a comment, script or style
+        tag = {name.lower(): value for name, value in _ATTRIBUTE.findall(match.group(2))}
+        if "lazyload" in html.unescape(tag.get("class", "").strip("\"'")).split():
+            attributes = tag
+            break
+    if attributes is None or "data-src" not in attributes:
+        print("No iframe found on detail page")
+        return "N/A"
+    iframe_url = html.unescape(attributes["data-src"].strip("\"'"))
+    # Extract lat/lon from URL using regex
+    match = _COORDINATES.search(iframe_url)
+    if not match:
+        print(f"No coordinates found in iframe URL: {iframe_url}")
+        return "N/A"
+    lat, lon = match.groups()
+    return f"{lat}, {lon}"
+
+
+def parse_page_count(page):
+    """
+    Read the number of result pages from the pagination bar of a search page.
+
+    Args:
+        page (HtmlElement): The parsed search page.
+    Returns:
+        int: The highest page number linked from the pagination, or None if
+            the page has no pagination bar.
+    """
+    pagination = _first(_PAGINATION(page))
+    if pagination is None:
+        return None
+    pages = [1]
+    for pid in _PAGINATION_PIDS(pagination):
+        if pid.isdigit():
+            pages.append(int(pid))
+    for element in _PAGINATION_NUMBERS(pagination):
+        number = text_of(element).strip()
+        if number.isdigit():
+            pages.append(int(number))
+    return max(pages)
+
+
+def csv_path_for(district):
+    """
+    Returns:
+        str: The raw CSV file of a district.
+    """
+    return f"data/filtered_real_estate_listings_{district}.csv"
+
+
+def page_url(district, page, base_url=BASE_URL, url_path=None):
+    """
+    Returns:
+        str: The URL of a search results page of a district: of its apartments
+            for sale, or of url_path (see targets.Target).
+    """
+    first_page_url = f"{base_url}/{url_path or f'ban-can-ho-chung-cu-{district}'}"
+    return first_page_url if page == 1 else f"{first_page_url}/p{page}"
+
+
+# Outcome of scraping one search page.
+#   status:     "ok", "end" (past the last page) or "error" (unexpected page, debug saved)
+#   rows:       the new (non-duplicate) rows, in COLUMNS order
+#   page_count: the page count read from the pagination bar (None unless status is "ok")
+PageResult = namedtuple("PageResult", ["status", "rows", "page_count"])
+
+
+def scrape_page(fetcher, coordinate_stage, dedup_index, district, page, base_url=BASE_URL, target=None):
+    """
+    Scrape one search results page, resolving the coordinates of its new listings,
+    and count its outcome in scraper_pages_total.
+
+    Args:
+        fetcher (HttpFetcher or SeleniumFetcher): The fetcher for the search page.
+        coordinate_stage (CoordinateStage): Resolves the detail pages.
+        dedup_index (DedupIndex): The (Id, Date Posted) index of the district CSV.
+        district (str): The district slug (the target key with a target).
+        page (int): The page number.
+        base_url (str): The site root.
+        target (Target): The category and fields to scrape (default: apartments for sale).
+    Returns:
+        PageResult: The outcome and the new rows.
+    """
+    result = _scrape_page(fetcher, coordinate_stage, dedup_index, district, page, base_url, target)
+    count("scraper_pages_total", status=result.status)
+    return result
+
+
+def _scrape_page(fetcher, coordinate_stage, dedup_index, district, page, base_url, target):
+    url = page_url(district, page, base_url, target.url_path if target is not None else None)
+    fields = card_field_selectors(target.fields) if target is not None else _CARD_TEXT_FIELDS
+    print(f"Scraping page {page}... {url}")
+
+    result = fetcher.fetch(url, "re__srp-list")
+    page_source = result.text
+    with stage_timer("parse"):
+        document = parse_html(page_source)
+    if not result.ok:
+        # Check page source to confirm end of pagination
+        if NO_RESULTS_TEXT in text_of(document) or _ERROR_CONTENT(document) or result.status == 404:
+            print(f"No more listings found beyond page {page-1} for {district}. Stopping...")
+            return PageResult("end", [], None)
+        print(f"Timeout waiting for re__srp-list on {url} (Unexpected, debug saved)")
+        with open(f"debug_{district.replace('/', '_')}_page_{page}.html", "w") as f:
+            f.write(page_source)
+        return PageResult("error", [], None)
+
+    # **Detect if the error page is shown**
+    if is_end_of_results(document, result.title):
+        print("Error page detected. Stopping...")
+        return PageResult("end", [], None)
+
+    # Find the main listing container
+    with stage_timer("parse"):
+        srp_list = find_srp_list(document)
+        listings = extract_listing_cards(srp_list) if srp_list is not None else []
+        rows = [parse_listing_card(listing, fields) for listing in listings]
+    if srp_list is None:
+        print("No listing container found. Stopping...")
+        return PageResult("end", [], None)
+    if not listings:
+        print(f"No more listings found on page {page}. Stopping this process...")
+        return PageResult("end", [], None)
+
+    # Drop duplicates before paying for any detail page
+    stubs = []
+    with stage_timer("dedup"):
+        for row in rows:
+            if row is None:
+                count("scraper_listings_total", outcome="no_info")
+                continue
+             # Check for duplicates in CSV
+            if dedup_index.contains(row["Id"], row["Date Posted"]):
+                print(f"Skipping duplicate entry from CSV: Product ID {row['Id']}, Date {row['Date Posted']}")
+                count("scraper_listings_total", outcome="duplicate")
+                continue
+            count("scraper_listings_total", outcome="new")
+            stubs.append(row)
+
+    # Resolve all detail pages of the page at once (cached IDs are not fetched)
+    coordinate_stage.resolve(stubs)
+    print(f"Detail pages: {coordinate_stage.metrics}")
+    return PageResult("ok", [[row[column] for column in COLUMNS] for row in stubs], parse_page_count(document))
+
+
+def append_rows(csv_file_path, rows, dedup_index):
+    """
+    Append rows to a district CSV, writing the header if the file is new or
+    empty, and record them in the dedup index.
+
+    The rows are flushed and fsync'd before the index is updated, so an ID is
+    never marked as seen unless its row is on disk.
+
+    Args:
+        csv_file_path (str): The district CSV.
+        rows (list): Rows in COLUMNS order.
+        dedup_index (DedupIndex): The index of that CSV.
+    Returns:
+        int: The CSV size after the append.
+    """
+    csv_size_before = os.path.getsize(csv_file_path) if os.path.exists(csv_file_path) else 0
+    if not rows:
+        return csv_size_before
+    with stage_timer("csv_write"):
+        df_page = pd.DataFrame(rows, columns=COLUMNS)
+        csv_size = fsync_append(csv_file_path, df_page.to_csv(header=(csv_size_before == 0), index=False))
+        dedup_index.add_many(zip(df_page["Id"], df_page["Date Posted"]), csv_size_before)
+    return csv_size
+
+
+def scrape_district(district, start_page, end_page, backend="selenium", base_url=BASE_URL, detail_workers=8,
+                    cache_path="data/coordinate_cache.sqlite", gc_policy="page", metrics_file=None,
+                    metrics_port=None, driver_pool=None, target=None):
     """
     Scrape real estate listings for a specific district on BatDongSan.com.vn
     and save the data to a CSV file.
 
     Args:
         district (str): The district to scrape listings for.
+        start_page (int): The first page to scrape.
+        end_page (int): The last page to scrape.
+        backend (str): "selenium" to load every page in Chrome, or "http" to
+            fetch over plain HTTP and only fall back to Chrome for pages that need JS.
+        base_url (str): The site root, e.g. a local stub server when testing offline.
+        detail_workers (int): Number of detail pages fetched at once for coordinates.
+        cache_path (str): SQLite file of the product Id -> coordinates cache, or None to disable it.
+        gc_policy (str): When to collect garbage, see metrics.GcPolicy.
+        metrics_file (str): JSONL file the metrics are appended to every 10 seconds, or None.
+        metrics_port (int): Port to serve the metrics on in the Prometheus format, or None.
+        driver_pool (DriverPool): Warm drivers shared across districts, or None
+            to start (and quit) a driver for this district only.
+        target (Target): Scrape this target's category, fields and CSV (see
+            targets.py) instead of the district's apartments for sale.
 
     Returns:
         None
     """
+    if target is not None:
+        district = target.key
     print(f"Total pages: {end_page}")
-    print(f"Scraping {district} from page {start_page} to {end_page}...")    
-    # Set up WebDriver
-    # service = Service('/usr/local/bin/chromedriver')  # Update with your correct path
-    driver = setup_driver()
-
-    first_page_url = f"https://batdongsan.com.vn/ban-can-ho-chung-cu-{district}"
-    paginated_url = f"https://batdongsan.com.vn/ban-can-ho-chung-cu-{district}/p{{}}"
-
-    page = 1  # Start from page 1
-    district_data = []  # Temporary list to store data for the current district
-    
-        # Start memory monitoring in a separate thread
-    stop_event = threading.Event()
-    memory_thread = threading.Thread(target=print_memory_usage, args=(stop_event,))
-    memory_thread.daemon = True  # Thread stops when main program exits
-    memory_thread.start()
+    print(f"Scraping {district} from page {start_page} to {end_page}...")
+    fetcher = make_fetcher(backend, setup_driver, concurrency=detail_workers, final_page_markers=FINAL_PAGE_MARKERS,
+                           pool=driver_pool)
+    coordinate_cache = CoordinateCache(cache_path) if cache_path else None
+    coordinate_stage = CoordinateStage(fetcher, parse_coordinates, base_url, workers=detail_workers,
+                                       cache=coordinate_cache)
+    gc_policy = GcPolicy(gc_policy)
     
     # if the .csv file of filtered_real_estate_listings_district exists, then move on, if not create it
-    csv_file_path = f"data/filtered_real_estate_listings_{district}.csv"
+    csv_file_path = target.csv_path if target is not None else csv_path_for(district)
+    os.makedirs(os.path.dirname(csv_file_path) or ".", exist_ok=True)
     if os.path.exists(csv_file_path):
         print(f"CSV file for {district} already exists. Skipping...")
         pass
     else:
         print(f"CSV file for {district} does not exist. Creating...")
         open(csv_file_path, 'w').close()
+    # Load the (Id, Date Posted) index once instead of rescanning the CSV per listing
+    dedup_index = DedupIndex(csv_file_path)
+    if coordinate_cache is not None:
+        # Coordinates already in the CSV are as good as a cache entry
+        coordinate_cache.seed_from_csv(csv_file_path)
     
-    try:  
-        for page in range(start_page, end_page + 1):
-            # Set URL format correctly
-            url = first_page_url if page == 1 else paginated_url.format(page)
-            print(f"Scraping page {page}... {url}")
-
-            try:
-                driver.get(url)
-                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "re__srp-list")))
-            except TimeoutException as e:
-                # Check page source to confirm end of pagination
-                page_source = driver.page_source
-                soup = BeautifulSoup(page_source, "html.parser")
-                if "Không có kết quả nào phù hợp" in soup.text or soup.find("div", class_="error-content"):
-                    print(f"No more listings found beyond page {page-1} for {district}. Stopping...")
-                else:
-                    print(f"Timeout waiting for re__srp-list on {url}: {e} (Unexpected, debug saved)")
-                    with open(f"debug_{district}_page_{page}.html", "w") as f:
-                        f.write(page_source)
-                break
-            # Get HTML content
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, "html.parser")
-
-            # **Detect if the error page is shown**
-            error_message = soup.find("div", class_="error-content")  # Adjust class based on the actual error page
-            if error_message or "404" in driver.title or "Không có kết quả nào phù hợp" in soup.text:
-                print("Error page detected. Stopping...")
-                break
-            
-            # Find the main listing container
-            srp_list = soup.find("div", class_="re__srp-list")
-            if not srp_list:
-                print("No listing container found. Stopping...")
-                break
-
-            # Find all cards within the main container
-            all_cards = srp_list.find_all("div", class_="js__card", recursive=True)
-            # Filter out unwanted cards
-            listings = []
-            for card in all_cards:
-                card_classes = " ".join(card.get("class", []))
-                # Skip if it’s an ad or has prid="0"
-                if ("promoted-ads-appearance-position" in card_classes or 
-                    card.get("prid", "0") == "0"):
-                    # print(f"Skipping ad or prid=0 card: {card_classes}")
-                    continue
-                # Skip if it’s inside the verified similar listings section
-                if card.find_parent("div", class_="re__listing-verified-similar-v2"):
-                    # print(f"Skipping verified similar listing card: {card_classes}")
-                    continue
-                # Skip promotional links
-                product_link = card.find("a", class_="js__product-link-for-product-id")
-                if product_link and "js__product-link-promotion-ads" in " ".join(product_link.get("class", [])):
-                    # print(f"Skipping promotional ad link: {product_link.get('href', 'N/A')}")
-                    continue
-                listings.append(card)
-
-            if not listings:
-                print(f"No more listings found on page {page}. Stopping this process...")
-                break
-
-            for listing in listings:
-                # Extract product_id from the <a> tag
-                product_link = listing.find("a", class_="js__product-link-for-product-id")
-                product_id = product_link["data-product-id"] if product_link else "N/A"
-                # Extract other details from re__card-info
-                
-                info_div = listing.find("div", class_="re__card-info")
-                if not info_div:
-                    continue  # Skip if no info div found
-
-                # Extract Date Listed
-                date_element = listing.find("span", class_="re__card-published-info-published-at")
-                date_element = date_element["aria-label"] if date_element else "N/A"
-                # Extract Product Title
-                product_title = listing.find("span", class_="pr-title js__card-title")
-                product_title = product_title.text.strip() if product_title else "N/A"
-
-                # Extract Price
-                price = listing.find("span", class_="re__card-config-price js__card-config-item")
-                price = price.text.strip() if price else "N/A"
-
-                # Extract Area
-                area = listing.find("span", class_="re__card-config-area js__card-config-item")
-                area = area.text.strip() if area else "N/A"
-
-                # Extract Price per m²
-                price_per_m2 = listing.find("span", class_="re__card-config-price_per_m2 js__card-config-item")
-                price_per_m2 = price_per_m2.text.strip() if price_per_m2 else "N/A"
-
-                # Extract Number of Bedrooms
-                bedroom = listing.find("span", class_="re__card-config-bedroom js__card-config-item")
-                bedroom = bedroom.text.strip() if bedroom else "N/A"
-
-                # Extract Number of Toilets
-                toilet = listing.find("span", class_="re__card-config-toilet js__card-config-item")
-                toilet = toilet.text.strip() if toilet else "N/A"
-
-                # Extract Location
-                location = listing.find("div", class_="re__card-location")
-                location = location.find("span").text.strip() if location else "N/A"
-                
-                # Step 1: Extract the href link
-                link_element = listing.find("a", class_="js__product-link-for-product-id")
-                href = link_element["href"] if link_element else None
-
-                # Step 2: Navigate to the detail page and extract coordinates
-                coordinates = "N/A"
-                if href:
-                    full_url = f"https://batdongsan.com.vn{href}"  # Prepend domain if href is relative
-                    # print(f"Navigating to: {full_url}")
-                    try:
-                        driver.get(full_url)
-                        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "lazyload")))
-                        
-                        detail_page_source = driver.page_source
-                        detail_soup = BeautifulSoup(detail_page_source, "html.parser")
-                        # Step 1: Find the coordinates section
-                        iframe = detail_soup.find("iframe", class_="lazyload")
-                        if iframe and "data-src" in iframe.attrs:
-                            iframe_url = iframe["data-src"]
-                            # Extract lat/lon from URL using regex
-                            match = re.search(r"q=([-+]?\d+\.\d+),([-+]?\d+\.\d+)", iframe_url)
-                            if match:
-                                lat, lon = match.groups()
-                                coordinates = f"{lat}, {lon}"  # e.g., "21.021807, 105.857699"
-                                # print(f"Coordinates found: {coordinates}")
-                            else:
-                                print(f"No coordinates found in iframe URL: {iframe_url}")
-                        else:
-                            print("No iframe found on detail page")
-                        del detail_page_source, detail_soup, iframe, iframe_url
-                        gc.collect()  # Force garbage collection after detail page
-                    except TimeoutException as e:
-                        print(f"Timeout waiting for lazyload on {full_url}: {e}")
-                # Append extracted data as a row with the district name
-                
-                 # Check for duplicates in CSV
-                if check_duplicate_in_csv(csv_file_path, product_id, date_element):
-                    print(f"Skipping duplicate entry from CSV: Product ID {product_id}, Date {date_element}")
+    # Sample memory and GC time into the metrics (and export them) while scraping
+    with exporting(metrics_file=metrics_file, metrics_port=metrics_port):
+        try:
+            errors = 0
+            for page in range(start_page, end_page + 1):
+                result = scrape_page(fetcher, coordinate_stage, dedup_index, district, page, base_url, target)
+                if result.status == "end":
+                    break
+                if result.status == "error":
+                    # The fetcher already retried it: skip the page, unless the site keeps failing
+                    errors += 1
+                    if errors >= MAX_CONSECUTIVE_ERRORS:
+                        print(f"{errors} pages in a row failed for {district}. Stopping...")
+                        break
                     continue
+                errors = 0
+
+                # Save data incrementally after each page (the header is written if the file is empty)
+                if result.rows:
+                    append_rows(csv_file_path, result.rows, dedup_index)
+                    print(f"Data saved for page {page}.")
 
-                district_data.append([product_id, date_element, product_title, price, area, price_per_m2, bedroom, toilet, location, coordinates])
-            
-            # Save data incrementally after each page
-            if district_data:
-                df_page = pd.DataFrame(district_data, columns=[
-                    "Id", "Date Posted", "Product Title", "Price", "Area", "Price per m²", 
-                    "Bedrooms", "Toilets", "Location", "Coordinates"
-                ])
-                mode = "w" if page == 1 else "a"  # Write header on first page, append later
-                df_page.to_csv(f"data/filtered_real_estate_listings_{district}.csv", mode=mode, header=(page == 1), index=False)
-                print(f"Data saved for page {page}.")
-                del df_page, district_data
-                district_data = []  # Reset list
-
-            # Clean up page-level objects
-            del page_source, soup, srp_list, all_cards, listings
-            gc.collect()  # Force garbage collection
-            page += 1
-    finally:
-        # Clear the district data to free up memory
-        # Stop memory monitoring and clean up
-        stop_event.set()  # Signal the thread to stop
-        memory_thread.join()  # Wait for the thread to finish
-        del district_data
-        gc.collect()  # Trigger garbage collection to free up unused memory
-        # Quit Selenium WebDriver
-        driver.quit()
-        print(f"Finished scraping for {district}. Data saved.")
-    return None
\ No newline at end of file
+                # Clean up page-level objects
+                del result
+                gc_policy.after_page()
+        finally:
+            dedup_index.close()
+            gc_policy.close()
+            # Quit Selenium WebDriver / close the HTTP session
+            fetcher.close()
+            print(f"Detail pages for {district}: {coordinate_stage.metrics}")
+            if coordinate_cache is not None:
+                print(f"Coordinate cache: {coordinate_cache.stats()}")
+                coordinate_cache.close()
+            print(f"Finished scraping for {district}. Data saved.")
+    return None
@@ -0,0 +1,306 @@
+import os
+import pickle
+import resource
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from fetch_parse import (DISTRICT_FILES, EMPTY_COUNT, MERGED_FILE, OTHER_UNIT, finish_merged_rows,
+                         prepare_district_frame)
+
+# Helper columns of the sorted runs
+SEQ = '_seq'            # position of the row in the input, which breaks ties in the sort
+ROW_HASH = '_row_hash'  # hash of the text columns, to find duplicate candidates
+RUN = '_run'            # which run a buffered row came from, while merging
+SORT_KEY = [EMPTY_COUNT, "Location", SEQ]
+
+# Duplicate rows are equal in every column, so they share these. Hashing only
+# text columns keeps the hash stable when a numeric column is read as int in
+# one chunk and float in another.
+HASHED_COLUMNS = ["Product Title", "Date Posted", "Location"]
+
+# Rough working copies of a chunk alive at once (read, cleaned, sorted)
+COPIES_PER_CHUNK = 4
+
+
+def peak_rss_mb():
+    """
+    Returns:
+        float: The peak resident set size of this process so far, in MB.
+    """
+    # VmHWM where there is /proc: ru_maxrss carries over the parent's peak across fork and exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _read_columns(file):
+    # The header of a district file, or None when the full merge would skip it
+    if not os.path.exists(file):
+        print(f"File does not exist: {file}")
+        return None
+    if os.path.getsize(file) == 0:
+        print(f"Skipping empty file (0 bytes): {file}")
+        return None
+    try:
+        return list(pd.read_csv(file, nrows=0).columns)
+    except pd.errors.EmptyDataError:
+        print(f"Skipping completely empty file (no headers): {file}")
+    except Exception as e:
+        print(f"Error reading {file}: {e}")
+    return None
+
+
+def _common_dtype(dtypes):
+    # The dtype pd.concat gives a column whose chunks had these dtypes
+    dtypes = list(dict.fromkeys(dtypes))
+    if len(dtypes) == 1:
+        return dtypes[0]
+    if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in dtypes):
+        return np.result_type(*dtypes)
+    return np.dtype(object)
+
+
+def _row_hashes(chunk):
+    columns = [c for c in HASHED_COLUMNS if c in chunk.columns]
+    text = pd.DataFrame({c: chunk[c].astype(str).where(chunk[c].notna(), "\0") for c in columns})
+    return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+
+def _write_run(df, path, block_rows):
+    # A run is a sequence of pickled blocks, so it can be read back a block at a time
+    with open(path, "wb") as f:
+        for start in range(0, len(df), block_rows):
+            pickle.dump(df.iloc[start:start + block_rows], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _merge_runs(run_paths):
+    """
+    K-way merge of sorted runs, holding one block per run at a time.
+
+    Every round, the smallest last key among the buffered blocks is a safe
+    cutoff: no row still on disk can sort before it. Everything up to it is
+    emitted, and the run it came from is refilled.
+
+    Args:
+        run_paths (list): Run files, each sorted by SORT_KEY.
+    Returns:
+        generator: Sorted DataFrame blocks.
+    """
+    readers = {i: _read_run(path) for i, path in enumerate(run_paths)}
+    buffers = {}
+
+    def refill(i):
+        block = next(readers[i], None)
+        if block is None:
+            del readers[i]
+        else:
+            buffers[i] = block.assign(**{RUN: i})
+
+    for i in list(readers):
+        refill(i)
+    while buffers:
+        lasts = pd.concat([block.iloc[-1:] for block in buffers.values()])
+        cutoff = lasts.sort_values(SORT_KEY)[SEQ].iloc[0]
+        pending = pd.concat(list(buffers.values())).sort_values(SORT_KEY)
+        end = int(np.flatnonzero(pending[SEQ].to_numpy() == cutoff)[0]) + 1
+        yield pending.iloc[:end].drop(columns=[RUN])
+
+        rest = pending.iloc[end:]
+        buffers = {i: group for i, group in rest.groupby(RUN, sort=False)}
+        for i in list(readers):
+            if i not in buffers:
+                refill(i)
+
+
+def stream_real_estate_data(district_files=None, output_path=MERGED_FILE, memory_limit_mb=256, fan_in=16,
+                            rent=False):
+    """
+    process_real_estate_data for data that does not fit in memory.
+
+    The district files are read in chunks sized from memory_limit_mb. Each
+    chunk is cleaned and filtered row by row, sorted and written out as a run;
+    the runs are then merged in blocks, fan_in at a time, straight into the
+    output CSV. Duplicate listings are found across all chunks: a hash of the
+    text columns of every row is kept (8 bytes a row), and only the rows whose
+    hash occurs more than once are compared in full.
+
+    The rows written are the same as process_real_estate_data's, in the same
+    order of empty cells and "Location". Listings with the same location keep
+    their input order, where the full merge leaves them in whatever order its
+    quicksort did.
+
+    Args:
+        district_files (list): The district CSV files (defaults to DISTRICT_FILES).
+        output_path (str): Where the merged CSV is written.
+        memory_limit_mb (float): Memory for the rows held at once, beyond the interpreter and libraries.
+        fan_in (int): Runs merged at a time.
+        rent (bool): The listings are rentals, priced by the month (see fetch_parse.finish_merged_rows).
+    Returns:
+        dict: Row counts, the number of runs, the memory limit and the peak RSS.
+    """
+    district_files = district_files or DISTRICT_FILES
+    headers = {}
+    for file in district_files:
+        columns = _read_columns(file)
+        if columns is not None:
+            headers[file] = columns
+    # Columns in the order pd.concat would give them; a column a file lacks is empty in its rows
+    columns = []
+    for file_columns in headers.values():
+        columns += [c for c in file_columns if c not in columns]
+
+    # Size the chunks from a sample of the first file
+    bytes_per_row = 1024
+    if headers:
+        sample = prepare_district_frame(pd.read_csv(next(iter(headers)), nrows=1000), rent)
+        if len(sample):
+            bytes_per_row = max(sample.memory_usage(deep=True).sum() / len(sample), 1)
+    chunk_rows = max(int(memory_limit_mb * 2**20 / (bytes_per_row * COPIES_PER_CHUNK)), 1000)
+    # Blocks much smaller than this cost more in pickling and pandas overhead than they save
+    block_rows = max(chunk_rows // fan_in, 1000)
+    print(f"Streaming merge: chunks of {chunk_rows} rows, about {bytes_per_row:.0f} bytes a row.")
+
+    output_dir = os.path.dirname(output_path) or "."
+    stats = {"rows_read": 0, "rows_written": 0, "duplicates_removed": 0, "runs": 0,
+             "memory_limit_mb": memory_limit_mb}
+    with tempfile.TemporaryDirectory(prefix=".merge_runs_", dir=output_dir) as work_dir:
+        # Pass 1: clean, filter and sort each chunk into a run
+        run_paths = []
+        hashes = []
+        dtypes = {column: [] for column in columns}
+        seq = 0
+        for file, file_columns in headers.items():
+            missing = len(columns) - len(file_columns)
+            for chunk in pd.read_csv(file, chunksize=chunk_rows):
+                chunk.index = pd.RangeIndex(seq, seq + len(chunk))
+                seq += len(chunk)
+                stats["rows_read"] += len(chunk)
+                chunk = prepare_district_frame(chunk, rent)
+                chunk[EMPTY_COUNT] += missing
+                chunk = chunk[(chunk[EMPTY_COUNT] < 3) & ~chunk[OTHER_UNIT]].drop(columns=[OTHER_UNIT])
+                chunk[SEQ] = chunk.index
+                chunk[ROW_HASH] = _row_hashes(chunk)
+                for column in file_columns:
+                    dtypes[column].append(chunk[column].dtype)
+                hashes.append(chunk[ROW_HASH].to_numpy())
+
+                if chunk.empty:
+                    continue
+                run_path = os.path.join(work_dir, f"run-{len(run_paths):05d}.pkl")
+                _write_run(chunk.sort_values(SORT_KEY), run_path, block_rows)
+                run_paths.append(run_path)
+            print(f"Loaded data from: {file}")
+        stats["runs"] = len(run_paths)
+        if not stats["rows_read"]:
+            print("No valid data to process. Exiting.")
+            return stats
+        # A column all-NaN in a file is float there; concat would still give the common dtype
+        dtypes = {column: _common_dtype(found or [np.dtype(float)]) for column, found in dtypes.items()}
+
+        def conform(block):
+            block = block.reindex(columns=columns + [c for c in block.columns if c not in columns])
+            for column, dtype in dtypes.items():
+                if block[column].dtype != dtype:
+                    block[column] = block[column].astype(dtype)
+            return block
+
+        # Pass 2: compare the rows whose hash is not unique, and remove every copy of a duplicate.
+        # Copies share a hash, so the candidates are split by hash into partitions that each
+        # fit in the memory limit, and every partition is checked on its own.
+        all_hashes = np.concatenate(hashes) if hashes else np.array([], dtype=np.uint64)
+        del hashes
+        values, counts = np.unique(all_hashes, return_counts=True)
+        repeated = values[counts > 1]
+        candidate_rows = int(counts[counts > 1].sum())
+        del all_hashes, values, counts
+        duplicate_seqs = []
+        if len(repeated):
+            partitions = max(-(-candidate_rows // chunk_rows), 1)
+            partition_paths = [os.path.join(work_dir, f"candidates-{i:04d}.pkl") for i in range(partitions)]
+            partition_files = [open(path, "wb") for path in partition_paths]
+            try:
+                for run_path in run_paths:
+                    for block in _read_run(run_path):
+                        block = block[np.isin(block[ROW_HASH].to_numpy(), repeated)]
+                        for i, part in block.groupby(block[ROW_HASH].to_numpy() % np.uint64(partitions)):
+                            pickle.dump(part, partition_files[int(i)], protocol=pickle.HIGHEST_PROTOCOL)
+            finally:
+                for f in partition_files:
+                    f.close()
+            for path in partition_paths:
+                blocks = list(_read_run(path))
+                if blocks:
+                    candidates = conform(pd.concat(blocks))
+                    duplicated = candidates[columns].duplicated(keep=False).to_numpy()
+                    duplicate_seqs.append(candidates.loc[duplicated, SEQ].to_numpy())
+                    del blocks, candidates
+                os.remove(path)
+        duplicate_seqs = np.sort(np.concatenate(duplicate_seqs)) if duplicate_seqs else np.array([], dtype=np.int64)
+        stats["duplicates_removed"] = len(duplicate_seqs)
+
+        # Pass 3: merge the runs, fan_in at a time, until one last merge can go to the output
+        level = 0
+        while len(run_paths) > fan_in:
+            merged_paths = []
+            for start in range(0, len(run_paths), fan_in):
+                group = run_paths[start:start + fan_in]
+                merged_path = os.path.join(work_dir, f"merge-{level}-{start // fan_in:05d}.pkl")
+                with open(merged_path, "wb") as f:
+                    for block in _merge_runs(group):
+                        pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+                for path in group:
+                    os.remove(path)
+                merged_paths.append(merged_path)
+            run_paths = merged_paths
+            level += 1
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".csv", dir=output_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                header = True
+                for block in _merge_runs(run_paths):
+                    block = block[~np.isin(block[SEQ].to_numpy(), duplicate_seqs)]
+                    block = finish_merged_rows(conform(block).drop(columns=[EMPTY_COUNT, SEQ, ROW_HASH]), rent)
+                    # A block of only "Giá thỏa thuận" prices would otherwise come out as int
+                    block = block.astype({"Price": float})
+                    if header or len(block):
+                        block.to_csv(f, header=header, index=False)
+                        header = False
+                    stats["rows_written"] += len(block)
+                if header:
+                    # Every row was filtered out: still write the header
+                    empty = conform(pd.DataFrame(columns=columns)).astype({"Price per m²": float})
+                    finish_merged_rows(empty, rent).to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    stats["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    print(f"✔ {stats['rows_written']} of {stats['rows_read']} rows merged from {stats['runs']} sorted runs "
+          f"({stats['duplicates_removed']} duplicate rows removed).")
+    print(f"✔ Peak RSS {stats['peak_rss_mb']} MB, with a memory limit of {memory_limit_mb} MB for the rows.")
+    print(f"✔ Final data has been saved to '{output_path}'.")
+    return stats
@@ -0,0 +1,162 @@
+import copy
+import json
+from collections import namedtuple
+
+from locations import DISTRICT_SLUGS, DISTRICTS_CITY
+from scraping import CARD_FIELDS, COLUMNS
+
+# One scrape target: the search results of a listing category in one district of a city.
+#   key:      "category/city/district", the target's name in tasks, the checkpoint journal and logs
+#   url_path: the path of its first search page, e.g. "ban-can-ho-chung-cu-cau-giay"
+#   csv_path: the raw CSV its listings are appended to
+#   fields:   the card fields, as (column, class attribute of the span) pairs; None leaves a column "N/A"
+Target = namedtuple("Target", ["key", "category", "city", "district", "url_path", "csv_path", "fields"])
+
+# What can be scraped, and where the listings go. A category is the prefix of
+# the search page paths on the site, plus the card fields that differ from
+# scraping.CARD_FIELDS; "rent" marks listings priced by the month, which are
+# merged with their own price rules (see fetch_parse.clean_rent). A city
+# lists the URL slugs of its districts (an empty list scrapes the city-wide
+# pages). Output paths are templates over {category}, {city} and {district};
+# "partitions" overrides them for one "category/city" pair. A JSON file of
+# the same shape (see load_config) adds to or replaces these entries.
+TARGET_CONFIG = {
+    "categories": {
+        "apartment": {"path": "ban-can-ho-chung-cu"},
+        "house": {"path": "ban-nha-rieng"},
+        "street-house": {"path": "ban-nha-mat-pho"},
+        "villa": {"path": "ban-nha-biet-thu-lien-ke"},
+        "land": {"path": "ban-dat", "fields": {"Bedrooms": None, "Toilets": None}},
+        "apartment-rent": {"path": "cho-thue-can-ho-chung-cu", "fields": {"Price per m²": None}, "rent": True},
+        "house-rent": {"path": "cho-thue-nha-rieng", "fields": {"Price per m²": None}, "rent": True},
+    },
+    "cities": {
+        DISTRICTS_CITY: {"districts": DISTRICT_SLUGS},
+        "ho-chi-minh": {"districts": [
+            "quan-1", "quan-3", "quan-4", "quan-5", "quan-6", "quan-7", "quan-8", "quan-10", "quan-11",
+            "quan-12", "binh-thanh", "go-vap", "phu-nhuan", "tan-binh", "tan-phu", "binh-tan", "thu-duc",
+            "nha-be", "binh-chanh", "hoc-mon", "cu-chi", "can-gio",
+        ]},
+        "da-nang": {"districts": ["hai-chau", "thanh-khe", "son-tra", "ngu-hanh-son", "lien-chieu", "cam-le",
+                                  "hoa-vang"]},
+    },
+    # What a run scrapes unless told otherwise: the apartments for sale in Hanoi
+    "default": {"categories": ["apartment"], "cities": ["ha-noi"]},
+    "output": "data/listings/{category}/{city}/filtered_real_estate_listings_{district}.csv",
+    "merged": "data/listings/{category}/{city}/merged_real_estate_listings.csv",
+    "partitions": {
+        # The files fetch_parse has always merged
+        "apartment/ha-noi": {
+            "output": "data/filtered_real_estate_listings_{district}.csv",
+            "merged": "data/merged_real_estate_listings.csv",
+        },
+    },
+}
+
+
+def load_config(path, base=TARGET_CONFIG):
+    """
+    Read a target config from a JSON file, on top of a base config.
+
+    Categories, cities and partitions are merged by name, so a file can add
+    a city or override one category's fields without repeating the rest;
+    the other keys replace the base value.
+
+    Args:
+        path (str): The JSON file.
+        base (dict): The config it extends.
+    Returns:
+        dict: The combined config.
+    """
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    config = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if key in ("categories", "cities", "partitions"):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+def _card_fields(category, overrides):
+    unknown = set(overrides) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Category {category} has fields that are not CSV columns: {sorted(unknown)}")
+    return tuple((column, overrides.get(column, class_attribute)) for column, class_attribute in CARD_FIELDS)
+
+
+def _partition(config, category, city):
+    templates = {"output": config["output"], "merged": config["merged"]}
+    templates.update(config["partitions"].get(f"{category}/{city}", {}))
+    return templates
+
+
+def build_targets(config=TARGET_CONFIG, categories=None, cities=None):
+    """
+    Expand a config into one Target per (category, city, district).
+
+    Args:
+        config (dict): The target config.
+        categories (list): Category names, or None for config["default"]; "all" for every category.
+        cities (list): City names, or None for config["default"]; "all" for every city.
+    Returns:
+        list: The targets, category by category, city by city, in the config's district order.
+    """
+    categories = categories or config["default"]["categories"]
+    cities = cities or config["default"]["cities"]
+    if "all" in categories:
+        categories = list(config["categories"])
+    if "all" in cities:
+        cities = list(config["cities"])
+    for kind, names in (("categories", categories), ("cities", cities)):
+        unknown = [name for name in names if name not in config[kind]]
+        if unknown:
+            raise ValueError(f"Unknown {kind}: {unknown} (known: {sorted(config[kind])})")
+
+    targets = []
+    for category in categories:
+        spec = config["categories"][category]
+        fields = _card_fields(category, spec.get("fields", {}))
+        for city in cities:
+            output = _partition(config, category, city)["output"]
+            # A city without districts is scraped from its city-wide pages
+            for district in config["cities"][city].get("districts") or [city]:
+                targets.append(Target(
+                    key=f"{category}/{city}/{district}",
+                    category=category,
+                    city=city,
+                    district=district,
+                    url_path=f"{spec['path']}-{district}",
+                    csv_path=output.format(category=category, city=city, district=district),
+                    fields=fields,
+                ))
+    return targets
+
+
+def district_target(district):
+    """
+    Returns:
+        Target: The apartments for sale in a Hanoi district, as scraped before targets existed.
+    """
+    return build_targets(categories=["apartment"], cities=["ha-noi"])[DISTRICT_SLUGS.index(district)]
+
+
+def partitions(targets, config=TARGET_CONFIG):
+    """
+    Group targets by (category, city), the unit the merge runs on.
+
+    Args:
+        targets (list): Targets from build_targets.
+        config (dict): The config they were built from.
+    Returns:
+        dict: (category, city) -> (list of raw CSV paths, merged CSV path).
+    """
+    grouped = {}
+    for target in targets:
+        pair = (target.category, target.city)
+        if pair not in grouped:
+            merged = _partition(config, target.category, target.city)["merged"]
+            grouped[pair] = ([], merged.format(category=target.category, city=target.city))
+        grouped[pair][0].append(target.csv_path)
+    return grouped
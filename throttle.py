@@ -0,0 +1,332 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from metrics import REGISTRY, count
+
+# Bits of the challenge and captcha pages served instead of the site when it
+# thinks we are a bot
+BLOCK_PAGE_MARKERS = ("<title>Just a moment...</title>", "Attention Required! | Cloudflare", "cf-chl-", "g-recaptcha")
+
+# Outcomes worth another try: the same request may well work a little later
+RETRYABLE = ("timeout", "server_error", "throttled", "blocked", "error")
+# Outcomes that mean the site is overloaded or annoyed: fetch less at once
+CONGESTION = ("timeout", "server_error", "throttled", "blocked")
+
+
+def classify(status, text, ok=False, final_page_markers=(), block_page_markers=BLOCK_PAGE_MARKERS, timed_out=False):
+    """
+    Name the outcome of a fetch.
+
+    Args:
+        status (int): The HTTP status code, or None (Selenium, or no response at all).
+        text (str): The page source ("" if nothing came back).
+        ok (bool): Whether the page has the element that was waited for.
+        final_page_markers (tuple): Strings of pages that are complete without
+            that element, e.g. "no results".
+        block_page_markers (tuple): Strings of challenge / captcha pages.
+        timed_out (bool): Whether the browser gave up waiting for the element.
+    Returns:
+        str: One of
+            "ok"            the page has the element
+            "not_found"     HTTP 404
+            "throttled"     HTTP 429 Too Many Requests
+            "blocked"       HTTP 403, or a challenge page
+            "server_error"  any other HTTP error status
+            "final"         a complete page without the element
+            "timeout"       no response (a timeout or a connection error), or the
+                            browser gave up waiting for the element
+            "missing"       a page that loaded without the element (e.g. a listing without a map)
+    """
+    if ok:
+        return "ok"
+    if status == 404:
+        return "not_found"
+    if status == 429:
+        return "throttled"
+    if status == 403 or any(marker in text for marker in block_page_markers):
+        return "blocked"
+    if status is not None and status >= 400:
+        return "server_error"
+    if any(marker in text for marker in final_page_markers):
+        return "final"
+    if timed_out or (status is None and not text):
+        return "timeout"
+    return "missing"
+
+
+class RetryPolicy:
+    """
+    When to fetch a failed page again, and after how long: exponential
+    backoff with full jitter, i.e. a random delay between 0 and
+    base * 2 ** (attempt - 1) seconds, capped. Block pages wait
+    blocked_factor times longer.
+    """
+
+    def __init__(self, attempts=4, base=1.0, cap=30.0, blocked_factor=4.0, retry_on=RETRYABLE, seed=None):
+        """
+        Args:
+            attempts (int): Tries per page, the first one included.
+            base (float): Upper bound of the first delay in seconds.
+            cap (float): Upper bound of any delay in seconds.
+            blocked_factor (float): Multiplier of the delay after a block page.
+            retry_on (tuple): The outcomes (see classify) that are retried.
+            seed (int): Seed of the jitter, for reproducible runs.
+        Returns:
+            None
+        """
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.blocked_factor = blocked_factor
+        self.retry_on = retry_on
+        self._random = random.Random(seed)
+
+    def should_retry(self, outcome, attempt):
+        return outcome in self.retry_on and attempt < self.attempts
+
+    def delay(self, attempt, outcome=None):
+        """
+        Args:
+            attempt (int): The attempt that just failed, from 1.
+            outcome (str): How it failed.
+        Returns:
+            float: Seconds to wait before the next attempt.
+        """
+        ceiling = self.base * 2 ** (attempt - 1)
+        if outcome == "blocked":
+            ceiling *= self.blocked_factor
+        return self._random.uniform(0, min(self.cap, ceiling))
+
+
+class AimdController:
+    """
+    Limit on the fetches in flight, adjusted additive-increase /
+    multiplicative-decrease as TCP congestion control does.
+
+    Every fetch reports its latency and outcome. The limit starts at
+    minimum and doubles every round trip until the first sign of
+    congestion (slow start), then grows by `increase` per round trip while
+    fetches succeed quickly. A timeout, an HTTP error, a block page, or
+    latency (averaged exponentially) above latency_factor times the fastest
+    recent response cuts it
+    to `decrease` times its value, at most once per round trip so that one
+    burst of failures counts once. A block page also holds back every new
+    fetch for cooldown seconds.
+
+    The state is guarded by a threading lock and waiting happens on an
+    asyncio.Condition per event loop, so one controller can be shared by
+    several event loops like the HostRateLimiter.
+    """
+
+    def __init__(self, maximum=8, minimum=1, increase=1.0, decrease=0.5, latency_factor=3.0, cooldown=10.0,
+                 window=100):
+        """
+        Args:
+            maximum (int): Upper bound of the limit, e.g. the fetcher's own concurrency.
+            minimum (int): Lower bound of the limit, and where it starts.
+            increase (float): Slots added per round trip without congestion.
+            decrease (float): Factor applied to the limit on congestion.
+            latency_factor (float): Average latency above this times the fastest of
+                the last `window` responses counts as congestion.
+            cooldown (float): Seconds without new fetches after a block page.
+            window (int): Number of recent latencies kept.
+        Returns:
+            None
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.limit = float(minimum)
+        self.in_flight = 0
+        self.slow_start = True
+        self.smoothed_latency = None
+        self._latencies = deque(maxlen=window)
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._conditions = weakref.WeakKeyDictionary()
+
+    def _condition(self):
+        # asyncio primitives are bound to the loop that first uses them
+        loop = asyncio.get_running_loop()
+        if loop not in self._conditions:
+            self._conditions[loop] = asyncio.Condition()
+        return self._conditions[loop]
+
+    def _try_acquire(self):
+        # Returns 0 once a slot is taken, else the seconds to wait at most before trying again
+        with self._lock:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                return pause
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return 0
+            return 0.1  # a slot freed by another event loop does not notify this one
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one of the limit's slots for an async with block.
+        """
+        condition = self._condition()
+        async with condition:
+            while True:
+                wait = self._try_acquire()
+                if not wait:
+                    break
+                try:
+                    await asyncio.wait_for(condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            async with condition:
+                condition.notify_all()
+
+    def observe(self, latency, outcome):
+        """
+        Adjust the limit after a fetch.
+
+        Args:
+            latency (float): Seconds the fetch took.
+            outcome (str): Its outcome, see classify.
+        Returns:
+            None
+        """
+        now = time.monotonic()
+        with self._lock:
+            congested = outcome in CONGESTION
+            if outcome == "ok":
+                # Only complete pages: a "missing" one in Chrome took the whole wait timeout
+                self._latencies.append(latency)
+                self.smoothed_latency = (latency if self.smoothed_latency is None
+                                         else 0.8 * self.smoothed_latency + 0.2 * latency)
+                congested = (len(self._latencies) >= 5
+                             and self.smoothed_latency > self.latency_factor * min(self._latencies))
+            round_trip = statistics.median(self._latencies) if self._latencies else 0.0
+            if congested:
+                if now - self._last_decrease > round_trip:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+                    self.slow_start = False
+                if outcome == "blocked":
+                    self._paused_until = max(self._paused_until, now + self.cooldown)
+            elif outcome in ("ok", "final", "not_found"):
+                # +1 per success doubles the limit per round trip, +increase/limit adds increase
+                step = 1.0 if self.slow_start else self.increase / self.limit
+                self.limit = min(self.maximum, self.limit + step)
+            REGISTRY.set_gauge("scraper_concurrency_limit", self.limit)
+
+
+class AdaptiveFetcher:
+    """
+    Wraps a fetcher with retries and an AIMD limit on the fetches in flight.
+
+    Each attempt is classified (see classify); timeouts, HTTP errors, block
+    pages and WebDriver errors are tried again after a RetryPolicy delay, and
+    every attempt is reported to the AimdController. Once the attempts run
+    out the last result is returned (or the last WebDriver error raised), as
+    the wrapped fetcher would have.
+    """
+
+    def __init__(self, fetcher, controller=None, retry_policy=None, final_page_markers=(),
+                 block_page_markers=BLOCK_PAGE_MARKERS, retry_wait_timeouts=()):
+        """
+        Args:
+            fetcher (HttpFetcher or SeleniumFetcher): The fetcher to wrap.
+            controller (AimdController): The concurrency limit (default: up to 8).
+            retry_policy (RetryPolicy): The retries (default: RetryPolicy()).
+            final_page_markers (tuple): See classify.
+            block_page_markers (tuple): See classify.
+            retry_wait_timeouts (tuple): The wait_for_class values of pages that
+                always have that element unless they are final, so a browser
+                wait that ran out on them is a "timeout" worth retrying. On other
+                pages (e.g. a listing without a map) it is "missing", as at once.
+        Returns:
+            None
+        """
+        self.fetcher = fetcher
+        self.controller = controller if controller is not None else AimdController()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.final_page_markers = final_page_markers
+        self.block_page_markers = block_page_markers
+        self.retry_wait_timeouts = retry_wait_timeouts
+
+    @property
+    def backend(self):
+        return self.fetcher.backend
+
+    async def afetch(self, url, wait_for_class):
+        """
+        Fetch a page, retrying failures.
+
+        Args:
+            url (str): The URL to load.
+            wait_for_class (str): The class name that marks a usable page.
+        Returns:
+            FetchResult: The page from the last attempt.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            result = error = None
+            async with self.controller.slot():
+                started = time.monotonic()
+                try:
+                    result = await self.fetcher.afetch(url, wait_for_class)
+                    timed_out = result.timed_out and wait_for_class in self.retry_wait_timeouts
+                    outcome = classify(result.status, result.text, result.ok, self.final_page_markers,
+                                       self.block_page_markers, timed_out)
+                except WebDriverException as e:
+                    outcome = "timeout" if isinstance(e, TimeoutException) else "error"
+                    error = e
+                latency = time.monotonic() - started
+            self.controller.observe(latency, outcome)
+            count("scraper_fetches_total", outcome=outcome)
+            if not self.retry_policy.should_retry(outcome, attempt):
+                if error is not None:
+                    raise error
+                return result
+            delay = self.retry_policy.delay(attempt, outcome)
+            count("scraper_retries_total", reason=outcome)
+            print(f"{outcome} on {url} (attempt {attempt}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def afetch_many(self, urls, wait_for_class):
+        """
+        Fetch several URLs concurrently, up to the controller's limit, keeping the input order.
+        """
+        return await asyncio.gather(*(self.afetch(url, wait_for_class) for url in urls))
+
+    def fetch(self, url, wait_for_class):
+        """
+        Blocking version of afetch.
+        """
+        return asyncio.run(self.afetch(url, wait_for_class))
+
+    def fetch_many(self, urls, wait_for_class):
+        """
+        Blocking version of afetch_many.
+        """
+        return asyncio.run(self.afetch_many(urls, wait_for_class))
+
+    def close(self):
+        """
+        Close the wrapped fetcher.
+        """
+        self.fetcher.close()
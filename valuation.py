@@ -0,0 +1,322 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from fetch_parse import MERGED_FILE
+from geo import CENTER_LAT, CENTER_LON, EARTH_RADIUS_KM, coordinates_of
+from locations import UNKNOWN_ID, district_table, split_location
+from merge_cache import file_sha256
+
+# Bump when the features change, so cached matrices are rebuilt
+FEATURE_VERSION = "1"
+FEATURES_FILE = "features.npz"
+
+# The columns of the feature matrix, and how much of each counts as much as
+# one km between two listings when looking for comparables: one bedroom, two
+# toilets, ~16% of area or a district 1.6 times as dense weigh like a km
+FEATURES = ["North km", "East km", "Log area", "Bedrooms", "Toilets", "Log density"]
+FEATURE_SCALES = {
+    "North km": 1.0,
+    "East km": 1.0,
+    "Log area": 0.15,
+    "Bedrooms": 1.0,
+    "Toilets": 2.0,
+    "Log density": 0.5,
+}
+
+_KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+
+
+def cpi_levels(path):
+    """
+    The price level of every month, from the month-on-month CPI table
+    (consumer_price_index.csv: the previous month is 100).
+
+    Args:
+        path (str): The CPI CSV.
+    Returns:
+        tuple: (month numbers, year * 12 + month - 1, in order; float64 price
+            levels, 1.0 in the first month).
+    """
+    table = pd.read_csv(path, encoding="utf-8-sig")
+    months = table.melt(id_vars="Year", var_name="Month", value_name="CPI").dropna(subset=["CPI"])
+    month_numbers = months["Year"] * 12 + pd.to_datetime(months["Month"], format="%B").dt.month - 1
+    months = months.assign(Number=month_numbers).sort_values("Number")
+    return months["Number"].to_numpy(), np.cumprod(months["CPI"].to_numpy(dtype=float) / 100)
+
+
+def price_levels(date_posted, months, levels):
+    """
+    The CPI price level of the month each listing was posted in; months after
+    the last one in the table (and unknown dates) get the last level.
+
+    Args:
+        date_posted (pd.Series): "Date Posted" strings, e.g. "17/02/2025".
+        months, levels: From cpi_levels.
+    Returns:
+        np.ndarray: float64 price levels.
+    """
+    dates = pd.to_datetime(date_posted, format="%d/%m/%Y", errors="coerce")
+    numbers = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=float)
+    numbers = np.where(np.isnan(numbers), np.inf, numbers)
+    return levels[np.clip(np.searchsorted(months, numbers, side="right") - 1, 0, len(levels) - 1)]
+
+
+def listing_features(df, densities):
+    """
+    The raw (unscaled) features of listings.
+
+    Args:
+        df (pd.DataFrame): Listings with coordinates, "Area" and, when known,
+            "Bedrooms", "Toilets" and "Location".
+        densities (np.ndarray): Population density per district ID.
+    Returns:
+        np.ndarray: (len(df), len(FEATURES)) float32, NaN where a value is missing.
+    """
+    lat, lon = (s.to_numpy(dtype=float) for s in coordinates_of(df))
+
+    def column(name):
+        if name not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+
+    area = column("Area")
+    density = np.full(len(df), np.nan)
+    if "Location" in df.columns:
+        districts = split_location(df["Location"])[1]
+        known = districts != UNKNOWN_ID
+        density[known] = densities[districts[known]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        features = np.column_stack([
+            (lat - CENTER_LAT) * _KM_PER_DEGREE,
+            (lon - CENTER_LON) * _KM_PER_DEGREE * np.cos(np.radians(CENTER_LAT)),
+            np.log(np.where(area > 0, area, np.nan)),
+            column("Bedrooms"),
+            column("Toilets"),
+            np.log(density),
+        ])
+    return features.astype(np.float32)
+
+
+def _price_per_m2(df):
+    # "Price per m²" (tr/m²) where it was listed, else Price (tỷ) over Area
+    price_per_m2 = pd.to_numeric(df["Price per m²"], errors="coerce").to_numpy(dtype=float)
+    price = pd.to_numeric(df["Price"], errors="coerce").to_numpy(dtype=float)
+    area = pd.to_numeric(df["Area"], errors="coerce").to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        derived = np.where((price > 0) & (area > 0), price * 1000 / area, np.nan)
+    return np.where(price_per_m2 > 0, price_per_m2, derived)
+
+
+def _reference_paths(data_dir):
+    return os.path.join(data_dir, "population_by_district.csv"), os.path.join(data_dir, "consumer_price_index.csv")
+
+
+def dataset_key(merged_path=MERGED_FILE, data_dir="data"):
+    """
+    Returns:
+        str: A hash of the merged listings, the reference tables and
+            FEATURE_VERSION: the feature matrix built from them is valid as
+            long as it is unchanged.
+    """
+    digest = hashlib.sha256(FEATURE_VERSION.encode("utf-8"))
+    for path in (merged_path, *_reference_paths(data_dir)):
+        digest.update(file_sha256(path).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_features(merged_path=MERGED_FILE, data_dir="data"):
+    """
+    The feature matrix of the listings that can serve as comparables: those
+    with coordinates, an area and a price per m².
+
+    Args:
+        merged_path (str): The merged listings.
+        data_dir (str): Directory of population_by_district.csv and consumer_price_index.csv.
+    Returns:
+        dict: "features" (float32, see FEATURES), "price_per_m2" (float32,
+            in tr/m² at the price level of the last CPI month), "ids",
+            "medians" (of each feature, to fill in missing values),
+            "densities" (per district ID), "cpi_months" and "cpi_levels".
+    """
+    df = pd.read_csv(merged_path)
+    densities = district_table(data_dir)["Population density (people/km2)"].to_numpy(dtype=float)
+    months, levels = cpi_levels(_reference_paths(data_dir)[1])
+    features = listing_features(df, densities)
+    price_per_m2 = _price_per_m2(df) * levels[-1] / price_levels(df["Date Posted"], months, levels)
+    usable = np.isfinite(features[:, :3]).all(axis=1) & np.isfinite(price_per_m2)
+    features = features[usable]
+    return {
+        "features": features,
+        "price_per_m2": price_per_m2[usable].astype(np.float32),
+        "ids": df["Id"].to_numpy()[usable],
+        "medians": np.nanmedian(features, axis=0).astype(np.float32),
+        "densities": densities,
+        "cpi_months": months,
+        "cpi_levels": levels,
+    }
+
+
+def load_features(merged_path=MERGED_FILE, data_dir="data", cache_dir=None):
+    """
+    build_features, cached on disk.
+
+    The arrays are saved in cache_dir with the dataset_key they were built
+    from, and rebuilt when the merged listings or the reference tables
+    change.
+
+    Args:
+        merged_path (str): The merged listings.
+        data_dir (str): Directory of the reference tables.
+        cache_dir (str): Where the matrix is cached (default: a "valuation"
+            directory next to merged_path); "" disables the cache.
+    Returns:
+        dict: As build_features returns.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(merged_path), "valuation")
+    if not cache_dir:
+        return build_features(merged_path, data_dir)
+    key = dataset_key(merged_path, data_dir)
+    path = os.path.join(cache_dir, FEATURES_FILE)
+    if os.path.exists(path):
+        with np.load(path, allow_pickle=False) as cached:
+            if str(cached["key"]) == key:
+                return {name: cached[name] for name in cached.files if name != "key"}
+    arrays = build_features(merged_path, data_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, key=key, **arrays)
+    os.replace(tmp_path, path)
+    return arrays
+
+
+def _row_percentiles(values, percentiles):
+    # np.nanpercentile along rows, in array operations: np.nanpercentile itself
+    # loops over the rows in Python when any value is NaN
+    values = np.sort(values, axis=1)  # NaN last
+    counts = np.isfinite(values).sum(axis=1)
+    results = []
+    for percentile in percentiles:
+        rank = (counts - 1).clip(min=0) * percentile / 100
+        below = np.floor(rank).astype(np.intp)
+        above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+        low = np.take_along_axis(values, below[:, None], axis=1)[:, 0]
+        high = np.take_along_axis(values, above[:, None], axis=1)[:, 0]
+        results.append(np.where(counts > 0, low + (high - low) * (rank - below), np.nan))
+    return results
+
+
+class Valuer:
+    """
+    Estimates the price per m² of apartments from their k nearest comparable
+    listings.
+
+    Listings are points in the space of FEATURES divided by FEATURE_SCALES,
+    so that the nearest ones are close by and alike in area, rooms and
+    district density. The comparables' prices per m² are brought to the
+    price level of each apartment's month with the CPI, and their median is
+    the estimate, between the 25th and 75th percentiles. A batch of
+    apartments is valued with one k-d tree query and array operations, no
+    Python loop per apartment.
+    """
+
+    def __init__(self, merged_path=MERGED_FILE, data_dir="data", cache_dir=None, scales=None):
+        """
+        Args:
+            merged_path (str): The merged listings the comparables come from, of Hanoi
+                (locations.DISTRICTS_CITY): the district densities are those of its districts.
+            data_dir (str): Directory of the reference tables.
+            cache_dir (str): Where the feature matrix is cached, see load_features.
+            scales (dict): Overrides of FEATURE_SCALES.
+        Returns:
+            None
+        """
+        arrays = load_features(merged_path, data_dir, cache_dir)
+        self.features = arrays["features"]
+        self.price_per_m2 = arrays["price_per_m2"]
+        self.ids = arrays["ids"]
+        self.medians = arrays["medians"]
+        self.densities = arrays["densities"]
+        self.cpi_months = arrays["cpi_months"]
+        self.cpi_levels = arrays["cpi_levels"]
+        scales = {**FEATURE_SCALES, **(scales or {})}
+        self.scales = np.array([scales[name] for name in FEATURES], dtype=np.float32)
+        self.tree = cKDTree(self._scaled(self.features))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _scaled(self, features):
+        # Missing rooms, area or density count as the median listing's
+        features = np.where(np.isnan(features), self.medians, features)
+        return features / self.scales
+
+    def comparables(self, df, k=10, exclude_self=True):
+        """
+        The k listings most like each apartment.
+
+        Args:
+            df (pd.DataFrame): The apartments, see listing_features.
+            k (int): Number of comparables.
+            exclude_self (bool): Leave out a listing with the apartment's "Id".
+        Returns:
+            tuple: (positions, distances), each (len(df), k): positions in the
+                comparables (-1 where there are not enough, or the apartment
+                has no coordinates), and distances in the scaled space.
+        """
+        features = listing_features(df, self.densities)
+        located = np.isfinite(features[:, :2]).all(axis=1)
+        extra = 1 if exclude_self and "Id" in df.columns else 0
+        positions = np.full((len(df), k + extra), -1, dtype=np.intp)
+        distances = np.full((len(df), k + extra), np.inf)
+        if located.any():
+            found_distances, found = self.tree.query(self._scaled(features[located]), k=k + extra)
+            found = found.reshape(-1, k + extra)
+            positions[located] = np.where(found < len(self), found, -1)
+            distances[located] = found_distances.reshape(-1, k + extra)
+        if extra:
+            # Push the apartment itself, if it is a comparable, behind the others
+            is_self = (positions >= 0) & (self.ids[positions] == df["Id"].to_numpy()[:, None])
+            order = np.argsort(is_self, axis=1, kind="stable")[:, :k]
+            positions = np.take_along_axis(positions, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+        return positions, distances
+
+    def estimate(self, df, k=10, exclude_self=True):
+        """
+        Estimate the price per m² and price of a batch of apartments.
+
+        Args:
+            df (pd.DataFrame): The apartments: coordinates and "Area" at
+                least; "Bedrooms", "Toilets", "Location" and "Date Posted"
+                when known (a missing date prices at the latest CPI month).
+            k (int): Number of comparables.
+            exclude_self (bool): Do not use an apartment as its own comparable
+                (when df has an "Id" column).
+        Returns:
+            pd.DataFrame: "Estimated price per m²" with its "Low" and "High"
+                (25th and 75th percentiles of the comparables) in tr/m²,
+                "Estimated price" in tỷ, and the "Comparables" used; NaN
+                where the apartment has no coordinates.
+        """
+        positions, distances = self.comparables(df, k, exclude_self)
+        found = positions >= 0
+        if "Date Posted" in df.columns:
+            level = price_levels(df["Date Posted"], self.cpi_months, self.cpi_levels) / self.cpi_levels[-1]
+        else:
+            level = np.ones(len(df))
+        prices = np.where(found, self.price_per_m2[np.maximum(positions, 0)], np.nan) * level[:, None]
+        low, median, high = _row_percentiles(prices, [25, 50, 75])
+        area = pd.to_numeric(df["Area"], errors="coerce").to_numpy(dtype=float) if "Area" in df.columns else np.nan
+        return pd.DataFrame({
+            "Estimated price per m²": median,
+            "Low": low,
+            "High": high,
+            "Estimated price": median * area / 1000,
+            "Comparables": found.sum(axis=1),
+        }, index=df.index)